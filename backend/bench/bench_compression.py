@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+
+"""
+Compares CPU time and response sizes for compressed responses, using gzip at the
+previously-fixed level 5, and gzip and zstd at levels chosen by chrona.compressResponse
+(zstd requires Python's compression.zstd module)
+"""
+
+# Resolve imports of modules in the parent directory
+import os
+import sys
+parentDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(parentDir)
+
+import argparse
+import gzip
+import time
+from typing import Callable
+
+import chrona
+
+QUERY_STRS = [
+	'type=sugg&input=bat&limit=5',
+	'type=info&event=Battle%20of%20Hastings',
+	'type=events&range=1900.2000&scale=10&limit=20',
+	'type=events&range=1900.2000&scale=1&limit=200',
+	'type=events&range=-10000.2000&scale=1&limit=2000',
+	'type=events&range=-10000.2000&scale=1&limit=2000&fmt=cols',
+]
+NUM_ITERS = 50
+
+def measure(data: bytes, compress: Callable[[bytes], bytes], numIters: int) -> tuple[int, float]:
+	""" Returns the compressed size, and mean CPU time (in ms) to compress """
+	startTime = time.process_time()
+	for _ in range(numIters):
+		compressed = compress(data)
+	return len(compressed), (time.process_time() - startTime) / numIters * 1000
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--db', default=chrona.DB_FILE, help='The history database to query')
+	parser.add_argument('--iters', type=int, default=NUM_ITERS, help='The number of times to compress each response')
+	args = parser.parse_args()
+
+	codecs: dict[str, Callable[[bytes], bytes]] = {
+		'gzip-5': lambda data: gzip.compress(data, compresslevel=5),
+		'gzip': lambda data: chrona.compressResponse(data, 'gzip'),
+	}
+	if chrona.zstd is not None:
+		codecs['zstd'] = lambda data: chrona.compressResponse(data, 'zstd')
+	else:
+		print('Note: compression.zstd is unavailable, so zstd is skipped')
+
+	print('Bytes on the wire, and CPU ms per request without response caching')
+	print(f'{"bytes":>8}  ' + '  '.join(f'{name:>8} {"ms":>6}' for name in codecs) + '  query')
+	for queryStr in QUERY_STRS:
+		data = chrona.encodeResponse(chrona.handleReq(args.db, {'QUERY_STRING': queryStr})).encode()
+		results = [measure(data, compress, args.iters) for compress in codecs.values()]
+		print(f'{len(data):>8}  ' + '  '.join(f'{size:>8} {ms:>6.3f}' for size, ms in results) + f'  {queryStr}')
@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+
+"""
+Compares the throughput of ways of converting images for hist_data/gen_imgs.py.
+
+Converts a set of images using the in-process cropper, with one process, and with
+a pool of processes. With --smartcrop, also uses the previous approach of running
+'npx smartcrop-cli' for each image (which requires the smartcrop-cli package).
+Uses a directory of generated images, unless one is given (eg: hist_data/enwiki/imgs).
+"""
+
+# Resolve imports of modules in the parent directory
+import os
+import sys
+parentDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(parentDir)
+
+import argparse
+import random
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from hist_data.gen_imgs import convertImage, IMG_OUT_SZ
+
+NUM_IMGS = 100
+IMG_SIZES = [(1200, 900), (800, 1000), (2000, 1300), (640, 480)] # Sizes of generated images
+NUM_PROJECTED_IMGS = 60_000 # Number of images to project conversion times for
+
+def genImgs(imgDir: str, numImgs: int) -> None:
+	""" Writes JPEGs with random shapes, blurred to resemble photos """
+	for imgNum in range(numImgs):
+		width, height = random.choice(IMG_SIZES)
+		img = Image.new('RGB', (width, height), tuple(random.randrange(256) for _ in range(3)))
+		draw = ImageDraw.Draw(img)
+		for _ in range(30):
+			x, y = random.randrange(width), random.randrange(height)
+			radius = random.randint(10, width // 4)
+			draw.ellipse((x - radius, y - radius, x + radius, y + radius),
+				fill=tuple(random.randrange(256) for _ in range(3)))
+		img.filter(ImageFilter.GaussianBlur(2)).save(os.path.join(imgDir, f'{imgNum}.jpg'), quality=90)
+
+def convertWithSmartcrop(imgPath: str, outPath: str) -> bool:
+	""" Converts an image like gen_imgs.py did before using an in-process cropper """
+	completedProcess = subprocess.run(
+		['npx', 'smartcrop-cli', '--width', str(IMG_OUT_SZ), '--height', str(IMG_OUT_SZ), imgPath, outPath],
+		stdout=subprocess.DEVNULL)
+	return completedProcess.returncode == 0
+
+def runConversions(imgPaths: list[str], outDir: str, numWorkers: int, useSmartcrop: bool) -> float:
+	""" Converts images into an empty directory, and returns the time taken """
+	for filename in os.listdir(outDir):
+		os.remove(os.path.join(outDir, filename))
+	convert = convertWithSmartcrop if useSmartcrop else convertImage
+	outPaths = [os.path.join(outDir, f'{imgNum}.jpg') for imgNum in range(len(imgPaths))]
+	startTime = time.perf_counter()
+	if numWorkers == 1:
+		results = [convert(imgPath, outPath) for imgPath, outPath in zip(imgPaths, outPaths)]
+	else:
+		with ProcessPoolExecutor(numWorkers) as executor:
+			results = list(executor.map(convert, imgPaths, outPaths, chunksize=4))
+	duration = time.perf_counter() - startTime
+	if not all(results):
+		print(f'ERROR: {results.count(False)} conversions failed')
+	return duration
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--img-dir', help='A directory of images to convert')
+	parser.add_argument('--imgs', type=int, default=NUM_IMGS, help='The number of images to convert')
+	parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='The number of processes in the pool')
+	parser.add_argument('--smartcrop', action='store_true', help='Also time conversion using smartcrop-cli')
+	args = parser.parse_args()
+
+	random.seed(0)
+	with tempfile.TemporaryDirectory() as tempDir:
+		imgDir = args.img_dir
+		if imgDir is None:
+			imgDir = os.path.join(tempDir, 'in')
+			os.mkdir(imgDir)
+			genImgs(imgDir, args.imgs)
+		imgPaths = [os.path.join(imgDir, filename) for filename in sorted(os.listdir(imgDir))[:args.imgs]]
+		outDir = os.path.join(tempDir, 'out')
+		os.mkdir(outDir)
+
+		# Suppress per-image output from conversions
+		stdout = sys.stdout
+		sys.stdout = open(os.devnull, 'w')
+		configs = [('in-process', 1, False), (f'in-process, {args.workers} procs', args.workers, False)]
+		if args.smartcrop:
+			configs.insert(0, ('smartcrop-cli', 1, True))
+		results = []
+		for name, numWorkers, useSmartcrop in configs:
+			results.append((name, runConversions(imgPaths, outDir, numWorkers, useSmartcrop)))
+		sys.stdout = stdout
+
+		print(f'Converted {len(imgPaths)} images')
+		print(f'{"method":24} {"imgs/s":>8} {"hours for " + str(NUM_PROJECTED_IMGS):>16}')
+		for name, duration in results:
+			imgsPerSec = len(imgPaths) / duration
+			print(f'{name:24} {imgsPerSec:>8.2f} {NUM_PROJECTED_IMGS / imgsPerSec / 3600:>16.2f}')
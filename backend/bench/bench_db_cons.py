@@ -0,0 +1,44 @@
+#!/usr/bin/python3
+
+"""
+Measures the request rate of chrona.handleReq, with and without
+reuse of db connections across requests
+"""
+
+# Resolve imports of modules in the parent directory
+import os
+import sys
+parentDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(parentDir)
+
+import argparse
+import time
+
+import chrona
+
+QUERY_STRS = [
+	'type=events&range=1900.2000&scale=10&limit=100',
+	'type=events&range=1990-01-01.2000-01-01&scale=1&limit=20&imgonly=true',
+	'type=events&range=-10000.&scale=1000&limit=100&ctgs=event.person',
+	'type=sugg&input=bat&limit=5',
+]
+NUM_ITERS = 1000
+
+def benchmark(dbFile: str, numIters: int, reuseDbCons: bool) -> float:
+	""" Runs handleReq in a loop, and returns the number of requests per second """
+	chrona.REUSE_DB_CONS = reuseDbCons
+	environs = [{'QUERY_STRING': q} for q in QUERY_STRS]
+	startTime = time.perf_counter()
+	for i in range(numIters):
+		chrona.handleReq(dbFile, environs[i % len(environs)])
+	return numIters / (time.perf_counter() - startTime)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--db', default=chrona.DB_FILE, help='The history database to query')
+	parser.add_argument('--iters', type=int, default=NUM_ITERS, help='The number of requests to make')
+	args = parser.parse_args()
+
+	for reuseDbCons in [False, True]:
+		reqRate = benchmark(args.db, args.iters, reuseDbCons)
+		print(f'With connection reuse {"enabled" if reuseDbCons else "disabled"}: {reqRate:.1f} requests/sec')
@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+
+"""
+Measures cold and warm request latencies of chrona.handleReq under each db profile in chrona.DB_PROFILES
+
+For cold latencies, each request uses a new db connection, after asking the
+OS to drop the db file from its page cache (where supported).
+For warm latencies, connections are reused, after a round of warm-up requests.
+"""
+
+# Resolve imports of modules in the parent directory
+import os
+import sys
+parentDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(parentDir)
+
+import argparse
+import random
+import sqlite3
+import statistics
+import time
+
+import chrona
+
+NUM_REQS = 200 # Number of requests of each type
+
+def genQueryStrs(dbFile: str, numReqs: int) -> dict[str, list[str]]:
+	""" Generates query strings for each request type, using events in a db """
+	random.seed(0)
+	dbCon = sqlite3.connect(dbFile)
+	titles = [title for (title,) in dbCon.execute(f'SELECT title FROM events ORDER BY random() LIMIT {numReqs}')]
+	years = [unit for (unit,) in dbCon.execute(f'SELECT unit FROM dist WHERE scale = 1 ORDER BY random() LIMIT {numReqs}')]
+	dbCon.close()
+	return {
+		'events': [f'type=events&range={year}.{year + random.choice([1, 10, 100])}&scale=1' for year in years],
+		'info': ['type=info&event=' + title for title in titles],
+		'sugg': ['type=sugg&input=' + title[:random.randint(1, 5)] for title in titles],
+	}
+
+def dropFileCache(filename: str) -> None:
+	""" Asks the OS to drop cached pages of a file """
+	if hasattr(os, 'posix_fadvise'):
+		fd = os.open(filename, os.O_RDONLY)
+		os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+		os.close(fd)
+
+def timeReqs(dbFile: str, queryStrs: list[str], cold: bool) -> list[float]:
+	""" Returns request latencies in milliseconds """
+	chrona.REUSE_DB_CONS = not cold
+	times: list[float] = []
+	for queryStr in queryStrs:
+		if cold:
+			dropFileCache(dbFile)
+		startTime = time.perf_counter()
+		chrona.handleReq(dbFile, {'QUERY_STRING': queryStr})
+		times.append((time.perf_counter() - startTime) * 1000)
+	return times
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--db', default=chrona.DB_FILE, help='The history database to query')
+	parser.add_argument('--reqs', type=int, default=NUM_REQS, help='The number of requests of each type')
+	args = parser.parse_args()
+
+	queryStrs = genQueryStrs(args.db, args.reqs)
+	print('Latency in ms (median and 95th percentile)')
+	print(f'{"profile":10} {"type":8} {"cold":>17} {"warm":>17}')
+	for profile in chrona.DB_PROFILES:
+		chrona.DB_PROFILE = profile
+		chrona.dbConPool.close()
+		for reqType, strs in queryStrs.items():
+			results = []
+			for cold in [True, False]:
+				if not cold:
+					timeReqs(args.db, strs, False) # Warm up
+				times = sorted(timeReqs(args.db, strs, cold))
+				results.append(f'{statistics.median(times):7.3f} {times[int(len(times) * 0.95)]:9.3f}')
+			print(f'{profile:10} {reqType:8} {results[0]:>17} {results[1]:>17}')
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+
+"""
+Compares the speed of chrona.encodeResponse() with jsonpickle,
+for an events response holding the max number of events
+"""
+
+# Resolve imports of modules in the parent directory
+import os
+import sys
+parentDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(parentDir)
+
+import argparse
+import random
+import timeit
+
+import jsonpickle
+
+from chrona import MAX_REQ_EVENTS, HistEvent, EventResponse, encodeResponse
+from hist_data.cal import HistDate
+
+NUM_ITERS = 20
+
+def genResponse(numEvents: int) -> EventResponse:
+	""" Generates an events response with random events """
+	events: list[HistEvent] = []
+	for eventId in range(numEvents):
+		year = random.randint(-5000, 2020)
+		events.append(HistEvent(
+			eventId, f'Event {eventId}',
+			HistDate(True, year, random.randint(1, 12), random.randint(1, 28)), None,
+			HistDate(True, year + 10, 1, 1) if random.random() < 0.5 else None, None,
+			'event', eventId if random.random() < 0.5 else None, random.randint(0, 10**6)))
+	unitCounts = {unit: random.randint(1, 100) for unit in range(-5000, -5000 + numEvents)}
+	return EventResponse(events, unitCounts)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--events', type=int, default=MAX_REQ_EVENTS, help='The number of events in the response')
+	parser.add_argument('--iters', type=int, default=NUM_ITERS, help='The number of encodings to time')
+	args = parser.parse_args()
+
+	val = genResponse(args.events)
+	if encodeResponse(val) != jsonpickle.encode(val, unpicklable=False):
+		print('ERROR: Encoder outputs differ')
+		sys.exit(1)
+	for name, encodeFn in [
+			('jsonpickle', lambda: jsonpickle.encode(val, unpicklable=False)),
+			('encodeResponse', lambda: encodeResponse(val))]:
+		secs = timeit.timeit(encodeFn, number=args.iters) / args.iters
+		print(f'{name}: {secs * 1000:.2f} ms per response')
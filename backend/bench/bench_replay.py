@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+
+"""
+Replays traces of client requests, and reports throughput and latency percentiles per request type.
+
+A trace holds sessions, each being a sequence of requests like those made by the client when
+panning and zooming the timeline (type=events over adjacent ranges and scales), typing into
+the search bar (type=sugg per keystroke), and opening event info (type=info).
+Traces are synthesized using events in a db, and can be saved to, and loaded from, a file
+with lines of the form 'sessionNum<tab>queryString' (eg: for replaying requests from a server log).
+
+Requests are replayed by a number of concurrent clients, each handling one session at a time,
+either by calling chrona.application directly, or by sending HTTP requests to a server
+(eg: server.py, with '--url http://localhost:8000/data/').
+"""
+
+# Resolve imports of modules in the parent directory
+import os
+import sys
+parentDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(parentDir)
+
+import argparse
+import http.client
+import queue
+import random
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+import chrona
+from hist_data.cal import SCALES, MONTH_SCALE, DAY_SCALE
+
+NUM_SESSIONS = 200
+ACTIONS_PER_SESSION = 30
+NUM_CLIENTS = 8
+UNITS_PER_VIEW = 20 # Rough number of scale units visible on the timeline
+EVENT_LIMITS = [200, 400, 800] # Values like those computed by the client, which depend on screen size
+SUGG_LIMIT = 10
+
+Trace = list[list[str]] # Holds sessions, each with a list of query strings
+
+def genTrace(dbFile: str, numSessions: int, actionsPerSession: int) -> Trace:
+	""" Synthesizes sessions of requests, starting at, and searching for, events in a db """
+	dbCon = sqlite3.connect(dbFile)
+	years = [unit for (unit,) in dbCon.execute('SELECT unit FROM event_disp WHERE scale = 1 ORDER BY random() LIMIT 1000')]
+	titles = [title for (title,) in dbCon.execute(
+		'SELECT title FROM events WHERE id IN (SELECT id FROM event_disp) ORDER BY random() LIMIT 1000')]
+	dbCon.close()
+
+	trace: Trace = []
+	for _ in range(numSessions):
+		session: list[str] = []
+		center = float(random.choice(years))
+		scaleIdx = random.randint(4, 8)
+		limit = random.choice(EVENT_LIMITS)
+		extraParams = '&imgonly=true' if random.random() < 0.5 else ''
+		session.append(eventsQuery(center, scaleIdx, limit) + extraParams)
+		while len(session) < actionsPerSession:
+			action = random.random()
+			if action < 0.55: # Pan
+				center += random.choice([-1, 1]) * random.uniform(0.1, 0.5) * UNITS_PER_VIEW * unitYears(scaleIdx)
+			elif action < 0.8: # Zoom, with zooming in being more common
+				scaleIdx = min(max(scaleIdx + (1 if random.random() < 0.6 else -1), 0), len(SCALES) - 1)
+			elif action < 0.95: # Search, then view the result
+				title = random.choice(titles)
+				for numChars in range(1, min(len(title), random.randint(3, 10)) + 1):
+					session.append(urllib.parse.urlencode({'type': 'sugg', 'input': title[:numChars],
+						'limit': SUGG_LIMIT}) + extraParams)
+				session.append(urllib.parse.urlencode({'type': 'info', 'event': title}) + extraParams)
+				continue
+			else: # Open info for an event
+				session.append(urllib.parse.urlencode({'type': 'info', 'event': random.choice(titles)}) + extraParams)
+				continue
+			session.append(eventsQuery(center, scaleIdx, limit) + extraParams)
+		trace.append(session[:actionsPerSession])
+	return trace
+
+def unitYears(scaleIdx: int) -> float:
+	scale = SCALES[scaleIdx]
+	return scale if scale >= 1 else (1 / 12 if scale == MONTH_SCALE else 1 / 365)
+
+def eventsQuery(center: float, scaleIdx: int, limit: int) -> str:
+	""" Returns a query string for events around a year, at a scale """
+	scale = SCALES[scaleIdx]
+	halfSpan = UNITS_PER_VIEW / 2 * unitYears(scaleIdx)
+	if scale >= 1:
+		dates = [str(int(center - halfSpan) or 1), str(int(center + halfSpan) or 1)] # Avoids year 0
+	else: # Use dates within the range of gregorian-calendar support
+		dates = []
+		center = max(center, 1 + halfSpan)
+		for year in [center - halfSpan, center + halfSpan]:
+			month, day = divmod(int((year % 1) * 336), 28)
+			dates.append(f'{int(year)}-{month + 1}-{day + 1 if scale == DAY_SCALE else 1}')
+	return f'type=events&range={dates[0]}.{dates[1]}&scale={scale}&limit={limit}'
+
+def saveTrace(trace: Trace, filename: str) -> None:
+	with open(filename, 'w') as file:
+		for sessionNum, session in enumerate(trace):
+			for queryStr in session:
+				file.write(f'{sessionNum}\t{queryStr}\n')
+
+def loadTrace(filename: str) -> Trace:
+	sessions: dict[str, list[str]] = {}
+	with open(filename) as file:
+		for line in file:
+			sessionNum, queryStr = line.rstrip('\n').split('\t', 1)
+			sessions.setdefault(sessionNum, []).append(queryStr)
+	return list(sessions.values())
+
+def replay(trace: Trace, numClients: int, url: str | None) -> tuple[float, dict[str, list[float]], list[str]]:
+	""" Replays sessions using concurrent clients, and returns the time taken, a map from
+		request types to latencies in milliseconds, and descriptions of requests that didn't get a 200 """
+	sessionQueue: queue.Queue[list[str]] = queue.Queue()
+	for session in trace:
+		sessionQueue.put(session)
+	latencies: dict[str, list[float]] = {}
+	failures: list[str] = []
+	lock = threading.Lock()
+
+	def runClient():
+		clientLatencies: list[tuple[str, float]] = []
+		clientFailures: list[str] = []
+		con = None
+		if url is not None:
+			urlParts = urllib.parse.urlsplit(url)
+			con = http.client.HTTPConnection(urlParts.netloc) # Keeps the connection alive between requests
+		while True:
+			try:
+				session = sessionQueue.get_nowait()
+			except queue.Empty:
+				break
+			for queryStr in session:
+				reqType = queryStr.split('type=', 1)[1].split('&', 1)[0] if 'type=' in queryStr else ''
+				startTime = time.perf_counter()
+				if con is None:
+					environ = {'QUERY_STRING': queryStr, 'HTTP_ACCEPT_ENCODING': 'gzip'}
+					statuses: list[str] = []
+					for _ in chrona.application(environ, lambda status, headers: statuses.append(status)):
+						pass
+					status = int(statuses[0].split(' ', 1)[0])
+				else:
+					con.request('GET', urlParts.path + '?' + queryStr, headers={'Accept-Encoding': 'gzip'})
+					response = con.getresponse()
+					response.read()
+					status = response.status
+				clientLatencies.append((reqType, (time.perf_counter() - startTime) * 1000))
+				if status != 200: # Eg: a 404 from a wrong URL path, which would otherwise give misleadingly fast results
+					clientFailures.append(f'{status} for {queryStr}')
+		if con is not None:
+			con.close()
+		with lock:
+			for reqType, ms in clientLatencies:
+				latencies.setdefault(reqType, []).append(ms)
+			failures.extend(clientFailures)
+
+	threads = [threading.Thread(target=runClient) for _ in range(numClients)]
+	startTime = time.perf_counter()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	return time.perf_counter() - startTime, latencies, failures
+
+def percentile(sortedVals: list[float], p: float) -> float:
+	return sortedVals[min(int(len(sortedVals) * p), len(sortedVals) - 1)]
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--db', default=chrona.DB_FILE, help='The history database to query')
+	parser.add_argument('--trace', help='A trace file to replay, instead of synthesizing a trace')
+	parser.add_argument('--save', help='A file to save the synthesized trace to')
+	parser.add_argument('--sessions', type=int, default=NUM_SESSIONS, help='The number of sessions to synthesize')
+	parser.add_argument('--clients', type=int, default=NUM_CLIENTS, help='The number of concurrent clients')
+	parser.add_argument('--url', help='A server URL to send requests to, instead of calling chrona.application')
+	parser.add_argument('--no-cache', action='store_true', help='Disable the response cache (for in-process replay)')
+	args = parser.parse_args()
+
+	random.seed(0)
+	trace = loadTrace(args.trace) if args.trace else genTrace(args.db, args.sessions, ACTIONS_PER_SESSION)
+	if args.save:
+		saveTrace(trace, args.save)
+	chrona.DB_FILE = args.db
+	if args.no_cache:
+		chrona.responseCache = chrona.ResponseCache(0)
+
+	duration, latencies, failures = replay(trace, args.clients, args.url)
+	if failures:
+		print(f'ERROR: {len(failures)} requests got a non-200 response (eg: {failures[0]})')
+		sys.exit(1)
+	numReqs = sum(len(times) for times in latencies.values())
+	print(f'{numReqs} requests from {args.clients} clients in {duration:.2f} s ({numReqs / duration:.1f} requests/sec)')
+	print(f'{"type":8} {"count":>7} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+	for reqType, times in sorted(latencies.items()):
+		times.sort()
+		print(f'{reqType:8} {len(times):>7} {percentile(times, 0.5):>8.2f} {percentile(times, 0.95):>8.2f}'
+			f' {percentile(times, 0.99):>8.2f}')
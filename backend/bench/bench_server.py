@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+
+"""
+Load-tests server.py with different numbers of worker processes and threads.
+
+For each configuration, a server is started, and a trace of data requests (from bench_replay.py)
+is replayed by concurrent clients, while other clients concurrently fetch images.
+Reports throughput, and latencies for data and image requests.
+Uses an image directory holding generated files, unless one is given.
+"""
+
+# Resolve imports of modules in the parent directory
+import os
+import sys
+parentDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(parentDir)
+
+import argparse
+import http.client
+import random
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+import chrona
+from bench_replay import genTrace, replay, percentile, ACTIONS_PER_SESSION
+
+CONFIGS = [(1, 1), (1, 32), (4, 32)] # Pairs of worker process and thread counts
+PORT = 8099
+NUM_SESSIONS = 100
+NUM_CLIENTS = 8
+NUM_IMG_CLIENTS = 4
+IMG_REQS_PER_CLIENT = 300
+NUM_IMGS = 200
+IMG_SZ = 40_000 # Roughly the size of a 200x200 JPEG
+
+def startServer(numWorkers: int, numThreads: int, dbFile: str, imgDir: str) -> subprocess.Popen:
+	""" Starts server.py, and waits until it accepts connections """
+	proc = subprocess.Popen(
+		[sys.executable, 'server.py', '--port', str(PORT), '--workers', str(numWorkers),
+			'--threads', str(numThreads), '--db', dbFile, '--img-dir', imgDir],
+		cwd=parentDir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+	while True:
+		try:
+			socket.create_connection(('localhost', PORT)).close()
+			return proc
+		except ConnectionRefusedError:
+			time.sleep(0.1)
+
+def fetchImgs(imgNames: list[str], numReqs: int, latencies: list[float], failures: list[str]) -> None:
+	""" Fetches random images using a kept-alive connection, recording latencies in milliseconds,
+		and descriptions of requests that didn't get a 200 """
+	con = http.client.HTTPConnection('localhost', PORT)
+	for _ in range(numReqs):
+		startTime = time.perf_counter()
+		imgName = random.choice(imgNames)
+		con.request('GET', '/hist_data/img/' + imgName)
+		response = con.getresponse()
+		response.read()
+		if response.status != 200:
+			failures.append(f'{response.status} for image {imgName}')
+		latencies.append((time.perf_counter() - startTime) * 1000)
+	con.close()
+
+def runLoad(trace: list[list[str]], numClients: int, numImgClients: int, imgNames: list[str]) \
+		-> tuple[float, dict[str, list[float]]]:
+	""" Replays a trace and fetches images concurrently, and returns the time taken,
+		along with a map from request types to latencies """
+	imgLatencies: list[list[float]] = [[] for _ in range(numImgClients)]
+	imgFailures: list[str] = [] # Appended to by multiple threads (list.append() is atomic)
+	imgThreads = [threading.Thread(target=fetchImgs, args=(imgNames, IMG_REQS_PER_CLIENT, latencies, imgFailures))
+		for latencies in imgLatencies]
+	startTime = time.perf_counter()
+	for thread in imgThreads:
+		thread.start()
+	_, latencies, failures = replay(trace, numClients, f'http://localhost:{PORT}/data/')
+	for thread in imgThreads:
+		thread.join()
+	failures += imgFailures
+	if failures:
+		raise RuntimeError(f'{len(failures)} requests got a non-200 response (eg: {failures[0]})')
+	latencies['img'] = [ms for clientLatencies in imgLatencies for ms in clientLatencies]
+	return time.perf_counter() - startTime, latencies
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--db', default=os.path.join(parentDir, chrona.DB_FILE), help='The history database to serve')
+	parser.add_argument('--img-dir', help='A directory of images to serve (its files are fetched)')
+	parser.add_argument('--sessions', type=int, default=NUM_SESSIONS, help='The number of sessions to replay')
+	parser.add_argument('--clients', type=int, default=NUM_CLIENTS, help='The number of clients replaying sessions')
+	parser.add_argument('--img-clients', type=int, default=NUM_IMG_CLIENTS, help='The number of clients fetching images')
+	args = parser.parse_args()
+
+	random.seed(0)
+	trace = genTrace(args.db, args.sessions, ACTIONS_PER_SESSION)
+	with tempfile.TemporaryDirectory() as tempDir:
+		imgDir = args.img_dir
+		if imgDir is None:
+			imgDir = tempDir
+			for imgNum in range(NUM_IMGS):
+				with open(os.path.join(tempDir, f'{imgNum}.jpg'), 'wb') as file:
+					file.write(os.urandom(IMG_SZ))
+		imgNames = os.listdir(imgDir)
+
+		print('Latency in ms (median, 95th percentile, and max)')
+		print(f'{"workers":>7} {"threads":>7} {"req/s":>8} ' \
+			+ ' '.join(f'{reqType:>20}' for reqType in ['events', 'info', 'sugg', 'img']))
+		for numWorkers, numThreads in CONFIGS:
+			proc = startServer(numWorkers, numThreads, os.path.realpath(args.db), os.path.realpath(imgDir))
+			try:
+				duration, latencies = runLoad(trace, args.clients, args.img_clients, imgNames)
+			finally:
+				proc.terminate()
+				proc.wait()
+			numReqs = sum(len(times) for times in latencies.values())
+			results = []
+			for reqType in ['events', 'info', 'sugg', 'img']:
+				times = sorted(latencies.get(reqType, [0]))
+				results.append(f'{percentile(times, 0.5):6.1f} {percentile(times, 0.95):6.1f} {times[-1]:6.0f}')
+			print(f'{numWorkers:>7} {numThreads:>7} {numReqs / duration:>8.1f} ' + ' '.join(results))
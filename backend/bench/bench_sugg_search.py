@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+
+"""
+Measures type=sugg latencies for short search strings, with and without the
+trigram index added by hist_data/gen_search_data.py, using generated event titles
+"""
+
+# Resolve imports of modules in the parent directory
+import os
+import sys
+parentDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(parentDir)
+
+import argparse
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from chrona import lookupSuggs, DEFAULT_REQ_SUGGS
+from hist_data.gen_search_data import genData as genSearchData
+
+NUM_TITLES = 500_000
+NUM_INPUTS = 100 # Number of search strings per input length
+WORDS = [
+	'battle', 'siege', 'treaty', 'river', 'king', 'queen', 'empire', 'church', 'revolution', 'station',
+	'university', 'kingdom', 'castle', 'island', 'war', 'of', 'the', 'saint', 'north', 'new',
+]
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+def genTitle(n: int) -> str:
+	""" Generates a title from common words and a random proper noun """
+	name = ''.join(random.choice(LETTERS) for _ in range(random.randint(4, 9))).capitalize()
+	return ' '.join(random.choice(WORDS) for _ in range(random.randint(0, 3))) + f' {name} {n}'
+
+def createDb(dbFile: str, numTitles: int) -> None:
+	""" Creates a db with the tables used for type=sugg requests """
+	dbCon = sqlite3.connect(dbFile)
+	dbCur = dbCon.cursor()
+	dbCur.execute('CREATE TABLE events (id INT PRIMARY KEY, title TEXT UNIQUE, ' \
+		'start INT, start_upper INT, end INT, end_upper INT, fmt INT, ctg TEXT)')
+	dbCur.execute('CREATE INDEX events_title_nocase_idx ON events(title COLLATE NOCASE)')
+	dbCur.execute('CREATE TABLE pop (id INT PRIMARY KEY, pop INT)')
+	dbCur.execute('CREATE TABLE event_imgs (id INT PRIMARY KEY, img_id INT)')
+	for eventId in range(1, numTitles + 1):
+		dbCur.execute('INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+			(eventId, genTitle(eventId), 2000, None, None, None, 0, random.choice(['event', 'person', 'place'])))
+		dbCur.execute('INSERT INTO pop VALUES (?, ?)', (eventId, int(random.paretovariate(1))))
+		if random.random() < 0.5:
+			dbCur.execute('INSERT INTO event_imgs VALUES (?, ?)', (eventId, eventId))
+	dbCon.commit()
+	dbCon.close()
+
+def measure(dbFile: str, inputs: list[str]) -> tuple[float, float]:
+	""" Returns the p50 and p99 latencies (in ms) of lookupSuggs() for some search strings """
+	dbCon = sqlite3.connect(dbFile)
+	dbCur = dbCon.cursor()
+	times: list[float] = []
+	for searchStr in inputs:
+		startTime = time.perf_counter()
+		lookupSuggs(searchStr, DEFAULT_REQ_SUGGS, None, False, dbCur)
+		times.append((time.perf_counter() - startTime) * 1000)
+	dbCon.close()
+	times.sort()
+	return times[len(times) // 2], times[min(len(times) - 1, len(times) * 99 // 100)]
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--titles', type=int, default=NUM_TITLES, help='The number of event titles to generate')
+	args = parser.parse_args()
+
+	random.seed(0)
+	with tempfile.TemporaryDirectory() as tempDir:
+		print('Generating db')
+		dbFile = os.path.join(tempDir, 'data.db')
+		createDb(dbFile, args.titles)
+		ftsDbFile = os.path.join(tempDir, 'fts_data.db')
+		shutil.copy(dbFile, ftsDbFile)
+		genSearchData(ftsDbFile)
+
+		# Use search strings taken from the middle of names, which mostly fall through to the substring search
+		names = [title.split(' ')[-2].lower() for (title,) in
+			sqlite3.connect(dbFile).execute('SELECT title FROM events ORDER BY RANDOM() LIMIT 1000')]
+		print('Input length  | No index: p50 ms  p99 ms | Trigram index: p50 ms  p99 ms')
+		for inputLen in range(1, 6):
+			inputs = [name[1:1 + inputLen] for name in random.choices(names, k=NUM_INPUTS)]
+			p50, p99 = measure(dbFile, inputs)
+			ftsP50, ftsP99 = measure(ftsDbFile, inputs)
+			print(f'{inputLen:>12}  | {p50:>16.2f}  {p99:>6.2f} | {ftsP50:>21.2f}  {ftsP99:>6.2f}')
+
+		# Use search strings from common words, whose trigrams match many titles
+		inputs = [word[1:] for word in random.choices([word for word in WORDS if len(word) >= 5], k=NUM_INPUTS)]
+		p50, p99 = measure(dbFile, inputs)
+		ftsP50, ftsP99 = measure(ftsDbFile, inputs)
+		print(f'{"common":>12}  | {p50:>16.2f}  {p99:>6.2f} | {ftsP50:>21.2f}  {ftsP99:>6.2f}')
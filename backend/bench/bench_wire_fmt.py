@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+
+"""
+Compares response sizes and latencies for type=events requests,
+with the default response format and with fmt=cols
+"""
+
+# Resolve imports of modules in the parent directory
+import os
+import sys
+parentDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(parentDir)
+
+import argparse
+import gzip
+import time
+
+import chrona
+
+SCALE_RANGES = [ # Holds scale and date-range params for typical requests
+	('1000', '-10000.2000'),
+	('100', '0.2000'),
+	('10', '1500.2000'),
+	('1', '1900.2000'),
+	('-1', '1990-01-01.2000-01-01'),
+]
+LIMITS = [20, 200, 2000]
+NUM_ITERS = 20
+
+def measure(dbFile: str, queryStr: str, numIters: int) -> tuple[int, int, float]:
+	""" Returns the encoded size, gzipped size, and mean time (in ms) to produce a gzipped response """
+	environ = {'QUERY_STRING': queryStr}
+	startTime = time.perf_counter()
+	for _ in range(numIters):
+		data = chrona.encodeResponse(chrona.handleReq(dbFile, environ)).encode()
+		gzipData = gzip.compress(data, compresslevel=5)
+	ms = (time.perf_counter() - startTime) / numIters * 1000
+	return len(data), len(gzipData), ms
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--db', default=chrona.DB_FILE, help='The history database to query')
+	parser.add_argument('--iters', type=int, default=NUM_ITERS, help='The number of times to run each request')
+	args = parser.parse_args()
+
+	print('scale  limit  | default: bytes  gzipped   ms    | cols: bytes  gzipped   ms')
+	for scale, dateRange in SCALE_RANGES:
+		for limit in LIMITS:
+			queryStr = f'type=events&range={dateRange}&scale={scale}&limit={limit}'
+			size, gzipSize, ms = measure(args.db, queryStr, args.iters)
+			colsSize, colsGzipSize, colsMs = measure(args.db, queryStr + '&fmt=cols', args.iters)
+			print(f'{scale:>5}  {limit:>5}  |   {size:>12}  {gzipSize:>7}  {ms:>6.2f}  |'
+				f' {colsSize:>11}  {colsGzipSize:>7}  {colsMs:>6.2f}')
@@ -6,29 +6,54 @@ Expected HTTP query parameters:
 	If 'events', reply with information on events within a date range, for a given scale.
 	If 'info', reply with information about a given event.
 	If 'sugg', reply with search suggestions for an event search string.
-- range: With type=events, specifies a historical-date range.
+	If 'batch', reply with information on events within multiple date ranges and scales.
+	If 'count', reply with the number of events within a date range.
+	If 'metrics', reply with request metrics for the serving process, in Prometheus' text format.
+- range: With type=events|count, specifies a historical-date range.
 	If absent, the default is 'all of time'.
 	Examples:
 		range=1000.1910-10-09 means '1000 AD up to and excluding 09/10/1910'
 		range=-13000. means '13000 BC onwards'
-- scale: With type=events, specifies a date scale (see SCALES in hist_data/cal.py).
+- scale: With type=events|count, specifies a date scale (see SCALES in hist_data/cal.py).
+	With type=count, the range's start and end are rounded down to units of this scale.
 - incl: With type=events, specifies an event to include, as an event ID.
 - event: With type=info, specifies the title of an event to get info for.
 - input: With type=sugg, specifies a search string to suggest for.
 - limit: With type=events or type=sugg, specifies the max number of results.
-- ctgs: With type=events|info|sugg, specifies event categories to restrict results to.
+- ctgs: With type=events|info|sugg|count, specifies event categories to restrict results to.
 	Interpreted as a period-separated list of category names (eg: person.place).
 	An empty string is ignored.
-- imgonly: With type=events|info|sugg, if present, restricts results to events with images.
+- imgonly: With type=events|info|sugg|count, if present, restricts results to events with images.
+- fmt: With type=events, if 'cols', reply with event data as parallel lists (see EventColsResponse).
+	If 'ndjson', reply with newline-delimited JSON, sent as events are read (see streamEventsResp()).
+- windows: With type=batch, specifies an underscore-separated list of requests to handle together.
+	Each has the form 'range,scale,incl,limit', with values as for type=events, and the last three being optional.
+	Example: windows=1900.2000,10_1990.2000,1,,50
 """
 
-from typing import Iterable, cast
+from typing import Any, Callable, Generator, Iterable, Iterator, TypeVar, cast
+import os
 import sys
 import re
+import string
 import urllib.parse
 import sqlite3
 import gzip
-import jsonpickle
+import zlib
+import threading
+import atexit
+import json
+import bisect
+import heapq
+import itertools
+import hashlib
+import time
+from array import array
+from collections import OrderedDict
+try:
+	from compression import zstd # Added in Python 3.14
+except ImportError:
+	zstd = None
 
 from hist_data.cal import HistDate, dbDateToHistDate, dateToUnit
 
@@ -37,10 +62,48 @@ MAX_REQ_EVENTS = 2000
 MAX_REQ_UNIT_COUNTS = MAX_REQ_EVENTS
 DEFAULT_REQ_EVENTS = 20
 MAX_REQ_SUGGS = 50
+MAX_REQ_WINDOWS = 20
 DEFAULT_REQ_SUGGS = 5
+REUSE_DB_CONS = True # If True, db connections are kept open and reused across requests
+DB_POOL_SIZE = 15 # Max number of idle db connections kept open (mod_wsgi's default threads-per-process is 15)
+DB_STMT_CACHE_SZ = 128 # Max number of prepared statements cached per db connection
+USE_EVENT_INDEX = False # If True, type=events requests are answered using an in-memory index
+USE_SUGG_INDEX = False # If True, type=sugg prefix searches use an in-memory index
+	# Indexes are loaded once per process, by the first request that uses them, or earlier by loadIndexes()
+SUGG_INDEX_PREFIX_LEN = 3 # Max length of search strings for which the suggestion index holds precomputed results
+RESP_CACHE_SZ = 1000 # Max number of encoded responses cached per process (0 disables caching)
+RESP_CACHE_BYTES = 64 * 2**20 # Max total bytes of encoded and compressed responses cached per process
+	# (a limit=2000 events response is about 500 KB, and a batch response can hold many of those)
+COMPRESS_MIN_SZ = 100 # Responses with fewer bytes than this are sent uncompressed
+COMPRESS_LEVELS: list[tuple[int, int, int]] = [
+	# Holds max response sizes, with gzip and zstd levels to use for them.
+	# Smaller responses compress quickly even at high levels, so spending more time on them is cheap.
+	(8_000, 9, 12),
+	(128_000, 6, 6),
+	(sys.maxsize, 4, 3),
+]
+REQ_TIMING = False # If True, responses get a Server-Timing header giving the time spent in each phase of handling them
+SLOW_REQ_MS = 500 # With REQ_TIMING, requests taking at least this many milliseconds are logged to SLOW_REQ_LOG
+SLOW_REQ_LOG: str | None = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'slow_reqs.log')
+	# Not relative to the working directory, which for a WSGI server may be unwritable
+NDJSON_CHUNK_EVENTS = 50 # Number of events sent per chunk of a streamed response
+DB_PROFILES: dict[str, tuple[str, dict[str, int | str]]] = {
+	# Maps names to URI parameters and PRAGMA settings used when opening db connections.
+	# 'immutable' skips file locking and change detection, so the db file should only
+	# be updated by replacing it (not by modifying it in place).
+	'default': ('mode=ro', {}),
+	'readonly': ('mode=ro', {'query_only': 1, 'temp_store': 'MEMORY', 'cache_size': -32000}),
+	'mmap': ('mode=ro', {'query_only': 1, 'temp_store': 'MEMORY', 'cache_size': -8000, 'mmap_size': 1 << 30}),
+	'immutable': ('mode=ro&immutable=1',
+		{'query_only': 1, 'temp_store': 'MEMORY', 'cache_size': -8000, 'mmap_size': 1 << 30}),
+}
+DB_PROFILE = os.environ.get('CHRONA_DB_PROFILE', 'default') # Selects an entry in DB_PROFILES
 
 # ========== Classes for values sent as responses ==========
 
+AtlasPos = tuple[str, int, int]
+	# Holds an atlas name, and the x and y offsets of an image within it (see hist_data/gen_imgs.py)
+
 class HistEvent:
 	""" Represents an historical event """
 	def __init__(
@@ -53,7 +116,8 @@ class HistEvent:
 			endUpper: HistDate | None,
 			ctg: str,
 			imgId: int | None,
-			pop: int):
+			pop: int,
+			atlas: AtlasPos | None = None):
 		self.id = id
 		self.title = title
 		self.start = start
@@ -63,26 +127,113 @@ class HistEvent:
 		self.ctg = ctg
 		self.imgId = imgId
 		self.pop = pop
+		self.atlas = atlas # The event's image in an atlas, if any
 
 	def __eq__(self, other): # Used in unit testing
 		return isinstance(other, HistEvent) and \
 			(self.id, self.title, self.start, self.startUpper, self.end, self.endUpper, \
-				self.ctg, self.pop, self.imgId) == \
+				self.ctg, self.pop, self.imgId, self.atlas) == \
 			(other.id, other.title, other.start, other.startUpper, other.end, other.endUpper, \
-				other.ctg, other.pop, other.imgId)
+				other.ctg, other.pop, other.imgId, other.atlas)
 
 	def __repr__(self): # Used in unit testing
 		return str(self.__dict__)
 
 class EventResponse:
 	""" Used when responding to type=events requests """
-	def __init__(self, events: list[HistEvent], unitCounts: dict[int, int] | None):
+	def __init__(self, events: list[HistEvent], unitCounts: dict[int, int], unitCountsWidth=1):
 		self.events = events
-		self.unitCounts = unitCounts # None indicates exceeding MAX_REQ_UNIT_COUNTS
+		self.unitCounts = unitCounts
+		self.unitCountsWidth = unitCountsWidth
+			# If more than 1, 'unitCounts' maps multiples of this value to counts for that many units
+			# (used to avoid exceeding MAX_REQ_UNIT_COUNTS)
 
 	def __eq__(self, other): # Used in unit testing
 		return isinstance(other, EventResponse) and \
-			(self.events, self.unitCounts) == (other.events, other.unitCounts)
+			(self.events, self.unitCounts, self.unitCountsWidth) == \
+			(other.events, other.unitCounts, other.unitCountsWidth)
+
+	def __repr__(self): # Used in unit testing
+		return str(self.__dict__)
+
+class EventColsResponse:
+	"""
+	Used when responding to type=events requests with fmt=cols.
+	Holds event data as parallel lists, which avoids repeating key names per event.
+	Dates are left unconverted, and are interpreted as for the 'events' db table.
+	"""
+	def __init__(
+			self,
+			ids: list[int],
+			titles: list[str],
+			starts: list[int],
+			startUppers: list[int | None],
+			ends: list[int | None],
+			endUppers: list[int | None],
+			fmts: list[int],
+			ctgs: list[str],
+			imgIds: list[int | None],
+			pops: list[int],
+			atlases: list[AtlasPos | None],
+			unitCounts: dict[int, int],
+			unitCountsWidth: int):
+		self.ids = ids
+		self.titles = titles
+		self.starts = starts
+		self.startUppers = startUppers
+		self.ends = ends
+		self.endUppers = endUppers
+		self.fmts = fmts
+		self.ctgs = ctgs
+		self.imgIds = imgIds
+		self.pops = pops
+		self.atlases = atlases
+		self.unitCounts = unitCounts # As in EventResponse
+		self.unitCountsWidth = unitCountsWidth
+
+	def __eq__(self, other): # Used in unit testing
+		return isinstance(other, EventColsResponse) and self.__dict__ == other.__dict__
+
+	def __repr__(self): # Used in unit testing
+		return str(self.__dict__)
+
+class WindowResult:
+	""" Holds the results for one window in a type=batch request """
+	def __init__(self, eventIds: list[int], unitCounts: dict[int, int], unitCountsWidth=1):
+		self.eventIds = eventIds
+		self.unitCounts = unitCounts # As in EventResponse
+		self.unitCountsWidth = unitCountsWidth
+
+	def __eq__(self, other): # Used in unit testing
+		return isinstance(other, WindowResult) and \
+			(self.eventIds, self.unitCounts, self.unitCountsWidth) == \
+			(other.eventIds, other.unitCounts, other.unitCountsWidth)
+
+	def __repr__(self): # Used in unit testing
+		return str(self.__dict__)
+
+class BatchResponse:
+	""" Used when responding to type=batch requests. Each event appears once, even if in multiple windows. """
+	def __init__(self, events: list[HistEvent], windows: list[WindowResult]):
+		self.events = events
+		self.windows = windows
+
+	def __eq__(self, other): # Used in unit testing
+		return isinstance(other, BatchResponse) and \
+			(self.events, self.windows) == (other.events, other.windows)
+
+	def __repr__(self): # Used in unit testing
+		return str(self.__dict__)
+
+class CountResponse:
+	""" Used when responding to type=count requests """
+	def __init__(self, count: int, ctgCounts: dict[str, int] | None):
+		self.count = count
+		self.ctgCounts = ctgCounts # Maps requested categories to counts, or is None if categories weren't given
+
+	def __eq__(self, other): # Used in unit testing
+		return isinstance(other, CountResponse) and \
+			(self.count, self.ctgCounts) == (other.count, other.ctgCounts)
 
 	def __repr__(self): # Used in unit testing
 		return str(self.__dict__)
@@ -131,50 +282,664 @@ class SuggResponse:
 	def __repr__(self): # Used in unit testing
 		return str(self.__dict__)
 
+ResponseVal = None | EventResponse | EventColsResponse | BatchResponse | CountResponse | EventInfo | SuggResponse
+
 # ========== Entry point ==========
 
 def application(environ: dict[str, str], start_response) -> Iterable[bytes]:
 	""" Entry point for the WSGI script """
-	# Get response object
-	val = handleReq(DB_FILE, environ)
+	startTime = time.perf_counter()
+	params = {k: v[0] for k, v in urllib.parse.parse_qs(environ.get('QUERY_STRING', '')).items()}
+	reqType = params.get('type')
+	if reqType == 'metrics':
+		data = metrics.toText().encode()
+		start_response('200 OK', [('Content-type', 'text/plain; version=0.0.4'), ('Content-Length', str(len(data)))])
+		return [data]
+	if reqType not in REQ_TYPES:
+		reqType = 'other'
+
+	outcome = ReqOutcome()
+	try:
+		body = respond(environ, params, start_response, outcome)
+	except Exception:
+		metrics.record(reqType, time.perf_counter() - startTime, outcome, True)
+		raise
+	metrics.record(reqType, time.perf_counter() - startTime, outcome, outcome.invalid)
+	return body
+
+def respond(
+		environ: dict[str, str], params: dict[str, str], start_response, outcome: 'ReqOutcome') -> Iterable[bytes]:
+	""" Generates a response to a request with given query params, recording details in 'outcome' """
+	timer = None
+	if REQ_TIMING:
+		timer = PhaseTimer()
+		reqTiming.timer = timer
+
+	# Check for a response the client already has
+	cacheKey = getDbIdentity(DB_FILE) + '?' + normaliseQuery(environ.get('QUERY_STRING', ''))
+	coding = negotiateEncoding(environ['HTTP_ACCEPT_ENCODING']) if 'HTTP_ACCEPT_ENCODING' in environ else None
+	# The tag includes the content coding, as bodies with different codings have different bytes
+	etag = '"' + hashlib.sha1(cacheKey.encode()).hexdigest()[:20] + (f'-{coding}' if coding else '') + '"'
+	if 'HTTP_IF_NONE_MATCH' in environ and etagMatches(etag, environ['HTTP_IF_NONE_MATCH']):
+		start_response('304 Not Modified', [('ETag', etag)])
+		return [b'']
+
+	# Check for a streamed response
+	if params.get('type') == 'events' and params.get('fmt') == 'ndjson':
+		return streamEventsResp(params, etag, coding, start_response)
+	markPhase('parse')
+
+	# Get encoded response
+	resp = responseCache.get(cacheKey)
+	if resp is None:
+		dbStartTime = time.perf_counter()
+		val = handleReq(DB_FILE, environ)
+		outcome.dbSeconds = time.perf_counter() - dbStartTime
+		resp = CachedResponse(encodeResponse(val).encode())
+		responseCache.put(cacheKey, resp)
+		markPhase('encode')
 
 	# Construct response
-	data = jsonpickle.encode(val, unpicklable=False).encode()
-	headers = [('Content-type', 'application/json')]
-	if 'HTTP_ACCEPT_ENCODING' in environ and 'gzip' in environ['HTTP_ACCEPT_ENCODING']:
-		if len(data) > 100:
-			data = gzip.compress(data, compresslevel=5)
-			headers.append(('Content-encoding', 'gzip'))
+	data = resp.data
+	headers = [('Content-type', 'application/json'), ('ETag', etag), ('Vary', 'Accept-Encoding')]
+	if coding is not None and len(data) >= COMPRESS_MIN_SZ:
+		if coding not in resp.compressed:
+			responseCache.addCompressed(cacheKey, resp, coding, compressResponse(data, coding))
+		data = resp.compressed[coding]
+		headers.append(('Content-encoding', coding))
+		markPhase('compress')
 	headers.append(('Content-Length', str(len(data))))
+	if timer is not None:
+		totalMs = timer.elapsedMs()
+		headers.append(('Server-Timing', timer.toHeader(totalMs)))
+		if totalMs >= SLOW_REQ_MS and SLOW_REQ_LOG is not None:
+			logSlowReq(environ.get('QUERY_STRING', ''), totalMs, timer)
 	start_response('200 OK', headers)
+	outcome.numBytes = len(data)
+	outcome.invalid = resp.data == b'null'
 
 	return [data]
 
-def handleReq(dbFile: str, environ: dict[str, str]) -> None | EventResponse | EventInfo | SuggResponse:
+def handleReq(dbFile: str, environ: dict[str, str]) -> ResponseVal:
 	""" Queries the database, and constructs a response object """
-	# Open db
-	dbCon = sqlite3.connect(dbFile)
-	dbCur = dbCon.cursor()
-
 	# Get query params
 	queryStr = environ['QUERY_STRING'] if 'QUERY_STRING' in environ else ''
 	queryDict = urllib.parse.parse_qs(queryStr)
 	params = {k: v[0] for k, v in queryDict.items()}
+	markPhase('parse')
+
+	# Open db
+	dbCon = dbConPool.acquire(dbFile) if REUSE_DB_CONS else openDb(dbFile)
+	try:
+		dbCur = dbCon.cursor()
+
+		# Get data of requested type
+		reqType = queryDict['type'][0] if 'type' in queryDict else None
+		if reqType == 'events':
+			eventIndex = getIndex(EventIndex, dbFile, dbCur) if USE_EVENT_INDEX else None
+			return handleEventsReq(params, dbCur, eventIndex)
+		elif reqType == 'info':
+			return handleInfoReq(params, dbCur)
+		elif reqType == 'sugg':
+			suggIndex = getIndex(SuggIndex, dbFile, dbCur) if USE_SUGG_INDEX else None
+			return handleSuggReq(params, dbCur, suggIndex)
+		elif reqType == 'batch':
+			eventIndex = getIndex(EventIndex, dbFile, dbCur) if USE_EVENT_INDEX else None
+			return handleBatchReq(params, dbCur, eventIndex)
+		elif reqType == 'count':
+			return handleCountReq(params, dbCur)
+		return None
+	finally:
+		if REUSE_DB_CONS:
+			dbConPool.release(dbFile, dbCon)
+		else:
+			dbCon.close()
+		markPhase('db')
+
+# ========== For timing requests ==========
+
+class PhaseTimer:
+	""" Accumulates the time spent in named phases of handling a request, with each phase ending when marked """
+	def __init__(self):
+		self.startTime = self.lastTime = time.perf_counter()
+		self.phaseTimes: dict[str, float] = {}
+
+	def mark(self, phase: str) -> None:
+		now = time.perf_counter()
+		self.phaseTimes[phase] = self.phaseTimes.get(phase, 0) + now - self.lastTime
+		self.lastTime = now
+
+	def elapsedMs(self) -> float:
+		return (time.perf_counter() - self.startTime) * 1000
+
+	def toHeader(self, totalMs: float) -> str:
+		""" Returns a Server-Timing header value """
+		phases = [f'{phase};dur={t * 1000:.2f}' for phase, t in self.phaseTimes.items()]
+		return ', '.join(phases + [f'total;dur={totalMs:.2f}'])
 
-	# Get data of requested type
-	reqType = queryDict['type'][0] if 'type' in queryDict else None
-	if reqType == 'events':
-		return handleEventsReq(params, dbCur)
-	elif reqType == 'info':
-		return handleInfoReq(params, dbCur)
-	elif reqType == 'sugg':
-		return handleSuggReq(params, dbCur)
+reqTiming = threading.local() # Holds a 'timer' for the request being handled by a thread
+
+def markPhase(phase: str) -> None:
+	""" Ends a phase of handling the current request, if REQ_TIMING is enabled """
+	if REQ_TIMING:
+		timer = getattr(reqTiming, 'timer', None)
+		if timer is not None:
+			timer.mark(phase)
+
+slowReqLogLock = threading.Lock()
+slowReqLogFailed = False # Set after a failed write to SLOW_REQ_LOG, to report the failure only once
+
+def logSlowReq(queryStr: str, totalMs: float, timer: PhaseTimer) -> None:
+	""" Appends a line to SLOW_REQ_LOG with the time, duration, query string, and phase times of a request.
+		A failure to write is reported once to stderr, and doesn't fail the request. """
+	global slowReqLogFailed
+	phases = ' '.join(f'{phase}={t * 1000:.2f}' for phase, t in timer.phaseTimes.items())
+	line = f'{time.strftime("%Y-%m-%dT%H:%M:%S")}\t{totalMs:.2f}\t{queryStr}\t{phases}\n'
+	with slowReqLogLock:
+		try:
+			with open(cast(str, SLOW_REQ_LOG), 'a') as file:
+				file.write(line)
+		except OSError as e:
+			if not slowReqLogFailed:
+				print(f'ERROR: Unable to write to slow request log: {e}', file=sys.stderr)
+				slowReqLogFailed = True
+
+# ========== For request metrics ==========
+
+REQ_TYPES = {'events', 'info', 'sugg', 'batch', 'count'} # Request types that metrics are recorded for separately
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5] # In seconds
+BYTES_BUCKETS = [100, 1_000, 10_000, 100_000, 1_000_000]
+
+class ReqOutcome:
+	""" Holds details about the handling of a request, for recording in metrics """
+	def __init__(self):
+		self.dbSeconds: float | None = None # Time spent in handleReq(), or None if a cached response was used
+		self.numBytes: int | None = None # Size of the response body, or None if it was streamed or empty
+		self.invalid = False # True if the response was null
+
+class Histogram:
+	""" Counts observed values in fixed buckets, as for a Prometheus histogram """
+	def __init__(self, bounds: list[float]):
+		self.bounds = bounds # Holds the upper bound of each bucket, except the last (which has no bound)
+		self.counts = [0] * (len(bounds) + 1)
+		self.sum: float = 0
+
+	def observe(self, value: float) -> None:
+		self.counts[bisect.bisect_left(self.bounds, value)] += 1
+		self.sum += value
+
+	def toLines(self, name: str, labels: str) -> list[str]:
+		lines = []
+		cumulCount = 0
+		for bound, count in zip(self.bounds + ['+Inf'], self.counts):
+			cumulCount += count
+			lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulCount}')
+		lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+		lines.append(f'{name}_count{{{labels}}} {cumulCount}')
+		return lines
+
+class RequestMetrics:
+	""" Aggregates per-process request metrics, by request type, in a thread-safe way """
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.reqCounts: dict[str, int] = {}
+		self.errorCounts: dict[str, int] = {}
+		self.latencies: dict[str, Histogram] = {}
+		self.respBytes: dict[str, Histogram] = {}
+		self.dbTimes: dict[str, Histogram] = {}
+
+	def record(self, reqType: str, seconds: float, outcome: ReqOutcome, isError: bool) -> None:
+		with self.lock:
+			self.reqCounts[reqType] = self.reqCounts.get(reqType, 0) + 1
+			if isError:
+				self.errorCounts[reqType] = self.errorCounts.get(reqType, 0) + 1
+			if reqType not in self.latencies:
+				self.latencies[reqType] = Histogram(LATENCY_BUCKETS)
+				self.respBytes[reqType] = Histogram(BYTES_BUCKETS)
+				self.dbTimes[reqType] = Histogram(LATENCY_BUCKETS)
+			self.latencies[reqType].observe(seconds)
+			if outcome.numBytes is not None:
+				self.respBytes[reqType].observe(outcome.numBytes)
+			if outcome.dbSeconds is not None:
+				self.dbTimes[reqType].observe(outcome.dbSeconds)
+
+	def toText(self) -> str:
+		""" Returns metrics in Prometheus' text exposition format """
+		lines: list[str] = []
+		def addMetric(name: str, metricType: str, desc: str, metricLines: list[str]) -> None:
+			lines.extend([f'# HELP {name} {desc}', f'# TYPE {name} {metricType}'] + metricLines)
+		with self.lock:
+			addMetric('chrona_requests_total', 'counter', 'Number of requests handled',
+				[f'chrona_requests_total{{type="{t}"}} {n}' for t, n in self.reqCounts.items()])
+			addMetric('chrona_errors_total', 'counter', 'Number of requests that raised an error or got a null response',
+				[f'chrona_errors_total{{type="{t}"}} {self.errorCounts.get(t, 0)}' for t in self.reqCounts])
+			for name, desc, histograms in [
+				('chrona_request_seconds', 'Time taken to produce a response', self.latencies),
+				('chrona_response_bytes', 'Size of (possibly compressed) non-streamed response bodies', self.respBytes),
+				('chrona_db_seconds', 'Time spent querying the db, for uncached responses', self.dbTimes),
+			]:
+				addMetric(name, 'histogram', desc,
+					[line for t, h in histograms.items() for line in h.toLines(name, f'type="{t}"')])
+		cacheStats = responseCache.stats()
+		lookups = cacheStats['hits'] + cacheStats['misses']
+		addMetric('chrona_cache_hits_total', 'counter', 'Number of response cache hits',
+			[f'chrona_cache_hits_total {cacheStats["hits"]}'])
+		addMetric('chrona_cache_misses_total', 'counter', 'Number of response cache misses',
+			[f'chrona_cache_misses_total {cacheStats["misses"]}'])
+		addMetric('chrona_cache_hit_ratio', 'gauge', 'Fraction of response cache lookups that were hits',
+			[f'chrona_cache_hit_ratio {cacheStats["hits"] / lookups if lookups else 0}'])
+		addMetric('chrona_cache_bytes', 'gauge', 'Total bytes of cached responses',
+			[f'chrona_cache_bytes {cacheStats["bytes"]}'])
+		return '\n'.join(lines) + '\n'
+
+metrics = RequestMetrics()
+
+# ========== For encoding responses ==========
+
+def encodeResponse(val: ResponseVal) -> str:
+	"""
+	Encodes a response object as JSON. Gives the same output as jsonpickle.encode(val, unpicklable=False),
+	but avoids its per-object reflection, by converting objects directly into dicts and lists.
+	"""
+	return json.dumps(responseToJson(val))
+
+def responseToJson(val: ResponseVal) -> Any:
+	if isinstance(val, EventResponse):
+		return {
+			'events': [histEventToJson(event) for event in val.events],
+			'unitCounts': val.unitCounts,
+			'unitCountsWidth': val.unitCountsWidth,
+		}
+	elif isinstance(val, EventInfo):
+		return {
+			'event': histEventToJson(val.event),
+			'desc': val.desc,
+			'wikiId': val.wikiId,
+			'imgInfo': None if val.imgInfo is None else val.imgInfo.__dict__,
+		}
+	elif isinstance(val, SuggResponse):
+		return {'suggs': val.suggs, 'hasMore': val.hasMore}
+	elif isinstance(val, EventColsResponse):
+		return val.__dict__
+	elif isinstance(val, CountResponse):
+		return {'count': val.count, 'ctgCounts': val.ctgCounts}
+	elif isinstance(val, BatchResponse):
+		return {
+			'events': [histEventToJson(event) for event in val.events],
+			'windows': [window.__dict__ for window in val.windows],
+		}
+	return None
+
+def histEventToJson(event: HistEvent) -> dict[str, Any]:
+	return {
+		'id': event.id,
+		'title': event.title,
+		'start': histDateToJson(event.start),
+		'startUpper': histDateToJson(event.startUpper),
+		'end': histDateToJson(event.end),
+		'endUpper': histDateToJson(event.endUpper),
+		'ctg': event.ctg,
+		'imgId': event.imgId,
+		'pop': event.pop,
+		'atlas': event.atlas,
+	}
+
+def histDateToJson(date: HistDate | None) -> dict[str, Any] | None:
+	if date is None:
+		return None
+	return {'gcal': date.gcal, 'year': date.year, 'month': date.month, 'day': date.day}
+
+# ========== For caching responses ==========
+
+class CachedResponse:
+	""" Holds an encoded response, and compressed versions that have been needed """
+	def __init__(self, data: bytes):
+		self.data = data
+		self.compressed: dict[str, bytes] = {} # Maps content codings to compressed data
+
+	def numBytes(self) -> int:
+		return len(self.data) + sum(len(data) for data in self.compressed.values())
+
+class ResponseCache:
+	"""
+	A thread-safe LRU cache for encoded responses, which counts hits, misses, and evictions.
+	Limits both the number of responses, and their total bytes (including compressed versions).
+	"""
+	def __init__(self, maxSize: int, maxBytes: int = RESP_CACHE_BYTES):
+		self.maxSize = maxSize
+		self.maxBytes = maxBytes
+		self.entries: OrderedDict[str, CachedResponse] = OrderedDict()
+		self.numBytes = 0
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def get(self, key: str) -> CachedResponse | None:
+		with self.lock:
+			resp = self.entries.get(key)
+			if resp is None:
+				self.misses += 1
+			else:
+				self.hits += 1
+				self.entries.move_to_end(key)
+			return resp
+
+	def put(self, key: str, resp: CachedResponse) -> None:
+		""" Adds a response, unless it alone would exceed the byte limit """
+		if self.maxSize <= 0 or resp.numBytes() > self.maxBytes:
+			return
+		with self.lock:
+			oldResp = self.entries.pop(key, None)
+			if oldResp is not None:
+				self.numBytes -= oldResp.numBytes()
+			self.entries[key] = resp
+			self.numBytes += resp.numBytes()
+			self.evict()
+
+	def addCompressed(self, key: str, resp: CachedResponse, coding: str, data: bytes) -> None:
+		""" Adds a compressed version of a response, counting its bytes if the response is cached """
+		with self.lock:
+			if coding in resp.compressed: # Added by another thread
+				return
+			resp.compressed[coding] = data
+			if self.entries.get(key) is resp:
+				self.numBytes += len(data)
+				self.evict()
+
+	def evict(self) -> None:
+		""" Removes least-recently-used responses until within limits (the lock must be held) """
+		while len(self.entries) > self.maxSize or self.numBytes > self.maxBytes:
+			_, resp = self.entries.popitem(last=False)
+			self.numBytes -= resp.numBytes()
+			self.evictions += 1
+
+	def stats(self) -> dict[str, int]:
+		""" Returns the cache's size, total bytes, and counter values """
+		with self.lock:
+			return {'size': len(self.entries), 'bytes': self.numBytes,
+				'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+responseCache = ResponseCache(RESP_CACHE_SZ)
+
+def normaliseQuery(queryStr: str) -> str:
+	""" Converts a query string into a form that is the same for requests that get the same response """
+	params = {k: v[0] for k, v in urllib.parse.parse_qs(queryStr).items()} # Like handleReq()
+	if 'imgonly' in params: # Only presence matters
+		params['imgonly'] = ''
+	return urllib.parse.urlencode(sorted(params.items()))
+
+def getDbIdentity(dbFile: str) -> str:
+	""" Returns a string that changes when a db file is replaced or modified """
+	stat = os.stat(dbFile)
+	return f'{stat.st_dev}-{stat.st_ino}-{stat.st_mtime_ns}-{stat.st_size}'
+
+def etagMatches(etag: str, ifNoneMatch: str) -> bool:
+	""" Returns True if an If-None-Match header value matches an ETag """
+	for tag in ifNoneMatch.split(','):
+		tag = tag.strip()
+		if tag == '*' or tag.removeprefix('W/') == etag:
+			return True
+	return False
+
+# ========== For compressing responses ==========
+
+def negotiateEncoding(acceptEncoding: str) -> str | None:
+	""" Returns the content coding to use given an Accept-Encoding header value,
+		preferring 'zstd' (if available) over 'gzip', or None if neither is acceptable """
+	qValues: dict[str, float] = {}
+	for item in acceptEncoding.split(','):
+		coding, _, params = item.partition(';')
+		match = re.search(r'q\s*=\s*([0-9.]+)', params)
+		try:
+			qValues[coding.strip().lower()] = float(match.group(1)) if match else 1
+		except ValueError:
+			continue
+	for coding in ['zstd', 'gzip']:
+		if coding == 'zstd' and zstd is None:
+			continue
+		if qValues.get(coding, qValues.get('*', 0)) > 0:
+			return coding
 	return None
 
+def compressResponse(data: bytes, coding: str) -> bytes:
+	""" Compresses response data using a content coding, at a level chosen using COMPRESS_LEVELS """
+	gzipLevel, zstdLevel = next((g, z) for maxSize, g, z in COMPRESS_LEVELS if len(data) <= maxSize)
+	if coding == 'zstd':
+		return zstd.compress(data, level=zstdLevel)
+	return gzip.compress(data, compresslevel=gzipLevel, mtime=0) # Omits the time, so equal data gives equal bytes
+
+def compressStream(chunks: Generator[bytes, None, None], coding: str | None) -> Iterator[bytes]:
+	""" Compresses chunks of response data using a content coding, flushing after each chunk,
+		so that a client can decode each chunk as it arrives """
+	try:
+		if coding is None:
+			yield from chunks
+		elif coding == 'zstd':
+			compressor = zstd.ZstdCompressor(level=COMPRESS_LEVELS[-1][2])
+			for chunk in chunks:
+				yield compressor.compress(chunk, zstd.ZstdCompressor.FLUSH_BLOCK)
+			yield compressor.flush()
+		else:
+			compressor = zlib.compressobj(COMPRESS_LEVELS[-1][1], zlib.DEFLATED, 16 + zlib.MAX_WBITS) # Uses gzip format
+			for chunk in chunks:
+				yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+			yield compressor.flush()
+	finally:
+		chunks.close()
+
+# ========== For db connections ==========
+
+class DbConnection(sqlite3.Connection):
+	""" A db connection that caches the db's table names (see tableExists()) """
+	tableNames: frozenset[str] | None = None
+
+def openDb(dbFile: str, profile: str | None = None) -> sqlite3.Connection:
+	""" Opens a read-only connection to a db file, configured using an entry in DB_PROFILES
+		(DB_PROFILE by default) """
+	if profile is None:
+		profile = DB_PROFILE
+	if profile not in DB_PROFILES:
+		print(f'WARNING: Unknown db profile "{profile}", using "default"', file=sys.stderr)
+		profile = 'default'
+	uriParams, pragmas = DB_PROFILES[profile]
+	uri = 'file:' + urllib.parse.quote(os.path.abspath(dbFile)) + '?' + uriParams
+	dbCon = sqlite3.connect(
+		uri, uri=True, check_same_thread=False, cached_statements=DB_STMT_CACHE_SZ, factory=DbConnection)
+	for name, value in pragmas.items():
+		dbCon.execute(f'PRAGMA {name} = {value}')
+	return dbCon
+
+class DbConPool:
+	"""
+	Holds open db connections for reuse across requests, avoiding the cost of re-opening
+	a db, re-parsing its schema, and re-preparing statements. A connection is used by one
+	thread at a time, so the pool only needs to be as large as the number of worker threads.
+
+	Connections are tracked along with the identity of the db file they were opened on
+	(see getDbIdentity()), so that replacing a db (eg: deploying by rename) doesn't leave
+	the pool serving the old file.
+	"""
+	def __init__(self, maxSize: int):
+		self.maxSize = maxSize
+		self.idleCons: dict[str, list[sqlite3.Connection]] = {} # Maps db files to unused connections
+		self.numIdle = 0
+		self.dbIdentities: dict[str, str] = {} # Maps db files to the identity their idle connections were opened on
+		self.conIdentities: dict[sqlite3.Connection, str] = {} # Maps acquired connections to db identities
+		self.lock = threading.Lock()
+
+	def acquire(self, dbFile: str) -> sqlite3.Connection:
+		""" Returns an idle connection to a db file, opening one if none are available """
+		identity = getDbIdentity(dbFile)
+		with self.lock:
+			if self.dbIdentities.get(dbFile) != identity:
+				self.closeIdle(dbFile)
+				self.dbIdentities[dbFile] = identity
+			cons = self.idleCons.get(dbFile)
+			if cons:
+				self.numIdle -= 1
+				dbCon = cons.pop()
+				self.conIdentities[dbCon] = identity
+				return dbCon
+		dbCon = openDb(dbFile)
+		with self.lock:
+			self.conIdentities[dbCon] = identity
+		return dbCon
+
+	def release(self, dbFile: str, dbCon: sqlite3.Connection) -> None:
+		""" Returns a connection to the pool, closing it if the pool is full, or if the db file has been replaced """
+		with self.lock:
+			identity = self.conIdentities.pop(dbCon, None)
+			if self.numIdle < self.maxSize and identity is not None and identity == self.dbIdentities.get(dbFile):
+				self.idleCons.setdefault(dbFile, []).append(dbCon)
+				self.numIdle += 1
+				return
+		dbCon.close()
+
+	def closeIdle(self, dbFile: str) -> None:
+		""" Closes idle connections to a db file (the lock must be held) """
+		cons = self.idleCons.pop(dbFile, [])
+		for dbCon in cons:
+			dbCon.close()
+		self.numIdle -= len(cons)
+
+	def close(self) -> None:
+		""" Closes all idle connections """
+		with self.lock:
+			for dbFile in list(self.idleCons):
+				self.closeIdle(dbFile)
+
+dbConPool = DbConPool(DB_POOL_SIZE)
+atexit.register(dbConPool.close)
+
+def tableExists(tableName: str, dbCur: sqlite3.Cursor) -> bool:
+	""" Returns True if the db has a table with the given name. For connections from openDb(), table names
+		are read once per connection (the pool closes connections to a db file that has been replaced). """
+	dbCon = dbCur.connection
+	if not isinstance(dbCon, DbConnection):
+		query = 'SELECT name FROM sqlite_master WHERE type = "table" AND name = ?'
+		return dbCur.execute(query, (tableName,)).fetchone() is not None
+	if dbCon.tableNames is None:
+		query = 'SELECT name FROM sqlite_master WHERE type = "table"'
+		dbCon.tableNames = frozenset(name for (name,) in dbCur.execute(query))
+	return tableName in dbCon.tableNames
+
+IndexType = TypeVar('IndexType')
+loadedIndexes: dict[tuple[Callable, str], tuple[str, Any]] = {}
+	# Maps index types and db files to the identity of the db file an index was loaded from, and the in-memory index
+loadedIndexesLock = threading.Lock()
+
+def getIndex(indexType: Callable[[sqlite3.Cursor], IndexType], dbFile: str, dbCur: sqlite3.Cursor) -> IndexType:
+	""" Returns an in-memory index (eg: an EventIndex) for a db file, loading it on first use,
+		and reloading it if the db file has been replaced or modified """
+	identity = getDbIdentity(dbFile)
+	with loadedIndexesLock:
+		if (indexType, dbFile) not in loadedIndexes or loadedIndexes[(indexType, dbFile)][0] != identity:
+			loadedIndexes[(indexType, dbFile)] = (identity, indexType(dbCur))
+		return loadedIndexes[(indexType, dbFile)][1]
+
+def loadIndexes(dbFile: str) -> None:
+	""" Loads the in-memory indexes enabled by USE_EVENT_INDEX and USE_SUGG_INDEX, so that the first
+		requests using them don't wait for them to load (eg: server.py calls this before serving) """
+	indexTypes: list[Callable] = ([EventIndex] if USE_EVENT_INDEX else []) + ([SuggIndex] if USE_SUGG_INDEX else [])
+	if not indexTypes:
+		return
+	dbCon = openDb(dbFile)
+	try:
+		for indexType in indexTypes:
+			getIndex(indexType, dbFile, dbCon.cursor())
+	finally:
+		dbCon.close()
+
 # ========== For handling type=events ==========
 
-def handleEventsReq(params: dict[str, str], dbCur: sqlite3.Cursor) -> EventResponse | None:
-	""" Generates a response for a type=events request """
+def handleEventsReq(
+		params: dict[str, str], dbCur: sqlite3.Cursor,
+		eventIndex: 'EventIndex | None' = None) -> EventResponse | EventColsResponse | None:
+	""" Generates a response for a type=events request, using 'eventIndex' instead of the db if given """
+	window = parseWindowParams(params)
+	if window is None:
+		return None
+	start, end, scale, incl, resultLimit = window
+	ctgs = params['ctgs'].split('.') if 'ctgs' in params else None
+	imgonly = 'imgonly' in params
+
+	# Get response format
+	fmt = params['fmt'] if 'fmt' in params else None
+	if fmt is not None and fmt != 'cols':
+		print(f'INFO: Invalid response format {fmt}', file=sys.stderr)
+		return None
+
+	if eventIndex is not None:
+		rows = eventIndex.lookupEvents(start, end, scale, incl, resultLimit, ctgs, imgonly)
+		unitCounts, width = eventIndex.lookupUnitCounts(start, end, scale, imgonly)
+	else:
+		rows = lookupEvents(start, end, scale, incl, resultLimit, ctgs, imgonly, dbCur)
+		unitCounts, width = lookupUnitCounts(start, end, scale, imgonly, dbCur)
+	markPhase('db')
+
+	if fmt == 'cols':
+		cols = [list(col) for col in zip(*rows)] if rows else [[] for i in range(11)]
+		response: EventResponse | EventColsResponse = EventColsResponse(*cols, unitCounts, width)
+	else:
+		response = EventResponse([eventEntryToResults(row) for row in rows], unitCounts, width)
+	markPhase('convert')
+	return response
+
+def streamEventsResp(params: dict[str, str], etag: str, coding: str | None, start_response) -> Iterable[bytes]:
+	"""
+	Responds to a type=events&fmt=ndjson request, sending events as they are read from the db,
+	without caching. The first line holds 'unitCounts' and 'unitCountsWidth', and each following
+	line holds an event, in order of popularity (apart from any 'incl' event, which is last).
+	"""
+	window = parseWindowParams(params)
+	if window is None:
+		start_response('200 OK', [('Content-type', 'application/json'), ('Content-Length', '4')])
+		return [b'null']
+	ctgs = params['ctgs'].split('.') if 'ctgs' in params else None
+	imgonly = 'imgonly' in params
+
+	headers = [('Content-type', 'application/x-ndjson'), ('ETag', etag), ('Vary', 'Accept-Encoding')]
+	if coding is not None:
+		headers.append(('Content-encoding', coding))
+	start_response('200 OK', headers)
+	return compressStream(genEventLines(DB_FILE, window, ctgs, imgonly), coding)
+
+def genEventLines(
+		dbFile: str, window: 'WindowParams', ctgs: list[str] | None, imgonly: bool) -> Generator[bytes, None, None]:
+	""" Yields encoded lines of a streamed type=events response, in chunks of NDJSON_CHUNK_EVENTS events """
+	start, end, scale, incl, resultLimit = window
+	dbCon = dbConPool.acquire(dbFile) if REUSE_DB_CONS else openDb(dbFile)
+	try:
+		dbCur = dbCon.cursor()
+		rows: Iterable[EventRow]
+		if USE_EVENT_INDEX:
+			eventIndex = getIndex(EventIndex, dbFile, dbCur)
+			unitCounts, width = eventIndex.lookupUnitCounts(start, end, scale, imgonly)
+			rows = eventIndex.lookupEvents(start, end, scale, incl, resultLimit, ctgs, imgonly)
+		else:
+			unitCounts, width = lookupUnitCounts(start, end, scale, imgonly, dbCur)
+			rows = iterEvents(start, end, scale, incl, resultLimit, ctgs, imgonly, dbCur)
+		yield (json.dumps({'unitCounts': unitCounts, 'unitCountsWidth': width}) + '\n').encode()
+		lines: list[str] = []
+		for row in rows:
+			lines.append(json.dumps(histEventToJson(eventEntryToResults(row))) + '\n')
+			if len(lines) == NDJSON_CHUNK_EVENTS:
+				yield ''.join(lines).encode()
+				lines.clear()
+		if lines:
+			yield ''.join(lines).encode()
+	finally:
+		if REUSE_DB_CONS:
+			dbConPool.release(dbFile, dbCon)
+		else:
+			dbCon.close()
+
+WindowParams = tuple[HistDate | None, HistDate | None, int, int | None, int]
+	# Holds a start date, end date, scale, event to include, and result limit
+
+def parseWindowParams(params: dict[str, str]) -> WindowParams | None:
+	""" Reads the 'range', 'scale', 'incl', and 'limit' params of a type=events request """
 	# Get dates
 	dateRange = params['range'] if 'range' in params else '.'
 	if '.' not in dateRange:
@@ -207,19 +972,13 @@ def handleEventsReq(params: dict[str, str], dbCur: sqlite3.Cursor) -> EventRespo
 	try:
 		resultLimit = int(params['limit']) if 'limit' in params else DEFAULT_REQ_EVENTS
 	except ValueError:
-		print(f'INFO: Invalid results limit {resultLimit}', file=sys.stderr)
+		print(f'INFO: Invalid results limit {params["limit"]}', file=sys.stderr)
 		return None
 	if resultLimit <= 0 or resultLimit > MAX_REQ_EVENTS:
 		print(f'INFO: Invalid results limit {resultLimit}', file=sys.stderr)
 		return None
 
-	ctgs = params['ctgs'].split('.') if 'ctgs' in params else None
-	imgonly = 'imgonly' in params
-
-	events = lookupEvents(start, end, scale, incl, resultLimit, ctgs, imgonly, dbCur)
-	unitCounts = lookupUnitCounts(start, end, scale, imgonly, dbCur)
-
-	return EventResponse(events, unitCounts)
+	return start, end, scale, incl, resultLimit
 
 def reqParamToHistDate(s: str):
 	""" Produces a HistDate from strings like '2010-10-3', '-8000', and '' (throws ValueError if invalid) """
@@ -233,25 +992,56 @@ def reqParamToHistDate(s: str):
 	else:
 		return HistDate(True, int(m.group(1)), int(m.group(2)), int(m.group(3)))
 
+EventRow = tuple[int, str, int, int | None, int | None, int | None, int, str, int | None, int, AtlasPos | None]
+	# Holds event data as used by eventEntryToResults()
+
 def lookupEvents(
 		start: HistDate | None, end: HistDate | None, scale: int, incl: int | None, resultLimit: int,
-		ctgs: list[str] | None, imgonly: bool, dbCur: sqlite3.Cursor) -> list[HistEvent]:
+		ctgs: list[str] | None, imgonly: bool, dbCur: sqlite3.Cursor) -> list[EventRow]:
 	""" Looks for events within a date range, in given scale,
-		restricted by event category, an optional particular inclusion, and a result limit """
+		restricted by event category, an optional particular inclusion, and a result limit.
+		Returns db rows, which can be converted using eventEntryToResults(). """
+	return list(iterEvents(start, end, scale, incl, resultLimit, ctgs, imgonly, dbCur))
+
+def iterEvents(
+		start: HistDate | None, end: HistDate | None, scale: int, incl: int | None, resultLimit: int,
+		ctgs: list[str] | None, imgonly: bool, dbCur: sqlite3.Cursor) -> Iterator[EventRow]:
+	""" Like lookupEvents(), but yields rows as they are read from the db """
 	dispTable = 'event_disp' if not imgonly else 'img_disp'
+	# Get atlas positions for the scale, if atlases have been generated
+	atlasCols, atlasJoin = ', NULL, NULL, NULL', ''
+	atlasParams: list[str | int] = []
+	if tableExists('event_atlas', dbCur):
+		atlasCols = ', event_atlas.atlas, event_atlas.x, event_atlas.y'
+		atlasJoin = ' LEFT JOIN event_atlas ON {}.id = event_atlas.id AND event_atlas.scale = ?'
+		atlasParams = [scale]
 	query = \
-		'SELECT events.id, title, start, start_upper, end, end_upper, fmt, ctg, images.id, pop.pop FROM events' \
+		'SELECT events.id, title, start, start_upper, end, end_upper, fmt, ctg, images.id, pop.pop' \
+			f'{atlasCols} FROM events' \
 		f' INNER JOIN {dispTable} ON events.id = {dispTable}.id' \
 		' INNER JOIN pop ON events.id = pop.id' \
 		' LEFT JOIN event_imgs ON events.id = event_imgs.id' \
-		' LEFT JOIN images ON event_imgs.img_id = images.id'
+		' LEFT JOIN images ON event_imgs.img_id = images.id' \
+		+ atlasJoin.format('events')
 	constraints = [f'{dispTable}.scale = ?']
-	params: list[str | int] = [scale]
+	params: list[str | int] = atlasParams + [scale]
+	orderBy = 'pop.pop DESC, events.id' # Breaks ties like the primary key of 'disp_events'
+	if tableExists('disp_events', dbCur):
+		# Read from a table ordered by popularity within each unit, which avoids joins,
+		# and avoids sorting for single-unit ranges
+		query2 = 'SELECT disp_events.id, title, start, start_upper, end, end_upper, fmt, ctg, img_id, pop' \
+			f'{atlasCols} FROM disp_events' + atlasJoin.format('disp_events')
+		dispTable = 'disp_events'
+		constraints = ['imgonly = ?', 'disp_events.scale = ?']
+		params = atlasParams + [int(imgonly), scale]
+		orderBy = 'pop DESC, disp_events.id'
+	else:
+		query2 = query
 
 	# Constrain by start/end
 	startUnit = dateToUnit(start, scale) if start is not None else None
 	endUnit = dateToUnit(end, scale) if end is not None else None
-	if startUnit is not None and startUnit == endUnit:
+	if startUnit is not None and endUnit in (startUnit, startUnit + 1): # Range covers a single unit
 		constraints.append(f'{dispTable}.unit = ?')
 		params.append(startUnit)
 	else:
@@ -268,32 +1058,37 @@ def lookupEvents(
 		params.extend(ctgs)
 
 	# Add constraints to query
-	query2 = query
 	if constraints:
 		query2 += ' WHERE ' + ' AND '.join(constraints)
-	query2 += ' ORDER BY pop.pop DESC'
+	query2 += f' ORDER BY {orderBy}'
 	query2 += f' LIMIT {resultLimit}'
 
 	# Run query
-	results: list[HistEvent] = []
-	for row in dbCur.execute(query2, params):
-		results.append(eventEntryToResults(row))
+	lastRow: EventRow | None = None # Holds the last row within the limit, which an inclusion might replace
+	for rowNum, dbRow in enumerate(dbCur.execute(query2, params), 1):
+		row = dbRowToEventRow(dbRow)
 		if incl is not None and incl == row[0]:
 			incl = None
+		if rowNum < resultLimit:
+			yield row
+		else:
+			lastRow = row
 
 	# Get any additional inclusion
 	if incl is not None:
-		row = dbCur.execute(query + ' WHERE events.id = ?', (incl,)).fetchone()
-		if row is not None:
-			if len(results) == resultLimit:
-				results.pop()
-			results.append(eventEntryToResults(row))
+		dbRow = dbCur.execute(query + ' WHERE events.id = ?', atlasParams + [incl]).fetchone()
+		if dbRow is not None:
+			lastRow = None
+			yield dbRowToEventRow(dbRow)
+	if lastRow is not None:
+		yield lastRow
 
-	return results
+def dbRowToEventRow(dbRow: tuple) -> EventRow:
+	""" Converts a row from iterEvents()'s queries, whose last 3 values describe an atlas position """
+	return dbRow[:10] + (None if dbRow[10] is None else dbRow[10:],)
 
-def eventEntryToResults(
-		row: tuple[int, str, int, int | None, int | None, int | None, int, str, int | None, int]) -> HistEvent:
-	eventId, title, start, startUpper, end, endUpper, fmt, ctg, imageId, pop = row
+def eventEntryToResults(row: EventRow) -> HistEvent:
+	eventId, title, start, startUpper, end, endUpper, fmt, ctg, imageId, pop, atlas = row
 	""" Helper for converting an 'events' db entry into an HistEvent object """
 	# Convert dates
 	dateVals: list[int | None] = [start, startUpper, end, endUpper]
@@ -303,29 +1098,292 @@ def eventEntryToResults(
 			newDates[i] = dbDateToHistDate(n, fmt, i < 2)
 
 	return HistEvent(
-		eventId, title, cast(HistDate, newDates[0]), newDates[1], newDates[2], newDates[3], ctg, imageId, pop)
+		eventId, title, cast(HistDate, newDates[0]), newDates[1], newDates[2], newDates[3], ctg, imageId, pop, atlas)
 
 def lookupUnitCounts(
 		start: HistDate | None, end: HistDate | None, scale: int,
-		imgonly: bool, dbCur: sqlite3.Cursor) -> dict[int, int] | None:
-	""" Return list of units with counts given scale and a date range """
+		imgonly: bool, dbCur: sqlite3.Cursor) -> tuple[dict[int, int], int]:
+	""" Return map of units to event counts given scale and a date range, along with a bucket width.
+		If there are more than MAX_REQ_UNIT_COUNTS units, counts are summed into buckets of
+		'width' units each, keyed by multiples of 'width', using at most MAX_REQ_UNIT_COUNTS + 1
+		lookups of cumulative counts. Otherwise, 'width' is 1. """
 	# Build query
 	distTable = 'dist' if not imgonly else 'img_dist'
-	query = f'SELECT unit, count FROM {distTable} WHERE scale = ?'
+	constraints = 'scale = ?'
 	params = [scale]
 	if start:
-		query += ' AND unit >= ?'
+		constraints += ' AND unit >= ?'
 		params.append(dateToUnit(start, scale))
 	if end:
-		query += ' AND unit < ?'
+		constraints += ' AND unit < ?'
 		params.append(dateToUnit(end, scale))
-	query += ' ORDER BY unit ASC LIMIT ' + str(MAX_REQ_UNIT_COUNTS + 1)
+	query = f'SELECT unit, count FROM {distTable} WHERE {constraints}' \
+		' ORDER BY unit ASC LIMIT ' + str(MAX_REQ_UNIT_COUNTS + 1)
 
 	# Get results
 	unitCounts: dict[int, int] = {}
 	for unit, count in dbCur.execute(query, params):
 		unitCounts[unit] = count
-	return unitCounts if len(unitCounts) <= MAX_REQ_UNIT_COUNTS else None
+	if len(unitCounts) <= MAX_REQ_UNIT_COUNTS:
+		return unitCounts, 1
+
+	# Sum counts into buckets
+	minUnit = next(iter(unitCounts))
+	maxUnit = dbCur.execute(f'SELECT MAX(unit) FROM {distTable} WHERE {constraints}', params).fetchone()[0]
+	width = getBucketWidth(minUnit, maxUnit)
+	bucketCounts: dict[int, int] = {}
+	sumsTable = 'dist_sums' if not imgonly else 'img_dist_sums'
+	if tableExists(sumsTable, dbCur):
+		# Get each bucket's count as a difference of cumulative counts, using one index lookup per bucket
+		query = f'SELECT cumul_count FROM {sumsTable} WHERE ctg = ? AND scale = ? AND unit < ?' \
+			' ORDER BY unit DESC LIMIT 1'
+		def cumulCount(unit: int) -> int:
+			row = dbCur.execute(query, ('', scale, unit)).fetchone()
+			return row[0] if row is not None else 0
+		bucketStart = minUnit // width * width
+		prevCumulCount = cumulCount(minUnit)
+		while bucketStart <= maxUnit:
+			nextCumulCount = cumulCount(min(bucketStart + width, maxUnit + 1))
+			if nextCumulCount > prevCumulCount:
+				bucketCounts[bucketStart] = nextCumulCount - prevCumulCount
+			prevCumulCount = nextCumulCount
+			bucketStart += width
+		return bucketCounts, width
+	# Otherwise, sum rows (for dbs without cumulative counts)
+	query = f'SELECT unit, count FROM {distTable} WHERE {constraints} ORDER BY unit ASC'
+		# Summing rows in index order here avoids having sqlite build a temporary b-tree for a GROUP BY
+	for unit, count in dbCur.execute(query, params):
+		bucketUnit = unit // width * width
+		bucketCounts[bucketUnit] = bucketCounts.get(bucketUnit, 0) + count
+	return bucketCounts, width
+
+def getBucketWidth(minUnit: int, maxUnit: int) -> int:
+	""" Returns the smallest bucket width that puts units from 'minUnit' to 'maxUnit'
+		into at most MAX_REQ_UNIT_COUNTS buckets, if bucket start units are multiples of the width """
+	# With n units and width w, there are at most (n-1)//w + 2 buckets
+	return max(1, -(-(maxUnit - minUnit + 1) // (MAX_REQ_UNIT_COUNTS - 1)))
+
+# ========== For handling type=batch ==========
+
+def handleBatchReq(
+		params: dict[str, str], dbCur: sqlite3.Cursor, eventIndex: 'EventIndex | None' = None) -> BatchResponse | None:
+	""" Generates a response for a type=batch request, using 'eventIndex' instead of the db if given """
+	# Get windows
+	if 'windows' not in params:
+		print('INFO: No \'windows\' parameter for type=batch request', file=sys.stderr)
+		return None
+	windowStrs = params['windows'].split('_')
+	if len(windowStrs) > MAX_REQ_WINDOWS:
+		print(f'INFO: Too many windows for type=batch request ({len(windowStrs)})', file=sys.stderr)
+		return None
+	windows: list[WindowParams] = []
+	for windowStr in windowStrs:
+		fields = windowStr.split(',')
+		if len(fields) > 4:
+			print(f'INFO: Invalid window {windowStr}', file=sys.stderr)
+			return None
+		windowParams = {name: val for name, val in zip(['range', 'scale', 'incl', 'limit'], fields) if val}
+		window = parseWindowParams(windowParams)
+		if window is None:
+			return None
+		windows.append(window)
+
+	ctgs = params['ctgs'].split('.') if 'ctgs' in params else None
+	imgonly = 'imgonly' in params
+
+	# Get results
+	eventRows: dict[int, EventRow] = {} # Used to de-duplicate events
+	results: list[WindowResult] = []
+	if eventIndex is None:
+		dbCur.execute('BEGIN') # Read all windows from the same db snapshot
+	try:
+		for start, end, scale, incl, resultLimit in windows:
+			if eventIndex is not None:
+				rows = eventIndex.lookupEvents(start, end, scale, incl, resultLimit, ctgs, imgonly)
+				unitCounts, width = eventIndex.lookupUnitCounts(start, end, scale, imgonly)
+			else:
+				rows = lookupEvents(start, end, scale, incl, resultLimit, ctgs, imgonly, dbCur)
+				unitCounts, width = lookupUnitCounts(start, end, scale, imgonly, dbCur)
+			for row in rows:
+				eventRows.setdefault(row[0], row)
+			results.append(WindowResult([row[0] for row in rows], unitCounts, width))
+	finally:
+		if eventIndex is None:
+			dbCur.execute('COMMIT')
+
+	return BatchResponse([eventEntryToResults(row) for row in eventRows.values()], results)
+
+# ========== For handling type=count ==========
+
+def handleCountReq(params: dict[str, str], dbCur: sqlite3.Cursor) -> CountResponse | None:
+	""" Generates a response for a type=count request """
+	window = parseWindowParams(params)
+	if window is None:
+		return None
+	start, end, scale, _, _ = window
+	ctgs = params['ctgs'].split('.') if 'ctgs' in params else None
+	imgonly = 'imgonly' in params
+	return lookupCount(start, end, scale, ctgs, imgonly, dbCur)
+
+def lookupCount(
+		start: HistDate | None, end: HistDate | None, scale: int,
+		ctgs: list[str] | None, imgonly: bool, dbCur: sqlite3.Cursor) -> CountResponse | None:
+	""" Counts events within a date range, in units of a given scale, optionally per category.
+		Uses cumulative counts, requiring two index lookups per category. """
+	sumsTable = 'dist_sums' if not imgonly else 'img_dist_sums'
+	if not tableExists(sumsTable, dbCur):
+		print(f'INFO: No {sumsTable} table for type=count request', file=sys.stderr)
+		return None
+	startUnit = dateToUnit(start, scale) if start is not None else None
+	endUnit = dateToUnit(end, scale) if end is not None else None
+
+	def cumulCount(ctg: str, unit: int | None) -> int:
+		""" Returns the number of events in a category before a unit (or in total, if 'unit' is None) """
+		query = f'SELECT cumul_count FROM {sumsTable} WHERE ctg = ? AND scale = ?'
+		params: list[str | int] = [ctg, scale]
+		if unit is not None:
+			query += ' AND unit < ?'
+			params.append(unit)
+		query += ' ORDER BY unit DESC LIMIT 1'
+		row = dbCur.execute(query, params).fetchone()
+		return row[0] if row is not None else 0
+
+	def rangeCount(ctg: str) -> int:
+		count = cumulCount(ctg, endUnit)
+		if startUnit is not None:
+			count -= cumulCount(ctg, startUnit)
+		return max(count, 0)
+
+	if ctgs is None:
+		return CountResponse(rangeCount(''), None)
+	ctgCounts = {ctg: rangeCount(ctg) for ctg in ctgs}
+	return CountResponse(sum(ctgCounts.values()), ctgCounts)
+
+# ========== For handling type=events without the db ==========
+
+class ScaleColumns:
+	""" Holds parallel arrays of units and values for a scale, sorted by unit """
+	def __init__(self):
+		self.units = array('q')
+		self.vals = array('q')
+		self.sums = array('q') # If set, element i holds the sum of the first i values
+
+class EventIndex:
+	"""
+	Holds the data needed to answer type=events requests, loaded from the db into memory.
+	Event display data is held per scale, sorted by unit, then by decreasing popularity and increasing ID.
+	Events with equal popularity are ordered by ID, as for iterEvents().
+	"""
+	def __init__(self, dbCur: sqlite3.Cursor):
+		self.eventRows: dict[int, EventRow] = {} # Maps event IDs to rows as used by eventEntryToResults()
+		self.dispCols: dict[bool, dict[int, ScaleColumns]] = {} # Maps imgonly and scale to units+event-IDs
+		self.dispIds: dict[bool, set[int]] = {} # Maps imgonly to IDs of displayable events
+		self.distCols: dict[bool, dict[int, ScaleColumns]] = {} # Maps imgonly and scale to units+counts
+		self.atlases: dict[tuple[int, int], AtlasPos] = {} # Maps event IDs and scales to atlas positions
+
+		query = \
+			'SELECT events.id, title, start, start_upper, end, end_upper, fmt, ctg, images.id, pop.pop, NULL' \
+			' FROM events' \
+			' INNER JOIN pop ON events.id = pop.id' \
+			' LEFT JOIN event_imgs ON events.id = event_imgs.id' \
+			' LEFT JOIN images ON event_imgs.img_id = images.id'
+		for row in dbCur.execute(query):
+			self.eventRows[row[0]] = row
+		if tableExists('event_atlas', dbCur):
+			for eventId, scale, atlasName, x, y in dbCur.execute('SELECT id, scale, atlas, x, y FROM event_atlas'):
+				self.atlases[(eventId, scale)] = (atlasName, x, y)
+		for imgonly in [False, True]:
+			dispTable = 'event_disp' if not imgonly else 'img_disp'
+			distTable = 'dist' if not imgonly else 'img_dist'
+			query = f'SELECT scale, unit, {dispTable}.id FROM {dispTable}' \
+				f' INNER JOIN events ON {dispTable}.id = events.id' \
+				f' INNER JOIN pop ON {dispTable}.id = pop.id ORDER BY scale, unit, pop.pop DESC, events.id'
+			self.dispCols[imgonly] = self.readColumns(dbCur.execute(query))
+			self.dispIds[imgonly] = set(eventId for (eventId,) in dbCur.execute(f'SELECT id FROM {dispTable}'))
+			query = f'SELECT scale, unit, count FROM {distTable} ORDER BY scale, unit'
+			self.distCols[imgonly] = self.readColumns(dbCur.execute(query))
+			for cols in self.distCols[imgonly].values():
+				cols.sums = array('q', itertools.accumulate(cols.vals, initial=0))
+
+	@staticmethod
+	def readColumns(rows: Iterable[tuple[int, int, int]]) -> dict[int, ScaleColumns]:
+		""" Reads (scale, unit, value) rows, sorted by scale and unit, into a ScaleColumns per scale """
+		scaleCols: dict[int, ScaleColumns] = {}
+		for scale, unit, val in rows:
+			if scale not in scaleCols:
+				scaleCols[scale] = ScaleColumns()
+			cols = scaleCols[scale]
+			cols.units.append(unit)
+			cols.vals.append(val)
+		return scaleCols
+
+	@staticmethod
+	def unitRange(
+			cols: ScaleColumns, start: HistDate | None, end: HistDate | None, scale: int) -> tuple[int, int]:
+		""" Returns the range of indices into 'cols' for units within a date range (like lookupEvents()) """
+		startUnit = dateToUnit(start, scale) if start is not None else None
+		endUnit = dateToUnit(end, scale) if end is not None else None
+		if startUnit is not None and startUnit == endUnit:
+			return bisect.bisect_left(cols.units, startUnit), bisect.bisect_right(cols.units, startUnit)
+		lo = bisect.bisect_left(cols.units, startUnit) if startUnit is not None else 0
+		hi = bisect.bisect_left(cols.units, endUnit) if endUnit is not None else len(cols.units)
+		return lo, hi
+
+	def lookupEvents(
+			self, start: HistDate | None, end: HistDate | None, scale: int, incl: int | None, resultLimit: int,
+			ctgs: list[str] | None, imgonly: bool) -> list[EventRow]:
+		""" Like lookupEvents(), but without using the db """
+		eventRows = self.eventRows
+		cols = self.dispCols[imgonly].get(scale)
+		eventIds: Iterable[int] = []
+		if cols is not None:
+			lo, hi = self.unitRange(cols, start, end, scale)
+			eventIds = cols.vals[lo:hi]
+		if ctgs is not None:
+			eventIds = [eventId for eventId in eventIds if eventRows[eventId][7] in ctgs]
+
+		# Get most popular events
+		results: list[EventRow] = []
+		for eventId in heapq.nlargest(resultLimit, eventIds, key=lambda eventId: (eventRows[eventId][9], -eventId)):
+			results.append(eventRows[eventId])
+			if incl is not None and incl == eventId:
+				incl = None
+
+		# Get any additional inclusion
+		if incl is not None and incl in self.dispIds[imgonly] and incl in eventRows:
+			if len(results) == resultLimit:
+				results.pop()
+			results.append(eventRows[incl])
+
+		# Add atlas positions
+		if self.atlases:
+			results = [row[:10] + (self.atlases.get((row[0], scale)),) for row in results]
+		return results
+
+	def lookupUnitCounts(
+			self, start: HistDate | None, end: HistDate | None,
+			scale: int, imgonly: bool) -> tuple[dict[int, int], int]:
+		""" Like lookupUnitCounts(), but without using the db """
+		cols = self.distCols[imgonly].get(scale)
+		if cols is None:
+			return {}, 1
+		lo = bisect.bisect_left(cols.units, dateToUnit(start, scale)) if start else 0
+		hi = bisect.bisect_left(cols.units, dateToUnit(end, scale)) if end else len(cols.units)
+		if hi - lo <= MAX_REQ_UNIT_COUNTS:
+			return dict(zip(cols.units[lo:hi], cols.vals[lo:hi])), 1
+
+		# Sum counts into buckets, using prefix sums
+		width = getBucketWidth(cols.units[lo], cols.units[hi - 1])
+		bucketCounts: dict[int, int] = {}
+		bucketStart = cols.units[lo] // width * width
+		idx = lo
+		while idx < hi:
+			nextIdx = bisect.bisect_left(cols.units, bucketStart + width, idx, hi)
+			if nextIdx > idx:
+				bucketCounts[bucketStart] = cols.sums[nextIdx] - cols.sums[idx]
+			bucketStart = cols.units[nextIdx] // width * width if nextIdx < hi else bucketStart + width
+			idx = nextIdx
+		return bucketCounts, width
 
 # ========== For handling type=info ==========
 
@@ -352,7 +1410,7 @@ def lookupEventInfo(eventTitle: str, ctgs: list[str] | None, imgonly: bool, dbCu
 		' WHERE events.title = ? COLLATE NOCASE'
 	row = dbCur.execute(query, (eventTitle,)).fetchone()
 	if row is not None:
-		event = eventEntryToResults(row[:10])
+		event = eventEntryToResults(row[:10] + (None,))
 		desc, wikiId, url, license, artist, credit = row[10:]
 		if ctgs is not None and event.ctg not in ctgs:
 			return None
@@ -362,8 +1420,8 @@ def lookupEventInfo(eventTitle: str, ctgs: list[str] | None, imgonly: bool, dbCu
 
 # ========== For handling type=sugg ==========
 
-def handleSuggReq(params: dict[str, str], dbCur: sqlite3.Cursor):
-	""" Generates a response for a type=sugg request """
+def handleSuggReq(params: dict[str, str], dbCur: sqlite3.Cursor, suggIndex: 'SuggIndex | None' = None):
+	""" Generates a response for a type=sugg request, using 'suggIndex' for prefix search if given """
 	# Get search string
 	if  'input' not in params:
 		print('INFO: No \'input\' parameter for type=sugg request', file=sys.stderr)
@@ -385,10 +1443,11 @@ def handleSuggReq(params: dict[str, str], dbCur: sqlite3.Cursor):
 
 	ctgs = params['ctgs'].split('.') if 'ctgs' in params else None
 	imgonly = 'imgonly' in params
-	return lookupSuggs(searchStr, resultLimit, ctgs, imgonly, dbCur)
+	return lookupSuggs(searchStr, resultLimit, ctgs, imgonly, dbCur, suggIndex)
 
 def lookupSuggs(
-		searchStr: str, resultLimit: int, ctgs: list[str] | None, imgonly: bool, dbCur: sqlite3.Cursor) -> SuggResponse:
+		searchStr: str, resultLimit: int, ctgs: list[str] | None, imgonly: bool, dbCur: sqlite3.Cursor,
+		suggIndex: 'SuggIndex | None' = None) -> SuggResponse:
 	""" For a search string, returns a SuggResponse describing search suggestions """
 	tempLimit = resultLimit + 1 # For determining if 'more suggestions exist'
 	query = 'SELECT title FROM events LEFT JOIN pop ON events.id = pop.id' \
@@ -400,13 +1459,26 @@ def lookupSuggs(
 	suggs: list[str] = []
 
 	# Prefix search
-	params = [searchStr + '%'] + (ctgs if ctgs is not None else [])
-	for (title,) in dbCur.execute(query, params):
-		suggs.append(title)
+	if suggIndex is not None and '%' not in searchStr and '_' not in searchStr: # The index doesn't handle wildcards
+		suggs = suggIndex.lookupPrefix(searchStr, tempLimit, ctgs, imgonly)
+	else:
+		params = [searchStr + '%'] + (ctgs if ctgs is not None else [])
+		for (title,) in dbCur.execute(query, params):
+			suggs.append(title)
 
 	# If insufficient results, try substring search
 	if len(suggs) < tempLimit:
 		existing = set(suggs)
+		if len(searchStr) >= 3 and tableExists('events_fts', dbCur):
+			# Use trigram index to avoid a full scan of 'events' (shorter strings have no trigrams to look up)
+			# Rowids are popularity ranks, so matches are read in order, stopping after the limit
+			# (ordering by popularity would read and sort every match, which for common trigrams is most titles)
+			query = 'SELECT title FROM events_fts' \
+				+ (' INNER JOIN event_imgs ON events_fts.id = event_imgs.id' if imgonly else '') \
+				+ ' WHERE title LIKE ?'
+			if ctgs is not None:
+				query += ' AND ctg IN (' + ','.join('?' * len(ctgs)) + ')'
+			query += f' ORDER BY events_fts.rowid LIMIT {tempLimit}'
 		params = ['%' + searchStr + '%'] + (ctgs if ctgs is not None else [])
 		for (title,) in dbCur.execute(query, params):
 			if title not in existing:
@@ -415,3 +1487,81 @@ def lookupSuggs(
 					break
 
 	return SuggResponse(suggs[:resultLimit], len(suggs) > resultLimit)
+
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+	# For case-folding like SQLite's LIKE, which treats non-ASCII letters as case-sensitive
+
+class SuggIndex:
+	"""
+	Holds event titles in memory, for answering prefix searches without querying the db.
+	Titles are case-folded and sorted, allowing prefix matches to be found using bisection.
+	For short prefixes, the most popular matches are precomputed.
+
+	Matches are the same as for SQLite's LIKE, which only ignores the case of ASCII letters.
+	Search strings with LIKE wildcards ('%' and '_') aren't handled (see lookupSuggs()).
+	"""
+	def __init__(self, dbCur: sqlite3.Cursor):
+		query = 'SELECT title, ctg, pop.pop, event_imgs.id IS NOT NULL FROM events' \
+			' LEFT JOIN pop ON events.id = pop.id LEFT JOIN event_imgs ON events.id = event_imgs.id'
+		rows = sorted((title.translate(ASCII_LOWER), title, ctg, -1 if pop is None else pop, hasImg)
+			for title, ctg, pop, hasImg in dbCur.execute(query))
+		self.keys: list[str] = [row[0] for row in rows] # Case-folded titles
+		self.titles: list[str] = [row[1] for row in rows]
+		self.ctgs: list[str] = [row[2] for row in rows]
+		self.pops = array('q', (row[3] for row in rows)) # Uses -1 for no popularity value
+		self.hasImgs = bytearray(row[4] for row in rows)
+		del rows
+
+		# Precompute most popular matches for prefixes
+		self.topMatches: dict[str, list[int]] = {} # Maps prefixes to title indices, ordered by popularity
+		self.numMatches: dict[str, int] = {} # Maps prefixes to their total number of matches
+		numTop = MAX_REQ_SUGGS + 1
+		for prefixLen in range(1, SUGG_INDEX_PREFIX_LEN + 1):
+			startIdx = 0
+			while startIdx < len(self.keys):
+				if len(self.keys[startIdx]) < prefixLen:
+					startIdx += 1
+					continue
+				prefix = self.keys[startIdx][:prefixLen]
+				endIdx = self.prefixEnd(prefix, startIdx)
+				self.topMatches[prefix] = heapq.nlargest(numTop, range(startIdx, endIdx), key=self.pops.__getitem__)
+				self.numMatches[prefix] = endIdx - startIdx
+				startIdx = endIdx
+
+		print(f'INFO: Loaded suggestion index for {len(self.keys)} titles and {len(self.topMatches)} prefixes,' \
+			f' using about {self.memoryUsage() / 2**20:.1f} MiB', file=sys.stderr)
+
+	def prefixEnd(self, prefix: str, startIdx: int) -> int:
+		""" Returns the index after the last key that starts with 'prefix', searching from 'startIdx' """
+		return bisect.bisect_left(self.keys, prefix + '\U0010ffff', startIdx)
+
+	def memoryUsage(self) -> int:
+		""" Returns an approximate number of bytes used by the index """
+		numBytes = sum(sys.getsizeof(x) for x in [self.keys, self.titles, self.ctgs, self.pops, self.hasImgs])
+		numBytes += sum(sys.getsizeof(key) for key in self.keys)
+		numBytes += sum(sys.getsizeof(title) for key, title in zip(self.keys, self.titles) if title is not key)
+		numBytes += sys.getsizeof(self.topMatches) + sys.getsizeof(self.numMatches)
+		numBytes += sum(sys.getsizeof(prefix) + sys.getsizeof(idxs) for prefix, idxs in self.topMatches.items())
+		return numBytes
+
+	def lookupPrefix(self, searchStr: str, resultLimit: int, ctgs: list[str] | None, imgonly: bool) -> list[str]:
+		""" Returns titles that start with a search string, ordered by popularity,
+			and restricted by event category and image presence """
+		prefix = searchStr.translate(ASCII_LOWER)
+		def isValid(idx: int) -> bool:
+			return (ctgs is None or self.ctgs[idx] in ctgs) and (not imgonly or self.hasImgs[idx] == 1)
+
+		# Try precomputed matches
+		if prefix in self.topMatches:
+			idxs = [idx for idx in self.topMatches[prefix] if isValid(idx)]
+			if len(idxs) >= resultLimit or len(self.topMatches[prefix]) == self.numMatches[prefix]:
+				return [self.titles[idx] for idx in idxs[:resultLimit]]
+		elif len(prefix) <= SUGG_INDEX_PREFIX_LEN:
+			return [] # No title has this prefix
+
+		# Search all matches
+		startIdx = bisect.bisect_left(self.keys, prefix)
+		endIdx = self.prefixEnd(prefix, startIdx)
+		idxs = heapq.nlargest(
+			resultLimit, filter(isValid, range(startIdx, endIdx)), key=self.pops.__getitem__)
+		return [self.titles[idx] for idx in idxs]
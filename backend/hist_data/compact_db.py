@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+
+"""
+Writes a copy of the database for serving, holding only the tables and indexes used by the server.
+
+Tables keyed by event ID are stored using the ID as the rowid, and tables with
+composite keys are stored as WITHOUT ROWID tables, which avoids storing keys twice.
+Rows are inserted in key order, which is the order the server reads them in.
+The result is vacuumed, analyzed, and made read-only.
+
+Prints a report comparing file sizes and request latencies.
+"""
+
+# Resolve imports of modules in the parent directory
+import os
+import sys
+parentDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(parentDir)
+
+import argparse
+import random
+import sqlite3
+import stat
+import statistics
+import time
+
+import chrona
+
+DB_FILE = 'data.db'
+OUT_FILE = 'data_serving.db'
+PAGE_SIZE = 8192 # Larger than the default, to reduce b-tree depth for range reads
+NUM_REPORT_REQS = 300 # Number of requests of each type to time for the report
+
+# Maps table names to a creation command, and a key to order rows by
+TABLES: dict[str, tuple[str, str]] = {
+	'events': ('CREATE TABLE events (id INTEGER PRIMARY KEY, title TEXT, ' \
+		'start INT, start_upper INT, end INT, end_upper INT, fmt INT, ctg TEXT)', 'id'),
+	'pop': ('CREATE TABLE pop (id INTEGER PRIMARY KEY, pop INT)', 'id'),
+	'event_imgs': ('CREATE TABLE event_imgs (id INTEGER PRIMARY KEY, img_id INT)', 'id'),
+	'images': ('CREATE TABLE images (id INTEGER PRIMARY KEY, url TEXT, license TEXT, artist TEXT, credit TEXT)', 'id'),
+	'descs': ('CREATE TABLE descs (id INTEGER PRIMARY KEY, wiki_id INT, desc TEXT)', 'id'),
+	'dist': ('CREATE TABLE dist (scale INT, unit INT, count INT, PRIMARY KEY (scale, unit)) WITHOUT ROWID',
+		'scale, unit'),
+	'img_dist': ('CREATE TABLE img_dist (scale INT, unit INT, count INT, PRIMARY KEY (scale, unit)) WITHOUT ROWID',
+		'scale, unit'),
+	'event_disp': ('CREATE TABLE event_disp (id INT, scale INT, unit INT, PRIMARY KEY (id, scale)) WITHOUT ROWID',
+		'id, scale'),
+	'img_disp': ('CREATE TABLE img_disp (id INT, scale INT, unit INT, PRIMARY KEY (id, scale)) WITHOUT ROWID',
+		'id, scale'),
+	'dist_sums': ('CREATE TABLE dist_sums (ctg TEXT, scale INT, unit INT, cumul_count INT, ' \
+		'PRIMARY KEY (ctg, scale, unit)) WITHOUT ROWID', 'ctg, scale, unit'),
+	'img_dist_sums': ('CREATE TABLE img_dist_sums (ctg TEXT, scale INT, unit INT, cumul_count INT, ' \
+		'PRIMARY KEY (ctg, scale, unit)) WITHOUT ROWID', 'ctg, scale, unit'),
+	'disp_events': ('CREATE TABLE disp_events (imgonly INT, scale INT, unit INT, pop INT, id INT, title TEXT,' \
+		' start INT, start_upper INT, end INT, end_upper INT, fmt INT, ctg TEXT, img_id INT,' \
+		' PRIMARY KEY (imgonly, scale, unit, pop DESC, id)) WITHOUT ROWID', 'imgonly, scale, unit, pop DESC, id'),
+	'event_atlas': ('CREATE TABLE event_atlas (id INT, scale INT, atlas TEXT, x INT, y INT, ' \
+		'PRIMARY KEY (id, scale)) WITHOUT ROWID', 'id, scale'),
+}
+# Maps table names to indexes to create on them
+INDEXES: dict[str, list[str]] = {
+	'events': ['CREATE INDEX events_title_nocase_idx ON events(title COLLATE NOCASE)'],
+	'event_disp': ['CREATE INDEX event_disp_scale_unit_idx ON event_disp(scale, unit)'],
+	'img_disp': ['CREATE INDEX img_disp_scale_unit_idx ON img_disp(scale, unit)'],
+}
+
+def compactDb(dbFile: str, outFile: str, pageSize: int) -> None:
+	""" Writes a serving copy of 'dbFile' to 'outFile' """
+	if os.path.exists(outFile):
+		print('ERROR: Output database already exists')
+		return
+
+	print('Opening dbs')
+	dbCon = sqlite3.connect(outFile)
+	dbCur = dbCon.cursor()
+	dbCur.execute(f'PRAGMA page_size = {pageSize}')
+	dbCur.execute('PRAGMA journal_mode = OFF')
+	dbCur.execute('ATTACH DATABASE ? AS src', (dbFile,))
+	srcTables = {name: sql for name, sql in dbCur.execute('SELECT name, sql FROM src.sqlite_master WHERE type = "table"')}
+
+	for tableName, (createCmd, orderBy) in TABLES.items():
+		if tableName not in srcTables:
+			print(f'Skipping missing table {tableName}')
+			continue
+		print(f'Copying {tableName}')
+		dbCur.execute(createCmd)
+		dbCur.execute(f'INSERT INTO main.{tableName} SELECT * FROM src.{tableName} ORDER BY {orderBy}')
+		for indexCmd in INDEXES.get(tableName, []):
+			dbCur.execute(indexCmd)
+	if 'events_fts' in srcTables:
+		print('Copying events_fts')
+		dbCur.execute(srcTables['events_fts'])
+		dbCur.execute('INSERT INTO main.events_fts (rowid, title, id, ctg)' \
+			' SELECT rowid, title, id, ctg FROM src.events_fts ORDER BY rowid')
+		dbCur.execute('INSERT INTO main.events_fts (events_fts) VALUES ("optimize")')
+	dbCon.commit()
+	dbCur.execute('DETACH DATABASE src')
+
+	print('Vacuuming and analyzing')
+	dbCur.execute('VACUUM')
+	dbCur.execute('ANALYZE')
+	dbCon.commit()
+	dbCon.close()
+	os.chmod(outFile, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+def genReportQueries(dbFile: str, numReqs: int) -> dict[str, list[str]]:
+	""" Generates query strings for a sample of requests of each type, using events in a db """
+	random.seed(0)
+	dbCon = sqlite3.connect(dbFile)
+	dbCur = dbCon.cursor()
+	titles = [title for (title,) in dbCur.execute(
+		f'SELECT title FROM events WHERE id IN (SELECT id FROM event_disp) ORDER BY random() LIMIT {numReqs}')]
+	years = [unit for (unit,) in dbCur.execute(
+		f'SELECT unit FROM dist WHERE scale = 1 ORDER BY random() LIMIT {numReqs}')]
+	dbCon.close()
+	eventsQueries = []
+	for year in years:
+		span = random.choice([1, 10, 100])
+		imgonly = '&imgonly=true' if random.random() < 0.5 else ''
+		eventsQueries.append(f'type=events&range={year}.{year + span}&scale=1{imgonly}')
+	return {
+		'events': eventsQueries,
+		'info': ['type=info&event=' + title for title in titles],
+		'sugg': ['type=sugg&input=' + title[:random.randint(1, 5)] for title in titles],
+	}
+
+def timeQueries(dbFile: str, queryStrs: list[str]) -> list[float]:
+	""" Returns request latencies in milliseconds """
+	times: list[float] = []
+	for queryStr in queryStrs:
+		startTime = time.perf_counter()
+		chrona.handleReq(dbFile, {'QUERY_STRING': queryStr})
+		times.append((time.perf_counter() - startTime) * 1000)
+	return times
+
+def printReport(dbFile: str, outFile: str, numReqs: int) -> None:
+	""" Prints file sizes and request latencies for the original and compacted dbs """
+	print(f'Size: {os.path.getsize(dbFile) / 1e6:.1f} MB -> {os.path.getsize(outFile) / 1e6:.1f} MB')
+	print('Latency in ms (median and 95th percentile, before -> after)')
+	for reqType, queryStrs in genReportQueries(dbFile, numReqs).items():
+		if not queryStrs:
+			continue
+		results = []
+		for file in [dbFile, outFile]:
+			timeQueries(file, queryStrs[:10]) # Warm up cache
+			times = sorted(timeQueries(file, queryStrs))
+			results.append((statistics.median(times), times[int(len(times) * 0.95)]))
+		(median1, p95_1), (median2, p95_2) = results
+		print(f'{reqType:8} {median1:7.3f} -> {median2:7.3f}  {p95_1:7.3f} -> {p95_2:7.3f}')
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--out', default=OUT_FILE, help='File to write the serving db to')
+	parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help='Page size for the serving db')
+	parser.add_argument('--no-report', action='store_true', help='Skip printing a size and latency report')
+	args = parser.parse_args()
+
+	compactDb(DB_FILE, args.out, args.page_size)
+	if not args.no_report:
+		printReport(DB_FILE, args.out, NUM_REPORT_REQS)
@@ -91,15 +91,42 @@ def genData(dbFile: str, scales: list[int], maxDisplayedPerUnit: int, forImageTa
 	for (scale, unit), (count, _) in scaleUnitToCounts.items():
 		dbCur.execute(f'INSERT INTO {distTable} VALUES (?, ?, ?)', (scale, unit, count))
 	dbCur.execute(f'CREATE TABLE {dispTable} (id INT, scale INT, unit INT, PRIMARY KEY (id, scale))')
-	dbCur.execute(f'CREATE INDEX {dispTable}_scale_unit_idx ON event_disp(scale, unit)')
+	dbCur.execute(f'CREATE INDEX {dispTable}_scale_unit_idx ON {dispTable}(scale, unit)')
 	for eventId, scaleUnits in idScales.items():
 		for [scale, unit] in scaleUnits:
 			dbCur.execute(f'INSERT INTO {dispTable} VALUES (?, ?, ?)', (eventId, scale, unit))
 
+	print('Writing cumulative counts')
+	genSumData(dbCur, scales, forImageTables)
+
 	print('Closing db')
 	dbCon.commit()
 	dbCon.close()
 
+def genSumData(dbCur: sqlite3.Cursor, scales: list[int], forImageTables: bool) -> None:
+	""" (Re)creates a table of cumulative event counts, for each event category (and '' for all),
+		scale, and unit, using events in the 'event_disp' or 'img_disp' table """
+	dispTable = 'event_disp' if not forImageTables else 'img_disp'
+	sumsTable = 'dist_sums' if not forImageTables else 'img_dist_sums'
+	ctgScaleToCounts: dict[tuple[str, int], dict[int, int]] = {} # Maps category and scale to unit counts
+	query = f'SELECT start, fmt, ctg FROM events WHERE id IN (SELECT id FROM {dispTable})'
+	for eventStart, fmt, ctg in dbCur.execute(query):
+		date = dbDateToHistDate(eventStart, fmt)
+		for scale in scales:
+			unit = dateToUnit(date, scale)
+			for key in [('', scale), (ctg, scale)]:
+				unitCounts = ctgScaleToCounts.setdefault(key, {})
+				unitCounts[unit] = unitCounts.get(unit, 0) + 1
+
+	dbCur.execute(f'DROP TABLE IF EXISTS {sumsTable}')
+	dbCur.execute(f'CREATE TABLE {sumsTable} (ctg TEXT, scale INT, unit INT, cumul_count INT,' \
+		' PRIMARY KEY (ctg, scale, unit))')
+	for (ctg, scale), unitCounts in ctgScaleToCounts.items():
+		cumulCount = 0
+		for unit in sorted(unitCounts):
+			cumulCount += unitCounts[unit]
+			dbCur.execute(f'INSERT INTO {sumsTable} VALUES (?, ?, ?, ?)', (ctg, scale, unit, cumulCount))
+
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
 	parser.add_argument(
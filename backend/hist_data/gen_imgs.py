@@ -2,22 +2,38 @@
 
 """
 Looks at images described by a database, and generates resized/cropped versions
-into an output directory, with names of the form 'eventId1.jpg'.
-Adds the image associations and metadata to the history database.
+into an output directory, with names of the form 'imgId1.jpg'.
+Also generates variants in other sizes and formats, with names of the form 'imgId1-64.webp'.
+Adds the image associations and metadata to the history database, along with the byte sizes of variants.
 
 SIGINT can be used to stop, and the program can be re-run to continue
-processing. It uses already-existing database entries to decide what
-to skip.
+processing. Per-image conversion results are recorded in the database, and used
+to skip completed conversions, and to retry failed ones a limited number of times.
+
+With --atlases, instead packs generated images into atlas images, each holding images of events
+displayable within a tile of consecutive units on a scale, and records their positions in the database.
+This lets the client load a screen of event images using a few requests.
+
+With --variants, instead generates missing variants of already-generated images,
+and records variant byte sizes in the database.
 """
 
-# Note: Took about 10 hours to process about 60k images
+# Note: Took about 10 hours to process about 60k images, when run sequentially using smartcrop-cli
 
+from typing import Iterable
 import argparse
+import hashlib
+import io
+import itertools
+import operator
 import os
-import subprocess
 import signal
 import sqlite3
+import time
 import urllib.parse
+from concurrent.futures import BrokenExecutor, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from PIL import Image, ImageChops, ImageFilter, ImageOps
 
 IMG_DIR = os.path.join('enwiki', 'imgs')
 IMG_DB = os.path.join('enwiki', 'img_data.db')
@@ -25,42 +41,95 @@ OUT_DIR = 'img'
 DB_FILE = 'data.db'
 
 IMG_OUT_SZ = 200
+IMG_VARIANT_SIZES = [64, 128, 200, 400] # Widths/heights of generated variants
+IMG_VARIANT_FORMATS = {'webp': 80, 'jpg': 85} # Maps variant file extensions to encoding qualities
+IMG_CROP_SZ = max(IMG_VARIANT_SIZES) # Size of the initial crop, which variants are resized from
+MAX_CONVERT_ATTEMPTS = 3 # Number of runs that try converting an image before it's no longer retried
+# For choosing crops (weights and importance function are like those of smartcrop.js)
+CROP_ANALYSIS_SZ = 256 # Images are downscaled to this size along their longer side when choosing crops
+CROP_NUM_CANDIDATES = 64 # Rough number of crop positions to score
+CROP_DETAIL_WEIGHT = 0.2
+CROP_SKIN_WEIGHT = 1.8
+CROP_SATURATION_WEIGHT = 0.1
+CROP_OUTSIDE_IMPORTANCE = -0.5
+CROP_EDGE_RADIUS = 0.4
+CROP_EDGE_WEIGHT = -20
+ATLAS_DIR = 'atlas' # Subdirectory of the output directory that holds atlases
+ATLAS_TILE_UNITS = 4 # Number of consecutive units on a scale that share an atlas
+ATLAS_COLS = 8 # Number of images in each row of an atlas (the client assumes this width)
+ATLAS_QUALITY = 85
 
-def genImgs(imgDir: str, imgDb: str, outDir: str, dbFile: str):
-	""" Converts images and updates db, checking for entries to skip """
+def genImgs(imgDir: str, imgDb: str, outDir: str, dbFile: str, numWorkers: int = os.cpu_count() or 1):
+	""" Converts images and updates db, using a manifest of past conversions to decide what to skip or retry """
 	if not os.path.exists(outDir):
 		os.mkdir(outDir)
 	dbCon = sqlite3.connect(dbFile)
 	dbCur = dbCon.cursor()
 
 	print('Checking for image tables')
-	eventsDone: set[int] = set()
-	imgsDone: set[int] = set()
-	if dbCur.execute('SELECT name FROM sqlite_master WHERE type="table" AND name="event_imgs"').fetchone() is None:
-		# Add image tables
-		dbCur.execute('CREATE TABLE event_imgs (id INT PRIMARY KEY, img_id INT)')
-		dbCur.execute('CREATE TABLE images (id INT PRIMARY KEY, url TEXT, license TEXT, artist TEXT, credit TEXT)')
-	else:
-		# Get existing image-associated events
-		for (eventId,) in dbCur.execute('SELECT id FROM event_imgs'):
-			eventsDone.add(eventId)
-		# Get existing event-associated images
-		for (imgId,) in dbCur.execute('SELECT id from images'):
-			imgsDone.add(imgId)
-		print(f'Found {len(eventsDone)} events and {len(imgsDone)} images to skip')
+	dbCur.execute('CREATE TABLE IF NOT EXISTS event_imgs (id INT PRIMARY KEY, img_id INT)')
+	dbCur.execute('CREATE TABLE IF NOT EXISTS images (id INT PRIMARY KEY, url TEXT, license TEXT, artist TEXT, credit TEXT)')
+	dbCur.execute('CREATE TABLE IF NOT EXISTS img_manifest' \
+		' (img_id INT PRIMARY KEY, status TEXT, attempts INT, duration REAL, bytes INT)')
+
+	print('Getting images to convert')
+	jobs = getImgJobs(imgDir, imgDb, dbCur)
 
 	print('Processing images')
-	processImgs(imgDir, imgDb, outDir, dbCur, eventsDone, imgsDone)
+	processImgs(jobs, imgDir, outDir, dbCur, numWorkers)
+
+	print('Recording variant sizes')
+	genVariantData(dbCur, outDir)
 
 	dbCon.commit()
 	dbCon.close()
 
-def processImgs(imgDir: str, imgDb: str, outDir: str, dbCur: sqlite3.Cursor,
-		eventsDone: set[int], imgsDone: set[int]) -> bool:
-	""" Converts images and updates db, returning False upon interruption or failure """
-	imgDbCon = sqlite3.connect(imgDb)
-	imgDbCur = imgDbCon.cursor()
+# Holds an image ID, an input filename, the events to associate the image with,
+# image metadata (name, license, artist, and credit), and the number of past conversion attempts
+ImgJob = tuple[int, str, list[int], tuple[str, str, str, str], int]
 
+def getImgJobs(imgDir: str, imgDb: str, dbCur: sqlite3.Cursor) -> list[ImgJob]:
+	""" Returns conversions to do, for images of events without images. Associates already-converted
+		images with events directly, and records images without input files as skipped. """
+	imgFiles = {int(os.path.splitext(imgFile)[0]): imgFile for imgFile in os.listdir(imgDir)}
+	imgsDone = {imgId for (imgId,) in dbCur.execute('SELECT id FROM images')}
+	manifest = {imgId: (status, attempts) for imgId, status, attempts
+		in dbCur.execute('SELECT img_id, status, attempts FROM img_manifest')}
+	dbCur.execute('ATTACH DATABASE ? AS img_db', (imgDb,))
+	query = 'SELECT imgs.id, imgs.name, imgs.license, imgs.artist, imgs.credit, events.id FROM img_db.imgs' \
+		' INNER JOIN img_db.page_imgs ON imgs.name = page_imgs.img_name' \
+		' INNER JOIN events ON page_imgs.title = events.title' \
+		' LEFT JOIN event_imgs ON events.id = event_imgs.id WHERE event_imgs.id IS NULL ORDER BY imgs.id'
+	rows = dbCur.execute(query).fetchall()
+	dbCur.execute('DETACH DATABASE img_db')
+
+	jobs: list[ImgJob] = []
+	numSkipped, numGivenUp = 0, 0
+	for imgId, imgRows in itertools.groupby(rows, key=lambda row: row[0]):
+		imgRows = list(imgRows)
+		eventIds = [row[5] for row in imgRows]
+		_, name, license, artist, credit, _ = imgRows[0]
+		status, attempts = manifest.get(imgId, (None, 0))
+		if imgId in imgsDone:
+			for eventId in eventIds:
+				dbCur.execute('INSERT INTO event_imgs VALUES (?, ?)', (eventId, imgId))
+		elif imgId not in imgFiles:
+			dbCur.execute('INSERT OR REPLACE INTO img_manifest VALUES (?, ?, ?, NULL, NULL)',
+				(imgId, 'skipped', attempts))
+			numSkipped += 1
+		elif status == 'failed' and attempts >= MAX_CONVERT_ATTEMPTS:
+			numGivenUp += 1
+		else:
+			jobs.append((imgId, imgFiles[imgId], eventIds, (name, license, artist, credit), attempts))
+	print(f'Found {len(jobs)} images to convert, {numSkipped} without input files,' \
+		f' and {numGivenUp} that failed {MAX_CONVERT_ATTEMPTS} times')
+	return jobs
+
+def processImgs(jobs: list[ImgJob], imgDir: str, outDir: str, dbCur: sqlite3.Cursor, numWorkers: int) -> bool:
+	""" Converts images using a pool of processes, and updates db, returning False upon interruption.
+		Results are recorded in the 'img_manifest' table, and failures don't stop other conversions.
+		Conversions that are underway when stopping are allowed to finish, and are recorded.
+		If the pool stops working, no more conversions are submitted. """
 	# Set SIGINT handler
 	interrupted = False
 	def onSigint(sig, frame):
@@ -68,78 +137,307 @@ def processImgs(imgDir: str, imgDb: str, outDir: str, dbCur: sqlite3.Cursor,
 		interrupted = True
 	signal.signal(signal.SIGINT, onSigint)
 
+	pending: dict[Future[tuple[bool, float, int]], ImgJob] = {}
+	failedIds: list[int] = []
+	numRecorded = 0
+	def recordConversions(futures: Iterable[Future[tuple[bool, float, int]]]):
+		""" Adds images, event associations, and manifest entries to the db for finished conversions """
+		nonlocal numRecorded
+		for future in futures:
+			imgId, _, eventIds, (name, license, artist, credit), attempts = pending.pop(future)
+			try:
+				success, duration, numBytes = future.result()
+			except Exception as e: # Eg: BrokenProcessPool, if a worker process was killed
+				print(f'ERROR: Conversion of image ID {imgId} raised {e!r}')
+				success, duration, numBytes = False, None, None
+			if success:
+				url = 'https://en.wikipedia.org/wiki/File:' + urllib.parse.quote(name)
+				dbCur.execute('INSERT INTO images VALUES (?, ?, ?, ?, ?)', (imgId, url, license, artist, credit))
+				for eventId in eventIds:
+					dbCur.execute('INSERT INTO event_imgs VALUES (?, ?)', (eventId, imgId))
+			else:
+				failedIds.append(imgId)
+			dbCur.execute('INSERT OR REPLACE INTO img_manifest VALUES (?, ?, ?, ?, ?)',
+				(imgId, 'done' if success else 'failed', attempts + 1, duration, numBytes))
+			numRecorded += 1
+			if numRecorded % 100 == 0:
+				print(f'At image {numRecorded} of {len(jobs)}')
+				dbCur.connection.commit() # Limits the work lost if the process is killed
+
 	# Convert images
-	flag = False # Set to True upon interruption or failure
-	for imgFile in os.listdir(imgDir):
-		# Check for SIGINT event
-		if interrupted:
-			print('Exiting')
-			flag = True
-			break
-
-		# Get image ID
-		imgIdStr, _ = os.path.splitext(imgFile)
-		imgId = int(imgIdStr)
-
-		# Get associated events
-		eventIds: set[int] = set()
-		query = 'SELECT title FROM page_imgs INNER JOIN imgs ON page_imgs.img_name = imgs.name WHERE imgs.id = ?'
-		for (title,) in imgDbCur.execute(query, (imgId,)):
-			row = dbCur.execute('SELECT id FROM events WHERE title = ?', (title,)).fetchone()
-			if row is None:
-				print('ERROR: No event ID found for title {title} associated with image {imgFile}')
-				continue
-			eventIds.add(row[0])
-		eventIds = eventIds.difference(eventsDone)
-		if not eventIds:
-			continue
+	if numWorkers > 1: # Workers ignore SIGINT, leaving the main process to stop submitting conversions
+		executor: Executor = ProcessPoolExecutor(numWorkers, initializer=signal.signal,
+			initargs=(signal.SIGINT, signal.SIG_IGN))
+	else:
+		executor = ThreadPoolExecutor(1)
+	try:
+		with executor:
+			for job in jobs:
+				if interrupted:
+					print('Exiting')
+					break
+				imgId, imgFile = job[0], job[1]
+				removeVariants(outDir, imgId) # Removes output from an earlier unrecorded or failed conversion
+				try:
+					future = executor.submit(
+						runConversion, os.path.join(imgDir, imgFile), os.path.join(outDir, str(imgId) + '.jpg'))
+				except BrokenExecutor:
+					print('ERROR: Conversion pool stopped working, exiting')
+					interrupted = True
+					break
+				pending[future] = job
+				if len(pending) >= numWorkers * 2: # Limits the conversions that are queued when stopping
+					done, _ = wait(pending, return_when=FIRST_COMPLETED)
+					recordConversions(done)
+			done, _ = wait(pending)
+			recordConversions(done)
+	finally:
+		dbCur.connection.commit()
+
+	print(f'Converted {numRecorded - len(failedIds)} images, with {len(failedIds)} failures')
+	if failedIds:
+		print(f'Failed image IDs (retried on re-runs, up to {MAX_CONVERT_ATTEMPTS} attempts): ' \
+			+ ', '.join(str(imgId) for imgId in failedIds[:20]) + (', ...' if len(failedIds) > 20 else ''))
+	return not interrupted
+
+def runConversion(imgPath: str, outPath: str) -> tuple[bool, float, int]:
+	""" Converts an image, and returns whether it succeeded, the seconds taken, and the bytes of output """
+	startTime = time.perf_counter()
+	success = convertImage(imgPath, outPath)
+	duration = time.perf_counter() - startTime
+	numBytes = 0
+	if success:
+		outDir = os.path.dirname(outPath)
+		imgId = int(os.path.splitext(os.path.basename(outPath))[0])
+		for size in IMG_VARIANT_SIZES:
+			for ext in IMG_VARIANT_FORMATS:
+				variantPath = os.path.join(outDir, getVariantName(imgId, size, ext))
+				if os.path.exists(variantPath):
+					numBytes += os.path.getsize(variantPath)
+	return success, duration, numBytes
 
-		# Convert image
-		if imgId not in imgsDone:
-			success = convertImage(os.path.join(imgDir, imgFile), os.path.join(outDir, str(imgId) + '.jpg'))
-			if not success:
-				flag = True
-				break
-
-			# Add image to db
-			row = imgDbCur.execute('SELECT name, license, artist, credit FROM imgs WHERE id = ?', (imgId,)).fetchone()
-			if row is None:
-				print(f'ERROR: No image record for ID {imgId}')
-				flag = True
-				break
-			name, license, artist, credit = row
-			url = 'https://en.wikipedia.org/wiki/File:' + urllib.parse.quote(name)
-			dbCur.execute('INSERT INTO images VALUES (?, ?, ?, ?, ?)', (imgId, url, license, artist, credit))
-
-		# Add event association to db
-		for eventId in eventIds:
-			dbCur.execute('INSERT INTO event_imgs VALUES (?, ?)', (eventId, imgId))
-
-	imgDbCon.close()
-	return not flag
+def removeVariants(outDir: str, imgId: int) -> None:
+	for size in IMG_VARIANT_SIZES:
+		for ext in IMG_VARIANT_FORMATS:
+			variantPath = os.path.join(outDir, getVariantName(imgId, size, ext))
+			if os.path.exists(variantPath):
+				os.remove(variantPath)
 
 def convertImage(imgPath: str, outPath: str):
-	""" Converts an image using smartcrop """
+	""" Converts an image to a square crop, then generates variants (with 'outPath' getting the default variant) """
 	print(f'Converting {imgPath} to {outPath}')
 	if os.path.exists(outPath):
 		print('ERROR: Output image already exists')
 		return False
 
 	try:
-		completedProcess = subprocess.run(
-			['npx', 'smartcrop-cli', '--width', str(IMG_OUT_SZ), '--height', str(IMG_OUT_SZ), imgPath, outPath],
-			stdout=subprocess.DEVNULL
-		)
+		with Image.open(imgPath) as img:
+			img.draft('RGB', (IMG_CROP_SZ, IMG_CROP_SZ)) # Lets JPEGs be decoded at a reduced scale
+			img = ImageOps.exif_transpose(img).convert('RGB')
+			img = img.crop(findCrop(img))
+			size = min(max(img.width, IMG_OUT_SZ), IMG_CROP_SZ)
+			saveVariants(img.resize((size, size), Image.LANCZOS), outPath)
 	except Exception as e:
-		print(f'ERROR: Exception while attempting to run smartcrop: {e}')
+		print(f'ERROR: Unable to convert {imgPath}: {e}')
 		return False
-	if completedProcess.returncode != 0:
-		print(f'ERROR: smartcrop had exit status {completedProcess.returncode}')
+	return True
+
+def findCrop(img: Image.Image) -> tuple[int, int, int, int]:
+	""" Returns the box of a square crop of an RGB image, spanning its shorter side, and positioned along
+		its longer side to contain edge detail, skin tones, and saturated colours (similar to smartcrop) """
+	cropSz = min(img.size)
+	isWide = img.width > img.height
+	if img.width == img.height:
+		return (0, 0, cropSz, cropSz)
+
+	# Get feature values along the longer side, averaged over the shorter side
+	scale = min(CROP_ANALYSIS_SZ / max(img.size), 1)
+	small = img.resize((max(round(img.width * scale), 1), max(round(img.height * scale), 1)), Image.BOX)
+	edges = ImageOps.grayscale(small).filter(ImageFilter.FIND_EDGES)
+	_, cb, cr = small.convert('YCbCr').split()
+	skin = ImageChops.multiply(
+		cb.point(lambda x: 255 if 77 <= x <= 127 else 0), cr.point(lambda x: 255 if 133 <= x <= 173 else 0))
+	_, sat, val = small.convert('HSV').split()
+	sat = ImageChops.multiply(sat, val.point(lambda x: 255 if 13 <= x <= 230 else 0))
+	profiles = []
+	for feature in [edges, skin, sat]:
+		profile = feature.resize((feature.width, 1) if isWide else (1, feature.height), Image.BOX).getdata()
+		profiles.append([x / 255 for x in profile])
+	weights = [CROP_DETAIL_WEIGHT, CROP_SKIN_WEIGHT, CROP_SATURATION_WEIGHT]
+	profile = [sum(w * p[i] for w, p in zip(weights, profiles)) for i in range(len(profiles[0]))]
+
+	# Score crop positions, weighting features by their importance within each crop
+	length = len(profile)
+	windowLen = min(max(round(cropSz * scale), 1), length)
+	importances = [cropImportance((i + 0.5) / windowLen) for i in range(windowLen)]
+	total = sum(profile)
+	step = max((length - windowLen) // CROP_NUM_CANDIDATES, 1)
+	bestScore, bestStart = float('-inf'), 0
+	for start in range(0, length - windowLen + 1, step):
+		window = profile[start:start + windowLen]
+		score = sum(map(operator.mul, window, importances)) + (total - sum(window)) * CROP_OUTSIDE_IMPORTANCE
+		if score > bestScore:
+			bestScore, bestStart = score, start
+	offset = min(round(bestStart / scale), max(img.size) - cropSz)
+	return (offset, 0, offset + cropSz, cropSz) if isWide else (0, offset, cropSz, offset + cropSz)
+
+def cropImportance(x: float) -> float:
+	""" Returns a weight for a feature at relative position 'x' along a crop (0 and 1 being its ends).
+		Features near the centre and thirds weigh most, and those near the ends weigh negatively. """
+	px = abs(0.5 - x) * 2
+	dx = max(px - 1 + CROP_EDGE_RADIUS, 0)
+	edgePenalty = dx * dx * CROP_EDGE_WEIGHT
+	score = 1 - px
+	thirds = ((px - 1 / 3 + 1) % 2 * 0.5 - 0.5) * 16
+	score += max(0, score + edgePenalty + 0.5) * 1.2 * max(1 - thirds * thirds, 0)
+	return score + edgePenalty
+
+def getVariantName(imgId: int, size: int, ext: str) -> str:
+	""" Returns the filename of an image variant (the default variant being named like 'imgId1.jpg') """
+	if size == IMG_OUT_SZ and ext == 'jpg':
+		return f'{imgId}.jpg'
+	return f'{imgId}-{size}.{ext}'
+
+def genVariants(imgPath: str) -> bool:
+	""" Generates missing variants of an image named like 'imgId1.jpg', with the image being replaced
+		by the default variant if needed """
+	try:
+		with Image.open(imgPath) as img:
+			saveVariants(img.convert('RGB'), imgPath)
+	except Exception as e:
+		print(f'ERROR: Unable to generate variants of {imgPath}: {e}')
 		return False
 	return True
 
+def saveVariants(img: Image.Image, imgPath: str) -> None:
+	""" Writes missing variants of a square image, with the default variant at 'imgPath'
+		(named like 'imgId1.jpg'). Variants larger than the image are skipped. """
+	imgDir = os.path.dirname(imgPath)
+	imgId = int(os.path.splitext(os.path.basename(imgPath))[0])
+	for size in sorted(IMG_VARIANT_SIZES, key=lambda size: size == IMG_OUT_SZ): # Default variant last
+		if size > img.width and size != IMG_OUT_SZ:
+			continue
+		for ext, quality in IMG_VARIANT_FORMATS.items():
+			outPath = os.path.join(imgDir, getVariantName(imgId, size, ext))
+			if os.path.exists(outPath) and (outPath != imgPath or img.size == (size, size)):
+				continue # Already generated, or is an unchanged default variant
+			img.resize((size, size), Image.LANCZOS).save(outPath, quality=quality)
+
+def genAllVariants(outDir: str, dbFile: str) -> None:
+	""" Generates missing variants for images in 'outDir', and records variant byte sizes in the db """
+	print('Generating variants')
+	dbCon = sqlite3.connect(dbFile)
+	dbCur = dbCon.cursor()
+	imgIds = [imgId for (imgId,) in dbCur.execute('SELECT id FROM images')]
+	for idx, imgId in enumerate(imgIds):
+		if idx % 1e3 == 0:
+			print(f'At image {idx}')
+		imgPath = os.path.join(outDir, f'{imgId}.jpg')
+		if not os.path.exists(imgPath):
+			print(f'ERROR: No image file for image ID {imgId}')
+			continue
+		genVariants(imgPath)
+	print('Recording variant sizes')
+	genVariantData(dbCur, outDir)
+	dbCon.commit()
+	dbCon.close()
+
+def genVariantData(dbCur: sqlite3.Cursor, outDir: str) -> None:
+	""" (Re)creates the 'img_variants' table, holding the byte sizes of variants in 'outDir'
+		of images in the 'images' table, and prints their total sizes """
+	dbCur.execute('DROP TABLE IF EXISTS img_variants')
+	dbCur.execute('CREATE TABLE img_variants (img_id INT, size INT, fmt TEXT, bytes INT, PRIMARY KEY (img_id, size, fmt))')
+	imgIds = [imgId for (imgId,) in dbCur.execute('SELECT id FROM images')]
+	for imgId in imgIds:
+		for size in IMG_VARIANT_SIZES:
+			for ext in IMG_VARIANT_FORMATS:
+				variantPath = os.path.join(outDir, getVariantName(imgId, size, ext))
+				if os.path.exists(variantPath):
+					dbCur.execute('INSERT INTO img_variants VALUES (?, ?, ?, ?)',
+						(imgId, size, ext, os.path.getsize(variantPath)))
+	# Print totals, relative to the default variant of the same images
+	query = 'SELECT v.size, v.fmt, COUNT(*), SUM(v.bytes), SUM(d.bytes) FROM img_variants AS v' \
+		' INNER JOIN img_variants AS d ON v.img_id = d.img_id AND d.size = ? AND d.fmt = "jpg"' \
+		' GROUP BY v.size, v.fmt ORDER BY v.size, v.fmt'
+	print(f'{"size":>5} {"format":>6} {"images":>7} {"total KiB":>10} {"vs default":>10}')
+	for size, fmt, count, numBytes, defaultBytes in dbCur.execute(query, (IMG_OUT_SZ,)).fetchall():
+		print(f'{size:>5} {fmt:>6} {count:>7} {numBytes / 1024:>10.1f} {numBytes / defaultBytes:>10.1%}')
+
+def genAtlases(outDir: str, dbFile: str) -> None:
+	""" Packs images in 'outDir' into atlases, and adds their positions to the db """
+	dbCon = sqlite3.connect(dbFile)
+	dbCur = dbCon.cursor()
+	genAtlasData(dbCur, outDir)
+	dbCon.commit()
+	dbCon.close()
+
+def genAtlasData(dbCur: sqlite3.Cursor, outDir: str) -> None:
+	""" (Re)creates the 'event_atlas' table, and atlases in a subdirectory of 'outDir', using images for
+		events in the 'event_disp' and 'img_disp' tables, grouped by scale and tiles of ATLAS_TILE_UNITS units.
+		Atlases are named by a hash of their content, so a cached atlas never goes stale after regeneration. """
+	atlasDir = os.path.join(outDir, ATLAS_DIR)
+	if not os.path.exists(atlasDir):
+		os.mkdir(atlasDir)
+	dbCur.execute('DROP TABLE IF EXISTS event_atlas')
+	dbCur.execute('CREATE TABLE event_atlas (id INT, scale INT, atlas TEXT, x INT, y INT, PRIMARY KEY (id, scale))')
+
+	print('Generating atlases')
+	query = 'SELECT disp.scale, disp.unit, disp.id, event_imgs.img_id' \
+		' FROM (SELECT id, scale, unit FROM event_disp UNION SELECT id, scale, unit FROM img_disp) AS disp' \
+		' INNER JOIN event_imgs ON disp.id = event_imgs.id' \
+		' INNER JOIN pop ON disp.id = pop.id ORDER BY disp.scale, disp.unit, pop.pop DESC'
+	rows = dbCur.execute(query).fetchall()
+	atlasNames: set[str] = set()
+	for (scale, _), tileRows in itertools.groupby(rows, key=lambda row: (row[0], row[1] // ATLAS_TILE_UNITS)):
+		imgPositions: dict[int, tuple[int, int]] = {} # Maps image IDs to positions in the atlas
+		eventPositions: list[tuple[int, int, int]] = []
+		for _, _, eventId, imgId in tileRows:
+			if imgId not in imgPositions:
+				if not os.path.exists(os.path.join(outDir, f'{imgId}.jpg')):
+					print(f'ERROR: No image file for image ID {imgId}')
+					continue
+				row, col = divmod(len(imgPositions), ATLAS_COLS)
+				imgPositions[imgId] = (col * IMG_OUT_SZ, row * IMG_OUT_SZ)
+			eventPositions.append((eventId, *imgPositions[imgId]))
+		if not imgPositions:
+			continue
+		if (len(atlasNames) + 1) % 1e3 == 0:
+			print(f'At atlas {len(atlasNames) + 1}')
+		numRows = -(-len(imgPositions) // ATLAS_COLS)
+		atlas = Image.new('RGB', (ATLAS_COLS * IMG_OUT_SZ, numRows * IMG_OUT_SZ))
+		for imgId, position in imgPositions.items():
+			with Image.open(os.path.join(outDir, f'{imgId}.jpg')) as img:
+				if img.size != (IMG_OUT_SZ, IMG_OUT_SZ):
+					img = img.resize((IMG_OUT_SZ, IMG_OUT_SZ))
+				atlas.paste(img.convert('RGB'), position)
+		buffer = io.BytesIO()
+		atlas.save(buffer, format='JPEG', quality=ATLAS_QUALITY)
+		atlasName = hashlib.sha1(buffer.getvalue()).hexdigest()[:16]
+		if atlasName not in atlasNames:
+			atlasNames.add(atlasName)
+			with open(os.path.join(atlasDir, f'{atlasName}.jpg'), 'wb') as file:
+				file.write(buffer.getvalue())
+		for eventId, x, y in eventPositions:
+			dbCur.execute('INSERT INTO event_atlas VALUES (?, ?, ?, ?, ?)', (eventId, scale, atlasName, x, y))
+	# Remove atlases that are no longer used
+	oldFilenames = [filename for filename in os.listdir(atlasDir) if filename[:-len('.jpg')] not in atlasNames]
+	if oldFilenames:
+		print(f'Removing {len(oldFilenames)} old atlases')
+		for filename in oldFilenames:
+			os.remove(os.path.join(atlasDir, filename))
+	print(f'Generated {len(atlasNames)} atlases')
+
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
-	parser.parse_args()
+	parser.add_argument('--atlases', action='store_true', help='Generate atlases from already-generated images')
+	parser.add_argument('--variants', action='store_true', help='Generate variants of already-generated images')
+	parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+		help='The number of processes converting images')
+	args = parser.parse_args()
 
-	genImgs(IMG_DIR, IMG_DB, OUT_DIR, DB_FILE)
+	if args.atlases:
+		genAtlases(OUT_DIR, DB_FILE)
+	elif args.variants:
+		genAllVariants(OUT_DIR, DB_FILE)
+	else:
+		genImgs(IMG_DIR, IMG_DB, OUT_DIR, DB_FILE, args.workers)
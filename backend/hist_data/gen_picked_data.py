@@ -13,7 +13,10 @@ sys.path.append(parentDir)
 import argparse
 import json, sqlite3
 
-from gen_imgs import convertImage
+from gen_imgs import convertImage, genAtlasData, genVariantData
+from gen_disp_data import genSumData
+from gen_serving_data import genServingTable
+from gen_search_data import genSearchTable
 from cal import SCALES, dbDateToHistDate, dateToUnit
 
 PICKED_DIR = 'picked'
@@ -160,6 +163,22 @@ def genData(pickedDir: str, pickedEvtFile: str, dbFile: str, imgOutDir: str, sca
 
 			nextId -= 1
 
+	if dbCur.execute('SELECT name FROM sqlite_master WHERE type = "table" AND name = "dist_sums"').fetchone():
+		print('Regenerating cumulative counts')
+		genSumData(dbCur, scales, False)
+	if dbCur.execute('SELECT name FROM sqlite_master WHERE type = "table" AND name = "disp_events"').fetchone():
+		print('Regenerating serving table')
+		genServingTable(dbCur)
+	if dbCur.execute('SELECT name FROM sqlite_master WHERE type = "table" AND name = "events_fts"').fetchone():
+		print('Regenerating search index')
+		genSearchTable(dbCur)
+	if dbCur.execute('SELECT name FROM sqlite_master WHERE type = "table" AND name = "event_atlas"').fetchone():
+		print('Regenerating atlases')
+		genAtlasData(dbCur, imgOutDir)
+	if dbCur.execute('SELECT name FROM sqlite_master WHERE type = "table" AND name = "img_variants"').fetchone():
+		print('Recording variant sizes')
+		genVariantData(dbCur, imgOutDir)
+
 	dbCon.commit()
 	dbCon.close()
 
@@ -0,0 +1,39 @@
+#!/usr/bin/python3
+
+"""
+Adds a full-text-search index over event titles to the database,
+for finding search suggestions that contain a search string.
+Rows are numbered in order of popularity, so the most popular matches can be
+found without reading and sorting every match.
+"""
+
+import argparse
+import sqlite3
+
+DB_FILE = 'data.db'
+
+def genData(dbFile: str) -> None:
+	dbCon = sqlite3.connect(dbFile)
+	dbCur = dbCon.cursor()
+	genSearchTable(dbCur)
+	print('Closing db')
+	dbCon.commit()
+	dbCon.close()
+
+def genSearchTable(dbCur: sqlite3.Cursor) -> None:
+	""" (Re)creates the 'events_fts' table, using the 'events' and 'pop' tables """
+	print('Creating table')
+	dbCur.execute('DROP TABLE IF EXISTS events_fts')
+	dbCur.execute('CREATE VIRTUAL TABLE events_fts USING fts5(title, id UNINDEXED, ctg UNINDEXED, tokenize="trigram")')
+
+	print('Adding titles')
+	dbCur.execute('INSERT INTO events_fts (rowid, title, id, ctg)' \
+		' SELECT ROW_NUMBER() OVER (ORDER BY pop.pop DESC, events.id), title, events.id, ctg' \
+		' FROM events LEFT JOIN pop ON events.id = pop.id')
+	dbCur.execute('INSERT INTO events_fts (events_fts) VALUES ("optimize")')
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	args = parser.parse_args()
+
+	genData(DB_FILE)
@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+
+"""
+Adds a table that holds displayable events along with the data needed to send them,
+ordered by how type=events requests read them.
+Allows the server to look up events in a unit without joins or sorting.
+"""
+
+import argparse
+import sqlite3
+
+DB_FILE = 'data.db'
+
+def genData(dbFile: str) -> None:
+	dbCon = sqlite3.connect(dbFile)
+	dbCur = dbCon.cursor()
+	genServingTable(dbCur)
+	print('Closing db')
+	dbCon.commit()
+	dbCon.close()
+
+def genServingTable(dbCur: sqlite3.Cursor) -> None:
+	""" (Re)creates the 'disp_events' table, using the 'event_disp' and 'img_disp' tables """
+	print('Creating table')
+	dbCur.execute('DROP TABLE IF EXISTS disp_events')
+	dbCur.execute('CREATE TABLE disp_events (imgonly INT, scale INT, unit INT, pop INT, id INT, title TEXT,' \
+		' start INT, start_upper INT, end INT, end_upper INT, fmt INT, ctg TEXT, img_id INT,' \
+		' PRIMARY KEY (imgonly, scale, unit, pop DESC, id)) WITHOUT ROWID')
+
+	dispTables = ['event_disp']
+	if dbCur.execute('SELECT name FROM sqlite_master WHERE type = "table" AND name = "img_disp"').fetchone():
+		dispTables.append('img_disp')
+	for imgonly, dispTable in enumerate(dispTables):
+		print(f'Adding events from {dispTable}')
+		dbCur.execute('INSERT INTO disp_events' \
+			f' SELECT {imgonly}, scale, unit, pop.pop, events.id, title,' \
+				' start, start_upper, end, end_upper, fmt, ctg, images.id FROM events' \
+			f' INNER JOIN {dispTable} ON events.id = {dispTable}.id' \
+			' INNER JOIN pop ON events.id = pop.id' \
+			' LEFT JOIN event_imgs ON events.id = event_imgs.id' \
+			' LEFT JOIN images ON event_imgs.img_id = images.id' \
+			' ORDER BY scale, unit, pop.pop DESC, events.id')
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	args = parser.parse_args()
+
+	genData(DB_FILE)
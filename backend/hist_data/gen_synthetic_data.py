@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+
+"""
+Generates a synthetic history database, with the same tables as one made from Wikidata and enwiki dumps,
+for benchmarking the server at various scales without the dumps.
+
+Event data is randomly generated, with skews like those in the real data:
+- Dates are concentrated in recent centuries, and become sparser further back,
+	down to billions of years ago. Recent events mostly have day-precision dates.
+- Popularity values follow a power law, with a few very popular events.
+- Categories are unevenly represented, with people being the most common.
+- More popular events are more likely to have images, and a few images are shared between events.
+The 'dist', 'event_disp', etc tables are then generated using gen_disp_data.py,
+which removes events not eligible for display (as in the real build process).
+"""
+
+# For unit testing, resolve imports of modules within this directory
+import os
+import sys
+parentDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(parentDir)
+
+import argparse
+import math
+import random
+import sqlite3
+from typing import Iterator
+
+from gen_disp_data import genData as genDispData, MAX_DISPLAYED_PER_UNIT
+from gen_search_data import genData as genSearchData
+from gen_serving_data import genData as genServingData
+from cal import SCALES, MIN_CAL_YEAR, gregorianToJdn, julianToJdn
+
+DB_FILE = 'data_synthetic.db'
+NUM_EVENTS = 100_000
+BATCH_SZ = 100_000 # Number of events to insert at a time
+
+CUR_YEAR = 2024
+GREGORIAN_START_YEAR = 1583 # Dates before this prefer display using the Julian calendar
+DATE_MODES: list[tuple[float, str]] = [
+	# Maps fractions of events to ways of picking their start years
+	(0.82, 'recent'), # Exponentially sparser going back from CUR_YEAR
+	(0.12, 'ancient'), # Exponentially sparser going back from 1 AD, down to about 10k BC
+	(0.06, 'deep'), # Log-uniform from 10k to 4.5 billion years ago
+]
+RECENT_MEAN_AGE = 150 # Mean number of years before CUR_YEAR, for 'recent' events
+ANCIENT_MEAN_AGE = 1500
+DEEP_MIN_AGE = 1e4
+DEEP_MAX_AGE = 4.5e9
+CTG_WEIGHTS = {'person': 0.42, 'event': 0.2, 'place': 0.16, 'work': 0.12, 'organism': 0.06, 'discovery': 0.04}
+POP_ALPHA = 1.1 # Shape parameter for the power law of popularity values (lower means a heavier tail)
+POP_MIN = 5
+IMG_PROB_BASE = 0.15 # Probability that an event with minimum popularity has an image
+IMG_PROB_PER_DECADE = 0.15 # Added probability for each factor of 10 in popularity
+IMG_SHARE_PROB = 0.02 # Probability that an event with an image uses another event's image
+DESC_PROB = 0.9
+
+# Words for generating titles
+FIRST_NAMES = ['John', 'Mary', 'William', 'Anne', 'Charles', 'Elizabeth', 'Henry', 'Margaret', 'Louis', 'Catherine',
+	'Friedrich', 'Sofia', 'Giovanni', 'Isabel', 'Pierre', 'Hannah', 'Ahmed', 'Mei', 'Hiroshi', 'Olga', 'Carlos', 'Amara']
+LAST_NAMES = ['Smith', 'Müller', 'Rossi', 'García', 'Dubois', 'Ivanov', 'Tanaka', 'Khan', 'Nakamura', 'Johansson',
+	'Okafor', 'Silva', 'Kowalski', 'Novak', 'Chen', 'Fischer', 'Bernard', 'Costa', 'Murphy', 'Schmidt', 'Popescu']
+PLACE_NAMES = ['Hastings', 'Waterloo', 'Carthage', 'Constantinople', 'Kyoto', 'Lisbon', 'Antioch', 'Tenochtitlan',
+	'Vienna', 'Alexandria', 'Samarkand', 'Gettysburg', 'Thebes', 'Novgorod', 'Cusco', 'Timbuktu', 'Delft', 'Uppsala']
+EVENT_KINDS = ['Battle of', 'Siege of', 'Treaty of', 'Council of', 'Fire of', 'Earthquake in', 'Revolution in',
+	'Expedition to', 'Founding of', 'Sack of', 'Flood of', 'Election in']
+PLACE_KINDS = ['Cathedral', 'Castle', 'Bridge', 'University', 'Palace', 'Harbour', 'Abbey', 'Observatory', 'Fort']
+WORK_ADJS = ['Silent', 'Red', 'Last', 'Broken', 'Golden', 'Distant', 'Hidden', 'Winter', 'Eternal', 'Little']
+WORK_NOUNS = ['River', 'Garden', 'Symphony', 'Mirror', 'Empire', 'Voyage', 'Letters', 'Mountain', 'Song', 'Night']
+GENUS_NAMES = ['Tyrannosaurus', 'Ammonites', 'Trilobita', 'Homo', 'Equus', 'Quercus', 'Mammuthus', 'Archaeopteryx',
+	'Dimetrodon', 'Smilodon', 'Anomalocaris', 'Cooksonia']
+SPECIES_NAMES = ['rex', 'gigas', 'minor', 'borealis', 'antiquus', 'primigenius', 'australis', 'robustus', 'elegans']
+DISCOVERY_KINDS = ['theorem', 'law', 'effect', 'principle', 'equation', 'comet', 'element', 'method']
+LICENSES = ['cc-by-sa 4.0', 'cc-by 4.0', 'cc0', 'public domain', 'cc-by-sa 3.0']
+
+def genData(dbFile: str, numEvents: int, seed: int) -> None:
+	""" Creates a database with 'numEvents' synthetic events (before removing non-displayable ones) """
+	if os.path.exists(dbFile):
+		print('ERROR: Database already exists')
+		return
+	random.seed(seed)
+
+	print('Creating tables')
+	dbCon = sqlite3.connect(dbFile)
+	dbCur = dbCon.cursor()
+	dbCur.execute('CREATE TABLE events (id INT PRIMARY KEY, title TEXT UNIQUE, ' \
+		'start INT, start_upper INT, end INT, end_upper INT, fmt INT, ctg TEXT)')
+	dbCur.execute('CREATE INDEX events_id_start_idx ON events(id, start)')
+	dbCur.execute('CREATE INDEX events_title_nocase_idx ON events(title COLLATE NOCASE)')
+	dbCur.execute('CREATE TABLE pop (id INT PRIMARY KEY, pop INT)')
+	dbCur.execute('CREATE INDEX pop_idx ON pop(pop)')
+	dbCur.execute('CREATE TABLE event_imgs (id INT PRIMARY KEY, img_id INT)')
+	dbCur.execute('CREATE TABLE images (id INT PRIMARY KEY, url TEXT, license TEXT, artist TEXT, credit TEXT)')
+	dbCur.execute('CREATE TABLE descs (id INT PRIMARY KEY, wiki_id INT, desc TEXT)')
+
+	print('Generating events')
+	eventRows: list[tuple] = []
+	popRows: list[tuple[int, int]] = []
+	eventImgRows: list[tuple[int, int]] = []
+	imgRows: list[tuple] = []
+	descRows: list[tuple[int, int, str]] = []
+	titles: set[str] = set()
+	imgIds: list[int] = []
+	eventId = 0
+	for eventNum, (title, start, startUpper, end, endUpper, fmt, ctg) in enumerate(genEvents(numEvents, titles), 1):
+		eventId += random.randint(1, 20) # Makes IDs sparse, like Wikidata IDs
+		eventRows.append((eventId, title, start, startUpper, end, endUpper, fmt, ctg))
+		pop = min(int(POP_MIN * random.paretovariate(POP_ALPHA)), 10 ** 8)
+		popRows.append((eventId, pop))
+		if random.random() < IMG_PROB_BASE + IMG_PROB_PER_DECADE * math.log10(pop / POP_MIN):
+			if imgIds and random.random() < IMG_SHARE_PROB:
+				imgId = random.choice(imgIds)
+			else:
+				imgId = len(imgIds) + 1
+				imgIds.append(imgId)
+				imgRows.append((imgId, f'https://en.wikipedia.org/wiki/File:{title.replace(" ", "_")}.jpg',
+					random.choice(LICENSES), random.choice(FIRST_NAMES) + ' ' + random.choice(LAST_NAMES), ''))
+			eventImgRows.append((eventId, imgId))
+		if random.random() < DESC_PROB:
+			descRows.append((eventId, eventId, f'{ctg.capitalize()} {title}'))
+		if eventNum % BATCH_SZ == 0 or eventNum == numEvents:
+			print(f'At event {eventNum}')
+			dbCur.executemany('INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)', eventRows)
+			dbCur.executemany('INSERT INTO pop VALUES (?, ?)', popRows)
+			dbCur.executemany('INSERT INTO event_imgs VALUES (?, ?)', eventImgRows)
+			dbCur.executemany('INSERT INTO images VALUES (?, ?, ?, ?, ?)', imgRows)
+			dbCur.executemany('INSERT INTO descs VALUES (?, ?, ?)', descRows)
+			for rows in [eventRows, popRows, eventImgRows, imgRows, descRows]:
+				rows.clear()
+	dbCon.commit()
+	dbCon.close()
+
+	print('Generating display data')
+	genDispData(dbFile, SCALES, MAX_DISPLAYED_PER_UNIT, False)
+	genDispData(dbFile, SCALES, MAX_DISPLAYED_PER_UNIT, True)
+
+def genEvents(numEvents: int, titles: set[str]) -> Iterator[tuple]:
+	""" Yields tuples with a unique title, start/end values, fmt value, and category, for each event """
+	ctgs, ctgWeights = list(CTG_WEIGHTS), list(CTG_WEIGHTS.values())
+	modeFractions = [fraction for fraction, _ in DATE_MODES]
+	for _ in range(numEvents):
+		ctg = random.choices(ctgs, ctgWeights)[0]
+		mode = random.choices(DATE_MODES, modeFractions)[0][1]
+		if ctg == 'person' and mode == 'deep':
+			mode = 'ancient'
+		# Get start year
+		if mode == 'recent':
+			year = CUR_YEAR - int(random.expovariate(1 / RECENT_MEAN_AGE))
+		elif mode == 'ancient':
+			year = -int(random.expovariate(1 / ANCIENT_MEAN_AGE))
+		else:
+			year = -int(math.exp(random.uniform(math.log(DEEP_MIN_AGE), math.log(DEEP_MAX_AGE))))
+		year = year if year != 0 else 1
+		# Get dates
+		start: int
+		startUpper: int | None = None
+		end: int | None = None
+		endUpper: int | None = None
+		if year > MIN_CAL_YEAR and random.random() < (0.85 if year >= GREGORIAN_START_YEAR else 0.3):
+			julian = year < GREGORIAN_START_YEAR
+			toJdn = julianToJdn if julian else gregorianToJdn
+			start = toJdn(year, random.randint(1, 12), random.randint(1, 28))
+			fmt = 2 if julian else 1
+			if ctg == 'person' or random.random() < 0.2: # Add end date
+				endYear = year + (random.randint(20, 95) if ctg == 'person' else int(random.expovariate(1 / 5)))
+				if endYear <= CUR_YEAR:
+					if julian and endYear >= GREGORIAN_START_YEAR:
+						fmt = 3
+						toJdn = gregorianToJdn
+					end = max(toJdn(endYear, random.randint(1, 12), random.randint(1, 28)), start)
+		else:
+			start = year
+			fmt = 0
+			if mode == 'deep' and random.random() < 0.3: # Add uncertain range
+				startUpper = start + int(-start * random.uniform(0.01, 0.2))
+			elif random.random() < 0.2:
+				endYear = start + (random.randint(20, 95) if ctg == 'person' else int(random.expovariate(1 / 10)))
+				if start < 0 and endYear >= 0: # Skips year 0
+					endYear += 1
+				if endYear <= CUR_YEAR:
+					end = endYear
+		yield (genTitle(ctg, year, titles), start, startUpper, end, endUpper, fmt, ctg)
+
+def genTitle(ctg: str, year: int, titles: set[str]) -> str:
+	""" Returns a title for an event, not in 'titles', and adds it to 'titles' """
+	if ctg == 'person':
+		title = f'{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}'
+	elif ctg == 'event':
+		title = f'{random.choice(EVENT_KINDS)} {random.choice(PLACE_NAMES)}'
+	elif ctg == 'place':
+		title = f'{random.choice(PLACE_NAMES)} {random.choice(PLACE_KINDS)}'
+	elif ctg == 'work':
+		title = f'The {random.choice(WORK_ADJS)} {random.choice(WORK_NOUNS)}'
+	elif ctg == 'organism':
+		title = f'{random.choice(GENUS_NAMES)} {random.choice(SPECIES_NAMES)}'
+	else:
+		title = f'{random.choice(LAST_NAMES)} {random.choice(DISCOVERY_KINDS)}'
+	if title in titles: # Disambiguate like enwiki titles, eg: 'John Smith (1850)'
+		yearStr = str(year) if year > 0 else f'{-year} BC'
+		title = f'{title} ({yearStr})'
+		num = 2
+		while title in titles:
+			title = f'{title.rsplit(" (", 1)[0]} ({yearStr}, {num})'
+			num += 1
+	titles.add(title)
+	return title
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--out', default=DB_FILE, help='File to write the database to')
+	parser.add_argument('--events', type=int, default=NUM_EVENTS,
+		help='The number of events to generate (eg: from 10k to 10M)')
+	parser.add_argument('--seed', type=int, default=0, help='Seed for the random number generator')
+	parser.add_argument('--serving', action='store_true',
+		help='Also add the tables from gen_search_data.py and gen_serving_data.py')
+	args = parser.parse_args()
+
+	genData(args.out, args.events, args.seed)
+	if args.serving:
+		genSearchData(args.out)
+		genServingData(args.out)
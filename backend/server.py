@@ -1,30 +1,60 @@
 #!/usr/bin/python3
 
 """
-Runs a basic dev server that serves a WSGI script and image files
+Runs a dev server that serves a WSGI script and image files.
+
+Connections are handled by a pool of threads, and can be kept alive between requests.
+Multiple worker processes can also be used, which accept connections on a shared listening socket.
+Images are sent using sendfile(), with headers for caching and revalidation.
+For a request for an image like '/hist_data/img/123.jpg', a variant is chosen using the 'size' URL parameter
+(a pixel width), and the Accept header (preferring WebP if accepted).
 """
 
 from typing import Iterable
 import os
+import sys
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler
 from wsgiref import simple_server, util
 import mimetypes
+import re
+import urllib.parse
+import chrona
 from chrona import application
+from hist_data.gen_imgs import IMG_OUT_SZ, IMG_VARIANT_SIZES, getVariantName
 
 import argparse
 parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
-parser.parse_args()
+parser.add_argument('--port', type=int, default=8000, help='The port to listen on')
+parser.add_argument('--threads', type=int, default=32, help='The number of connection-handling threads per process')
+parser.add_argument('--workers', type=int, default=1, help='The number of processes accepting connections')
+parser.add_argument('--db', default=chrona.DB_FILE, help='The history database to serve')
+parser.add_argument('--img-dir', default=os.path.join('hist_data', 'img'), help='The directory of images to serve')
+args = parser.parse_args()
+chrona.DB_FILE = args.db
+
+IMG_DIR = os.path.realpath(args.img_dir)
+IMG_MAX_AGE = 30 * 24 * 3600 # Number of seconds that clients can cache images for without revalidating
+KEEP_ALIVE_TIMEOUT = 5 # Number of seconds to wait for another request on an idle connection
+LISTEN_BACKLOG = 128
 
 def wrappingApp(environ: dict[str, str], start_response) -> Iterable[bytes]:
 	""" WSGI handler that uses 'application', but also serves image files """
 	urlPath = environ['PATH_INFO']
 	if urlPath.startswith('/data/'):
 		return application(environ, start_response) # Run WSGI script
+	elif urlPath == '/metrics':
+		return application({**environ, 'QUERY_STRING': 'type=metrics'}, start_response)
 	elif urlPath.startswith('/hist_data/img/'): # Serve image file
-		imgPath = os.path.join(os.getcwd(), urlPath[1:])
-		if os.path.exists(imgPath):
-			imgType = mimetypes.guess_type(imgPath)[0]
-			start_response('200 OK', [('Content-type', imgType)])
-			return util.FileWrapper(open(imgPath, 'rb'))
+		imgPath = os.path.normpath(os.path.join(IMG_DIR, urlPath[len('/hist_data/img/'):]))
+		if os.path.commonpath([imgPath, IMG_DIR]) == IMG_DIR and os.path.isfile(imgPath):
+			match = re.fullmatch(r'(-?\d+)\.jpg', os.path.relpath(imgPath, IMG_DIR))
+			if match is not None:
+				imgPath = getImgVariant(environ, int(match.group(1)))
+				return imgResponse(environ, start_response, imgPath, [('Vary', 'Accept')])
+			return imgResponse(environ, start_response, imgPath)
 		else:
 			start_response('404 Not Found', [('Content-type', 'text/plain')])
 			return [b'No image found']
@@ -32,7 +62,170 @@ def wrappingApp(environ: dict[str, str], start_response) -> Iterable[bytes]:
 		start_response('404 Not Found', [('Content-type', 'text/plain')])
 		return [b'Unrecognised path']
 
+def getImgVariant(environ: dict[str, str], imgId: int) -> str:
+	""" Returns the path of the variant of an image that best suits a request. Picks the smallest size
+		that is at least the requested size (or the largest available), preferring WebP if accepted. """
+	size = IMG_OUT_SZ
+	sizeStrs = urllib.parse.parse_qs(environ.get('QUERY_STRING', '')).get('size')
+	if sizeStrs and sizeStrs[0].isdigit():
+		size = int(sizeStrs[0])
+	exts = ['webp', 'jpg'] if 'image/webp' in environ.get('HTTP_ACCEPT', '') else ['jpg']
+	sizes = [sz for sz in IMG_VARIANT_SIZES if sz >= size] + [sz for sz in reversed(IMG_VARIANT_SIZES) if sz < size]
+	for sz in sizes:
+		for ext in exts:
+			variantPath = os.path.join(IMG_DIR, getVariantName(imgId, sz, ext))
+			if os.path.isfile(variantPath):
+				return variantPath
+	return os.path.join(IMG_DIR, getVariantName(imgId, IMG_OUT_SZ, 'jpg'))
+
+def imgResponse(environ: dict[str, str], start_response, imgPath: str,
+		extraHeaders: Iterable[tuple[str, str]] = ()) -> Iterable[bytes]:
+	""" Responds with an image file, or with a 304 if the client's cached copy is unchanged """
+	fileStat = os.stat(imgPath)
+	etag = f'"{fileStat.st_mtime_ns:x}-{fileStat.st_size:x}"'
+	lastModified = formatdate(fileStat.st_mtime, usegmt=True)
+	headers = [
+		('Cache-Control', f'public, max-age={IMG_MAX_AGE}'),
+		('ETag', etag),
+		('Last-Modified', lastModified),
+		*extraHeaders,
+	]
+	if isNotModified(environ, etag, int(fileStat.st_mtime)):
+		start_response('304 Not Modified', headers)
+		return [b'']
+	imgType = mimetypes.guess_type(imgPath)[0] or 'application/octet-stream'
+	start_response('200 OK', [('Content-type', imgType), ('Content-Length', str(fileStat.st_size))] + headers)
+	return util.FileWrapper(open(imgPath, 'rb')) # Sent using sendfile() by SendfileHandler
+
+def isNotModified(environ: dict[str, str], etag: str, mtime: int) -> bool:
+	""" Returns True if a request's conditional headers indicate that the client's copy is current """
+	if 'HTTP_IF_NONE_MATCH' in environ: # Takes precedence over If-Modified-Since
+		return chrona.etagMatches(etag, environ['HTTP_IF_NONE_MATCH'])
+	if 'HTTP_IF_MODIFIED_SINCE' in environ:
+		try:
+			return mtime <= parsedate_to_datetime(environ['HTTP_IF_MODIFIED_SINCE']).timestamp()
+		except (TypeError, ValueError):
+			return False
+	return False
+
+class SendfileHandler(simple_server.ServerHandler):
+	""" Sends HTTP/1.1 responses, sending files using sendfile(), and keeping the
+		connection open if the response has a Content-Length header """
+	http_version = '1.1'
+
+	def cleanup_headers(self):
+		super().cleanup_headers()
+		if 'Content-Length' not in self.headers: # The client can only detect the end of the body by a close
+			self.request_handler.close_connection = True
+		if self.request_handler.close_connection:
+			self.headers['Connection'] = 'close'
+
+	def sendfile(self):
+		if 'Content-Length' not in self.headers:
+			return False
+		if not self.headers_sent:
+			self.send_headers()
+		self._flush()
+		file = self.result.filelike
+		self.bytes_sent = self.request_handler.connection.sendfile(file, 0, int(self.headers['Content-Length']))
+			# Uses os.sendfile(), waiting when the socket buffer is full
+		return True
+
+class KeepAliveRequestHandler(simple_server.WSGIRequestHandler):
+	""" Handles requests on a connection until the client or server closes it """
+	protocol_version = 'HTTP/1.1'
+	timeout = KEEP_ALIVE_TIMEOUT
+	wbufsize = -1 # Buffers writes, so that the status line, headers, and body aren't sent as separate packets
+	disable_nagle_algorithm = True # Avoids waiting for an ACK before sending a response's last packet
+	handle = BaseHTTPRequestHandler.handle # Calls handle_one_request() until self.close_connection is set
+
+	def handle_one_request(self):
+		try:
+			self.raw_requestline = self.rfile.readline(65537)
+		except TimeoutError: # The connection was idle
+			self.close_connection = True
+			return
+		if not self.raw_requestline:
+			self.close_connection = True
+			return
+		if len(self.raw_requestline) > 65536:
+			self.requestline = ''
+			self.request_version = ''
+			self.command = ''
+			self.send_error(414)
+			return
+		if not self.parse_request(): # An error code has been sent
+			return
+		handler = SendfileHandler(self.rfile, self.wfile, self.get_stderr(), self.get_environ(), multithread=True)
+		handler.request_handler = self # Used for logging, and for the connection socket
+		handler.run(self.server.get_app())
+		self.wfile.flush()
+
+class PooledWSGIServer(simple_server.WSGIServer):
+	""" Handles each connection using a thread from a pool """
+	request_queue_size = LISTEN_BACKLOG
+
+	def __init__(self, serverAddress: tuple[str, int], numThreads: int):
+		super().__init__(serverAddress, KeepAliveRequestHandler)
+		self.numThreads = numThreads
+		self.executor: ThreadPoolExecutor | None = None # Created when serving, so that worker processes get their own
+
+	def serve_forever(self, poll_interval=0.5):
+		self.executor = ThreadPoolExecutor(self.numThreads)
+		try:
+			super().serve_forever(poll_interval)
+		finally:
+			self.executor.shutdown(wait=False, cancel_futures=True)
+
+	def process_request(self, request, client_address):
+		assert self.executor is not None
+		self.executor.submit(self.processRequestInThread, request, client_address)
+
+	def processRequestInThread(self, request, client_address):
+		try:
+			self.finish_request(request, client_address)
+		except Exception:
+			self.handle_error(request, client_address)
+		finally:
+			self.shutdown_request(request)
+
+def serve(httpd: PooledWSGIServer, numWorkers: int) -> None:
+	""" Serves using the current process, or using forked worker processes that share the listening socket """
+	if numWorkers <= 1:
+		httpd.serve_forever()
+		return
+	httpd.socket.setblocking(False) # Lets a worker that loses a race to accept a connection go back to waiting
+	childPids: list[int] = []
+	for _ in range(numWorkers):
+		pid = os.fork()
+		if pid == 0:
+			try:
+				httpd.serve_forever()
+			except KeyboardInterrupt:
+				pass
+			finally:
+				os._exit(0)
+		childPids.append(pid)
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+	try:
+		for pid in childPids:
+			os.waitpid(pid, 0)
+	finally: # Stop any remaining workers
+		for pid in childPids:
+			try:
+				os.kill(pid, signal.SIGTERM)
+			except ProcessLookupError:
+				pass
+
 # Start server
-with simple_server.make_server('', 8000, wrappingApp) as httpd:
-    print('Serving HTTP on port 8000...')
-    httpd.serve_forever()
+if args.workers > 1 and not hasattr(os, 'fork'):
+	print('ERROR: Multiple workers require os.fork()')
+	sys.exit(1)
+chrona.loadIndexes(chrona.DB_FILE) # Loads any enabled in-memory indexes before forking workers, which share them
+with PooledWSGIServer(('', args.port), args.threads) as httpd:
+	httpd.set_app(wrappingApp)
+	print(f'Serving HTTP on port {args.port} ({args.workers} process(es) with {args.threads} thread(s) each)...')
+	try:
+		serve(httpd, args.workers)
+	except KeyboardInterrupt:
+		pass
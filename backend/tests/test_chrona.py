@@ -1,9 +1,21 @@
+from typing import Any
 import unittest
+from unittest.mock import patch
 import tempfile
+import io
 import os
+import shutil
+import sqlite3
+import gzip
+import json
+import jsonpickle
 
 from tests.common import createTestDbTable
-from chrona import handleReq, HistDate, HistEvent, ImgInfo, EventInfo, SuggResponse
+from hist_data.gen_search_data import genData as genSearchData
+from hist_data.gen_serving_data import genData as genServingData
+import chrona
+from chrona import application, handleReq, HistDate, HistEvent, ImgInfo, EventInfo, SuggResponse, \
+	EventColsResponse, BatchResponse, WindowResult, CountResponse, DbConPool, ResponseCache, encodeResponse
 
 def initTestDb(dbFile: str) -> None:
 	createTestDbTable(
@@ -86,6 +98,53 @@ def initTestDb(dbFile: str) -> None:
 			(60, 'example.com/6', 'cc-by', 'artist six', 'credits six'),
 		}
 	)
+	createTestDbTable(
+		dbFile,
+		'CREATE TABLE img_dist (scale INT, unit INT, count INT, PRIMARY KEY (scale, unit))',
+		'INSERT INTO img_dist VALUES (?, ?, ?)',
+		{
+			(1, -2000, 1),
+			(1, 1900, 1),
+			(1, 1990, 1),
+			(1, 2000, 1),
+			(1, 2002, 1),
+			(10, 190, 2),
+		}
+	)
+	createTestDbTable(
+		dbFile,
+		'CREATE TABLE img_disp (id INT, scale INT, unit INT, PRIMARY KEY (id, scale))',
+		'INSERT INTO img_disp VALUES (?, ?, ?)',
+		{
+			(1, 1, 1900),
+			(1, 10, 190),
+			(2, 1, 2002),
+			(3, 1, 1990),
+			(4, 1, -2000),
+			(5, 1, 2000),
+			(6, 10, 190),
+		}
+	)
+	createTestDbTable(
+		dbFile,
+		'CREATE TABLE dist_sums (ctg TEXT, scale INT, unit INT, cumul_count INT, PRIMARY KEY (ctg, scale, unit))',
+		'INSERT INTO dist_sums VALUES (?, ?, ?, ?)',
+		{
+			('', 1, -2000, 1),
+			('', 1, 1900, 3),
+			('', 1, 1990, 4),
+			('', 1, 2000, 5),
+			('', 1, 2001, 6),
+			('', 1, 2002, 7),
+			('event', 1, -2000, 1),
+			('event', 1, 1900, 2),
+			('event', 1, 2000, 3),
+			('person', 1, 2002, 1),
+			('discovery', 1, 1990, 1),
+			('', 10, 190, 2),
+			('event', 10, 190, 2),
+		}
+	)
 	createTestDbTable(
 		dbFile,
 		'CREATE TABLE descs (id INT PRIMARY KEY, wiki_id INT, desc TEXT)',
@@ -100,6 +159,22 @@ def initTestDb(dbFile: str) -> None:
 		}
 	)
 
+def addTiedEvents(dbFile: str) -> None:
+	""" Adds events with equal popularity (also equal to that of 'event two'), for checking tie-breaking """
+	dbCon = sqlite3.connect(dbFile)
+	for eventId in [12, 9, 11, 7, 10, 8]: # Not in ID order, so that insertion order doesn't break ties
+		dbCon.execute('INSERT INTO events VALUES (?, ?, 2000, NULL, NULL, NULL, 0, ?)',
+			(eventId, f'tied {eventId}', 'person' if eventId % 3 == 0 else 'event'))
+		dbCon.execute('INSERT INTO pop VALUES (?, 21)', (eventId,))
+		dbCon.execute('INSERT INTO event_disp VALUES (?, 1, 2000)', (eventId,))
+		dbCon.execute('INSERT INTO event_disp VALUES (?, 10, 200)', (eventId,))
+		if eventId % 2 == 0:
+			dbCon.execute('INSERT INTO event_imgs VALUES (?, 20)', (eventId,))
+			dbCon.execute('INSERT INTO img_disp VALUES (?, 1, 2000)', (eventId,))
+			dbCon.execute('INSERT INTO img_disp VALUES (?, 10, 200)', (eventId,))
+	dbCon.commit()
+	dbCon.close()
+
 class TestHandleReq(unittest.TestCase):
 	def setUp(self):
 		self.maxDiff = None
@@ -127,6 +202,166 @@ class TestHandleReq(unittest.TestCase):
 		])
 		self.assertEqual(response.unitCounts, {-2000: 1, 1900: 2, 1990: 1})
 
+	def test_events_req_buckets(self):
+		with patch('chrona.MAX_REQ_UNIT_COUNTS', 3):
+			response = handleReq(self.dbFile, {'QUERY_STRING': 'type=events&range=.&scale=1'})
+			self.assertEqual((response.unitCounts, response.unitCountsWidth), ({-2002: 1, 0: 5, 2002: 1}, 2002))
+			response = handleReq(self.dbFile, {'QUERY_STRING': 'type=events&range=1900.2003&scale=1'})
+			self.assertEqual((response.unitCounts, response.unitCountsWidth), ({1872: 2, 1976: 4}, 52))
+			with patch('chrona.USE_EVENT_INDEX', True):
+				response = handleReq(self.dbFile, {'QUERY_STRING': 'type=events&range=.&scale=1'})
+				self.assertEqual((response.unitCounts, response.unitCountsWidth), ({-2002: 1, 0: 5, 2002: 1}, 2002))
+				response = handleReq(self.dbFile, {'QUERY_STRING': 'type=events&range=1900.2003&scale=1'})
+				self.assertEqual((response.unitCounts, response.unitCountsWidth), ({1872: 2, 1976: 4}, 52))
+
+	def test_events_req_cols(self):
+		response = handleReq(self.dbFile,
+			{'QUERY_STRING': 'type=events&range=-1999.2002-11-1&scale=1&incl=3&limit=2&fmt=cols'})
+		self.assertEqual(response, EventColsResponse(
+			[5, 3], ['event five', 'event three'], [2000, 2448175], [None, 2451828], [2001, None], [None, None],
+			[0, 1], ['event', 'discovery'], [50, 30], [51, 0], [None, None], {1900: 2, 1990: 1, 2000: 1, 2001: 1}, 1))
+		response = handleReq(self.dbFile, {'QUERY_STRING': 'type=events&range=3000.&scale=1&fmt=cols'})
+		self.assertEqual(response, EventColsResponse([], [], [], [], [], [], [], [], [], [], [], {}, 1))
+		response = handleReq(self.dbFile, {'QUERY_STRING': 'type=events&range=.&scale=1&fmt=rows'})
+		self.assertIsNone(response)
+
+	def test_events_req_with_index(self):
+		addTiedEvents(self.dbFile)
+		queryStrs = [
+			'type=events&range=-1999.2002-11-1&scale=1&incl=3&limit=2',
+			'type=events&range=.1999-11-27&scale=1&ctgs=event',
+			'type=events&range=1900.1900&scale=1',
+			'type=events&range=.&scale=10&incl=2',
+			'type=events&range=-5000.&scale=1&limit=3&imgonly=true',
+			'type=events&range=1950.2010&scale=1&ctgs=person.discovery&imgonly=true',
+			'type=events&range=1.2&scale=100',
+			'type=events&range=1999.2001&scale=1&limit=4&imgonly=true',
+			'type=events&range=.&scale=10&limit=3&ctgs=event',
+		]
+		for queryStr in queryStrs:
+			with patch('chrona.USE_EVENT_INDEX', False):
+				expected = handleReq(self.dbFile, {'QUERY_STRING': queryStr})
+			with patch('chrona.USE_EVENT_INDEX', True):
+				response = handleReq(self.dbFile, {'QUERY_STRING': queryStr})
+			self.assertEqual(response, expected, queryStr)
+		# Check that imgonly is applied with the index (a bare '&imgonly' would be dropped by parse_qs)
+		with patch('chrona.USE_EVENT_INDEX', True):
+			response = handleReq(self.dbFile, {'QUERY_STRING': 'type=events&range=.&scale=1&imgonly=true'})
+		self.assertEqual(response.unitCounts, {-2000: 1, 1900: 1, 1990: 1, 2000: 1, 2002: 1})
+
+	def test_events_req_with_index_after_db_replacement(self):
+		queryStr = 'type=events&range=-1999.2002-11-1&scale=1&incl=3&limit=2'
+		with patch('chrona.USE_EVENT_INDEX', True), patch('chrona.loadedIndexes', {}):
+			handleReq(self.dbFile, {'QUERY_STRING': queryStr})
+			# Replace the db by renaming a modified copy over it
+			newDbFile = os.path.join(self.tempDir.name, 'new.db')
+			shutil.copy(self.dbFile, newDbFile)
+			dbCon = sqlite3.connect(newDbFile)
+			dbCon.execute('UPDATE events SET title = "event 5" WHERE id = 5')
+			dbCon.commit()
+			dbCon.close()
+			os.replace(newDbFile, self.dbFile)
+			response = handleReq(self.dbFile, {'QUERY_STRING': queryStr})
+		self.assertEqual([event.title for event in response.events], ['event 5', 'event three'])
+
+	def test_events_req_with_tied_pops(self):
+		addTiedEvents(self.dbFile)
+		queryStrs = [
+			'type=events&range=1999.2001&scale=1&limit=3',
+			'type=events&range=2000.2000&scale=1&limit=4',
+			'type=events&range=.&scale=1&limit=5&ctgs=event.person',
+			'type=events&range=.&scale=10&limit=4&imgonly=true',
+			'type=events&range=.&scale=10&limit=2&incl=12',
+		]
+		expected = [handleReq(self.dbFile, {'QUERY_STRING': queryStr}) for queryStr in queryStrs]
+		self.assertEqual([event.id for event in expected[0].events], [5, 7, 8])
+		with patch('chrona.USE_EVENT_INDEX', True), patch('chrona.loadedIndexes', {}):
+			for queryStr, expectedResponse in zip(queryStrs, expected):
+				self.assertEqual(handleReq(self.dbFile, {'QUERY_STRING': queryStr}), expectedResponse, queryStr)
+		genServingData(self.dbFile)
+		for queryStr, expectedResponse in zip(queryStrs, expected):
+			self.assertEqual(handleReq(self.dbFile, {'QUERY_STRING': queryStr}), expectedResponse, queryStr)
+
+	def test_events_req_with_serving_table(self):
+		queryStrs = [
+			'type=events&range=-1999.2002-11-1&scale=1&incl=3&limit=2',
+			'type=events&range=.1999-11-27&scale=1&ctgs=event',
+			'type=events&range=1900.1900&scale=1',
+			'type=events&range=.&scale=10&incl=2',
+			'type=events&range=-5000.&scale=1&limit=3&imgonly=true',
+			'type=events&range=1950.2010&scale=1&ctgs=person.discovery&imgonly=true',
+		]
+		expected = [handleReq(self.dbFile, {'QUERY_STRING': queryStr}) for queryStr in queryStrs]
+		genServingData(self.dbFile)
+		for queryStr, expectedResponse in zip(queryStrs, expected):
+			response = handleReq(self.dbFile, {'QUERY_STRING': queryStr})
+			self.assertEqual(response, expectedResponse, queryStr)
+
+	def test_events_req_with_atlases(self):
+		createTestDbTable(
+			self.dbFile,
+			'CREATE TABLE event_atlas (id INT, scale INT, atlas TEXT, x INT, y INT, PRIMARY KEY (id, scale))',
+			'INSERT INTO event_atlas VALUES (?, ?, ?, ?, ?)',
+			{
+				(1, 1, 'a1', 0, 0),
+				(1, 10, 'a2', 200, 0),
+				(3, 1, 'a3', 0, 200),
+				(5, 1, 'a3', 200, 200),
+			}
+		)
+		response = handleReq(self.dbFile, {'QUERY_STRING': 'type=events&range=1900.2001&scale=1&incl=1&limit=2'})
+		self.assertEqual([event.atlas for event in response.events], [('a3', 200, 200), ('a1', 0, 0)])
+		response = handleReq(self.dbFile, {'QUERY_STRING': 'type=events&range=.&scale=10&fmt=cols'})
+		self.assertEqual(response.atlases, [None, ('a2', 200, 0)])
+		queryStrs = [
+			'type=events&range=-1999.2002-11-1&scale=1&incl=3&limit=2',
+			'type=events&range=1900.1900&scale=1',
+			'type=events&range=.&scale=10&incl=2',
+			'type=events&range=-5000.&scale=1&limit=3&imgonly=true',
+		]
+		expected = [handleReq(self.dbFile, {'QUERY_STRING': queryStr}) for queryStr in queryStrs]
+		with patch('chrona.USE_EVENT_INDEX', True):
+			for queryStr, expectedResponse in zip(queryStrs, expected):
+				self.assertEqual(handleReq(self.dbFile, {'QUERY_STRING': queryStr}), expectedResponse, queryStr)
+		genServingData(self.dbFile)
+		for queryStr, expectedResponse in zip(queryStrs, expected):
+			self.assertEqual(handleReq(self.dbFile, {'QUERY_STRING': queryStr}), expectedResponse, queryStr)
+
+	def test_batch_req(self):
+		response = handleReq(self.dbFile,
+			{'QUERY_STRING': 'type=batch&windows=-1999.2002-11-1,1,3,2_.1999-11-27,1_.,10,,1&ctgs=event.discovery'})
+		self.assertEqual(response, BatchResponse(
+			[
+				HistEvent(5, 'event five', HistDate(None, 2000, 1, 1), None, HistDate(None, 2001, 1, 1), None,
+					'event', 50, 51),
+				HistEvent(3, 'event three', HistDate(True, 1990, 10, 10), HistDate(True, 2000, 10, 10), None, None,
+					'discovery', 30, 0),
+				HistEvent(4, 'event four', HistDate(False, -2000, 10, 10), None, HistDate(False, 1, 10, 10), None,
+					'event', 20, 1000),
+				HistEvent(1, 'event one', HistDate(None, 1900, 1, 1), None, None, None, 'event', 10, 11),
+				HistEvent(6, 'event six', HistDate(None, 1900, 1, 1), None, HistDate(None, 2000, 1, 1), None,
+					'event', 60, 60),
+			],
+			[
+				WindowResult([5, 3], {1900: 2, 1990: 1, 2000: 1, 2001: 1}),
+				WindowResult([4, 1, 3], {-2000: 1, 1900: 2, 1990: 1}),
+				WindowResult([6], {190: 2}),
+			]))
+		for queryStr in ['type=batch', 'type=batch&windows=.', 'type=batch&windows=.,1,,,', 'type=batch&windows=.,1_']:
+			self.assertIsNone(handleReq(self.dbFile, {'QUERY_STRING': queryStr}), queryStr)
+
+	def test_count_req(self):
+		response = handleReq(self.dbFile, {'QUERY_STRING': 'type=count&range=1900.2001&scale=1'})
+		self.assertEqual(response, CountResponse(4, None))
+		response = handleReq(self.dbFile, {'QUERY_STRING': 'type=count&range=.&scale=1&ctgs=event.person.place'})
+		self.assertEqual(response, CountResponse(4, {'event': 3, 'person': 1, 'place': 0}))
+		response = handleReq(self.dbFile, {'QUERY_STRING': 'type=count&range=1995.&scale=1&ctgs=event'})
+		self.assertEqual(response, CountResponse(1, {'event': 1}))
+		response = handleReq(self.dbFile, {'QUERY_STRING': 'type=count&range=.1900&scale=10'})
+		self.assertEqual(response, CountResponse(0, None))
+		response = handleReq(self.dbFile, {'QUERY_STRING': 'type=count&range=.&scale=1&imgonly=true'})
+		self.assertIsNone(response)
+
 	def test_info_req(self):
 		response = handleReq(self.dbFile, {'QUERY_STRING': 'type=info&event=event%20three'})
 		self.assertEqual(response,
@@ -148,3 +383,331 @@ class TestHandleReq(unittest.TestCase):
 		self.assertEqual(response, SuggResponse(['event four', 'event two', 'event one'], False))
 		response = handleReq(self.dbFile, {'QUERY_STRING': 'type=sugg&input=event&ctgs=event&limit=1'})
 		self.assertEqual(response, SuggResponse(['event four'], True))
+
+	def test_sugg_req_with_fts(self):
+		genSearchData(self.dbFile)
+		self.test_sugg_req()
+		response = handleReq(self.dbFile, {'QUERY_STRING': 'type=sugg&input=VENT T&imgonly=true&limit=1'})
+		self.assertEqual(response, SuggResponse(['event two'], True))
+
+	def test_sugg_req_with_index(self):
+		queryStrs = [
+			'type=sugg&input=event t',
+			'type=sugg&input=o&ctgs=event.person',
+			'type=sugg&input=event&ctgs=event&limit=1',
+			'type=sugg&input=EV&limit=2&imgonly=true',
+			'type=sugg&input=eve&ctgs=discovery',
+			'type=sugg&input=event f&limit=1',
+			'type=sugg&input=x',
+		]
+		for prefixLen in [1, 3, 20]:
+			with patch('chrona.SUGG_INDEX_PREFIX_LEN', prefixLen), patch('chrona.loadedIndexes', {}):
+				for queryStr in queryStrs:
+					with patch('chrona.USE_SUGG_INDEX', False):
+						expected = handleReq(self.dbFile, {'QUERY_STRING': queryStr})
+					with patch('chrona.USE_SUGG_INDEX', True):
+						response = handleReq(self.dbFile, {'QUERY_STRING': queryStr})
+					self.assertEqual(response, expected, (queryStr, prefixLen))
+
+	def test_sugg_req_with_index_like_semantics(self):
+		dbCon = sqlite3.connect(self.dbFile)
+		dbCon.executemany('INSERT INTO events VALUES (?, ?, 2000, NULL, NULL, NULL, 0, "event")',
+			[(7, '\u00e9vent seven'), (8, '\u00c9VENT eight'), (9, 'event_nine'), (10, 'event%ten')])
+		dbCon.commit()
+		dbCon.close()
+		queryStrs = [
+			'type=sugg&input=\u00e9v', # LIKE only ignores the case of ASCII letters
+			'type=sugg&input=\u00c9VENT',
+			'type=sugg&input=ev_nt',
+			'type=sugg&input=event_',
+			'type=sugg&input=%25nine',
+			'type=sugg&input=event%25t',
+		]
+		for prefixLen in [1, 3, 20]:
+			with patch('chrona.SUGG_INDEX_PREFIX_LEN', prefixLen), patch('chrona.loadedIndexes', {}):
+				for queryStr in queryStrs:
+					with patch('chrona.USE_SUGG_INDEX', False):
+						expected = handleReq(self.dbFile, {'QUERY_STRING': queryStr})
+					with patch('chrona.USE_SUGG_INDEX', True):
+						response = handleReq(self.dbFile, {'QUERY_STRING': queryStr})
+					self.assertEqual(response, expected, (queryStr, prefixLen))
+		response = handleReq(self.dbFile, {'QUERY_STRING': 'type=sugg&input=\u00e9v'})
+		self.assertEqual(response, SuggResponse(['\u00e9vent seven'], False))
+
+	def test_load_indexes(self):
+		with patch.multiple('chrona', USE_EVENT_INDEX=True, USE_SUGG_INDEX=True, loadedIndexes={}):
+			chrona.loadIndexes(self.dbFile)
+			self.assertEqual({indexType for indexType, _ in chrona.loadedIndexes}, {chrona.EventIndex, chrona.SuggIndex})
+			# Check that requests use the loaded indexes
+			indexes = [index for _, index in chrona.loadedIndexes.values()]
+			handleReq(self.dbFile, {'QUERY_STRING': 'type=sugg&input=event t'})
+			handleReq(self.dbFile, {'QUERY_STRING': 'type=events&range=.&scale=1'})
+			self.assertEqual([index for _, index in chrona.loadedIndexes.values()], indexes)
+
+class TestEncodeResponse(unittest.TestCase):
+	def test_encode(self):
+		with tempfile.TemporaryDirectory() as tempDir:
+			dbFile = os.path.join(tempDir, 'data.db')
+			initTestDb(dbFile)
+			queryStrs = [
+				'type=events&range=.&scale=1&limit=10',
+				'type=events&range=-1999.2002-11-1&scale=1&incl=3&limit=2&imgonly=true',
+				'type=info&event=event%20three',
+				'type=info&event=event%20five',
+				'type=sugg&input=event&limit=3',
+				'type=batch&windows=.,1,,3_1900.2000,10',
+				'type=count&range=.&scale=1&ctgs=event.person',
+				'type=invalid',
+			]
+			for queryStr in queryStrs:
+				val = handleReq(dbFile, {'QUERY_STRING': queryStr})
+				self.assertEqual(encodeResponse(val), jsonpickle.encode(val, unpicklable=False), queryStr)
+		# Check for escaping and null values
+		val = EventInfo(
+			HistEvent(1, 'a "b" \u00e9', HistDate(None, -100), None, None, None, 'event', None, 0), None, 1, None)
+		self.assertEqual(encodeResponse(val), jsonpickle.encode(val, unpicklable=False))
+
+class TestCompression(unittest.TestCase):
+	def test_negotiate(self):
+		with patch('chrona.zstd', None):
+			self.assertEqual(chrona.negotiateEncoding('gzip, deflate, br, zstd'), 'gzip')
+			self.assertEqual(chrona.negotiateEncoding('zstd'), None)
+		with patch('chrona.zstd', object()): # Simulate zstd support
+			self.assertEqual(chrona.negotiateEncoding('gzip, deflate, br, zstd'), 'zstd')
+			self.assertEqual(chrona.negotiateEncoding('gzip;q=0.5, zstd;q=0'), 'gzip')
+			self.assertEqual(chrona.negotiateEncoding('*'), 'zstd')
+			self.assertEqual(chrona.negotiateEncoding('deflate, *;q=0'), None)
+			self.assertEqual(chrona.negotiateEncoding(''), None)
+
+	def test_compress(self):
+		data = json.dumps(list(range(20_000))).encode()
+		self.assertEqual(gzip.decompress(chrona.compressResponse(data, 'gzip')), data)
+		if chrona.zstd is not None:
+			self.assertEqual(chrona.zstd.decompress(chrona.compressResponse(data, 'zstd')), data)
+
+class TestResponseCache(unittest.TestCase):
+	def test_byte_limit(self):
+		cache = ResponseCache(10, 100)
+		for key in ['a', 'b', 'c']:
+			cache.put(key, chrona.CachedResponse(b'x' * 40))
+		self.assertEqual((cache.get('a'), cache.stats()['bytes'], cache.stats()['evictions']), (None, 80, 1))
+		# Check that compressed versions are counted
+		resp = cache.get('b')
+		assert resp is not None
+		cache.addCompressed('b', resp, 'gzip', b'z' * 30)
+		self.assertEqual(resp.compressed, {'gzip': b'z' * 30})
+		self.assertIsNone(cache.get('c')) # Was least recently used
+		self.assertEqual(cache.stats()['bytes'], 70)
+		# Check that responses larger than the limit aren't cached
+		cache.put('d', chrona.CachedResponse(b'x' * 101))
+		self.assertIsNone(cache.get('d'))
+		self.assertEqual(cache.stats()['size'], 1)
+		# Check that replacing a response updates the total
+		cache.put('b', chrona.CachedResponse(b'x' * 10))
+		self.assertEqual(cache.stats()['bytes'], 10)
+
+class TestDbConPool(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.TemporaryDirectory()
+		self.dbFile = os.path.join(self.tempDir.name, 'data.db')
+		initTestDb(self.dbFile)
+
+	def tearDown(self):
+		self.tempDir.cleanup()
+
+	def test_reuse(self):
+		pool = DbConPool(1)
+		dbCon = pool.acquire(self.dbFile)
+		with self.assertRaises(sqlite3.OperationalError): # Check for read-only access
+			dbCon.execute('DELETE FROM events')
+		pool.release(self.dbFile, dbCon)
+		self.assertIs(pool.acquire(self.dbFile), dbCon)
+		# Check for closing of connections that exceed the pool size
+		dbCon2 = pool.acquire(self.dbFile)
+		pool.release(self.dbFile, dbCon)
+		pool.release(self.dbFile, dbCon2)
+		with self.assertRaises(sqlite3.ProgrammingError):
+			dbCon2.execute('SELECT id FROM events')
+		# Check for closing of idle connections
+		pool.close()
+		with self.assertRaises(sqlite3.ProgrammingError):
+			dbCon.execute('SELECT id FROM events')
+
+	def test_replaced_db(self):
+		pool = DbConPool(2)
+		dbCon = pool.acquire(self.dbFile)
+		dbCon2 = pool.acquire(self.dbFile)
+		pool.release(self.dbFile, dbCon)
+		# Replace the db by renaming a new file over it
+		newDbFile = os.path.join(self.tempDir.name, 'new.db')
+		createTestDbTable(newDbFile, 'CREATE TABLE events (id INT PRIMARY KEY)', 'INSERT INTO events VALUES (?)', {(1,)})
+		os.replace(newDbFile, self.dbFile)
+		# Check that idle connections to the old file are closed, and that new ones use the new file
+		newDbCon = pool.acquire(self.dbFile)
+		self.assertIsNot(newDbCon, dbCon)
+		with self.assertRaises(sqlite3.ProgrammingError):
+			dbCon.execute('SELECT id FROM events')
+		self.assertEqual(newDbCon.execute('SELECT id FROM events').fetchall(), [(1,)])
+		# Check that a connection to the old file is closed when released
+		pool.release(self.dbFile, dbCon2)
+		with self.assertRaises(sqlite3.ProgrammingError):
+			dbCon2.execute('SELECT id FROM events')
+		pool.release(self.dbFile, newDbCon)
+		self.assertIs(pool.acquire(self.dbFile), newDbCon)
+		pool.close()
+
+	def test_table_names(self):
+		pool = DbConPool(1)
+		dbCon = pool.acquire(self.dbFile)
+		queries: list[str] = []
+		dbCon.set_trace_callback(queries.append)
+		for _ in range(2): # Check that table names are read once per connection
+			self.assertTrue(chrona.tableExists('events', dbCon.cursor()))
+			self.assertFalse(chrona.tableExists('disp_events', dbCon.cursor()))
+		self.assertEqual(len([query for query in queries if 'sqlite_master' in query]), 1)
+		# Check that a connection opened after a db change sees new tables
+		pool.release(self.dbFile, dbCon)
+		genServingData(self.dbFile)
+		dbCon = pool.acquire(self.dbFile)
+		self.assertTrue(chrona.tableExists('disp_events', dbCon.cursor()))
+		pool.release(self.dbFile, dbCon)
+		pool.close()
+
+	def test_profiles(self):
+		for profile in chrona.DB_PROFILES:
+			dbCon = chrona.openDb(self.dbFile, profile)
+			with self.assertRaises(sqlite3.OperationalError, msg=profile): # Check for read-only access
+				dbCon.execute('DELETE FROM events')
+			_, pragmas = chrona.DB_PROFILES[profile]
+			for name, value in pragmas.items():
+				if isinstance(value, int):
+					self.assertEqual(dbCon.execute(f'PRAGMA {name}').fetchone()[0], value, (profile, name))
+			self.assertEqual(len(dbCon.execute('SELECT id FROM events').fetchall()), 6)
+			dbCon.close()
+		with patch('chrona.DB_PROFILE', 'unknown'): # Check for fallback to the default profile
+			dbCon = chrona.openDb(self.dbFile)
+			self.assertEqual(dbCon.execute('PRAGMA query_only').fetchone()[0], 0)
+			dbCon.close()
+
+class TestApplication(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.TemporaryDirectory()
+		self.dbFile = os.path.join(self.tempDir.name, 'data.db')
+		initTestDb(self.dbFile)
+		patcher = patch.multiple('chrona', DB_FILE=self.dbFile, responseCache=ResponseCache(2))
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def tearDown(self):
+		self.tempDir.cleanup()
+
+	def getResponse(self, environ: dict[str, str]) -> tuple[str, dict[str, str], bytes]:
+		""" Runs the WSGI script, and returns the status, headers, and body """
+		result: dict[str, Any] = {}
+		def start_response(status, headers):
+			result['status'] = status
+			result['headers'] = dict(headers)
+		body = b''.join(application(environ, start_response))
+		return result['status'], result['headers'], body
+
+	def test_caching(self):
+		environ = {'QUERY_STRING': 'type=sugg&input=event t', 'HTTP_ACCEPT_ENCODING': 'gzip'}
+		status, headers, body = self.getResponse(environ)
+		self.assertEqual(status, '200 OK')
+		self.assertEqual(json.loads(body), {'suggs': ['event two', 'event three'], 'hasMore': False})
+		etag = headers['ETag']
+		# Check for cache hit with differently-ordered query params
+		status, headers, body2 = self.getResponse({'QUERY_STRING': 'input=event t&type=sugg', 'HTTP_ACCEPT_ENCODING': 'gzip'})
+		self.assertEqual((status, headers['ETag'], body2), ('200 OK', etag, body))
+		self.assertEqual(chrona.responseCache.stats(),
+			{'size': 1, 'bytes': len(body), 'hits': 1, 'misses': 1, 'evictions': 0})
+		# Check for gzip compression, done once per cached response
+		with patch('chrona.compressResponse', wraps=chrona.compressResponse) as compressMock:
+			for _ in range(2):
+				status, headers, body = self.getResponse({
+					'QUERY_STRING': 'type=events&range=.&scale=1&limit=10', 'HTTP_ACCEPT_ENCODING': 'gzip, deflate'})
+				self.assertEqual(headers['Content-encoding'], 'gzip')
+				self.assertEqual(len(json.loads(gzip.decompress(body))['events']), 5)
+			self.assertEqual(compressMock.call_count, 1)
+		# Check for 304 response
+		status, headers, body = self.getResponse({**environ, 'HTTP_IF_NONE_MATCH': f'"abc", {etag}'})
+		self.assertEqual((status, body), ('304 Not Modified', b''))
+		# Check for eviction
+		status, headers, body = self.getResponse({'QUERY_STRING': 'type=info&event=event%20three'})
+		stats = chrona.responseCache.stats()
+		self.assertEqual(stats, {**stats, 'size': 2, 'hits': 2, 'misses': 3, 'evictions': 1})
+		self.assertGreater(stats['bytes'], len(body))
+		# Check for different tags for different content codings
+		environ = {'QUERY_STRING': 'type=events&range=.&scale=1&limit=10', 'HTTP_ACCEPT_ENCODING': 'gzip'}
+		status, headers, body = self.getResponse(environ)
+		gzipEtag = headers['ETag']
+		status, headers, body = self.getResponse({'QUERY_STRING': environ['QUERY_STRING']})
+		self.assertNotEqual(headers['ETag'], gzipEtag)
+		status, headers, body = self.getResponse({'QUERY_STRING': environ['QUERY_STRING'], 'HTTP_IF_NONE_MATCH': gzipEtag})
+		self.assertEqual(status, '200 OK')
+		status, headers, body = self.getResponse({**environ, 'HTTP_IF_NONE_MATCH': 'W/' + gzipEtag})
+		self.assertEqual(status, '304 Not Modified')
+
+	def test_streaming(self):
+		queryStr = 'type=events&range=-1999.2002-11-1&scale=1&incl=3&limit=2'
+		expected = json.loads(encodeResponse(handleReq(self.dbFile, {'QUERY_STRING': queryStr})))
+		for acceptEncoding in ['', 'gzip']:
+			with patch('chrona.NDJSON_CHUNK_EVENTS', 1):
+				status, headers, body = self.getResponse(
+					{'QUERY_STRING': queryStr + '&fmt=ndjson', 'HTTP_ACCEPT_ENCODING': acceptEncoding})
+			self.assertEqual((status, headers['Content-type']), ('200 OK', 'application/x-ndjson'))
+			if acceptEncoding:
+				self.assertEqual(headers['Content-encoding'], 'gzip')
+				body = gzip.decompress(body)
+			lines = [json.loads(line) for line in body.decode().splitlines()]
+			self.assertEqual(lines[0], {'unitCounts': expected['unitCounts'], 'unitCountsWidth': 1})
+			self.assertEqual(lines[1:], expected['events'])
+		self.assertEqual(chrona.responseCache.stats()['size'], 0)
+		status, headers, body = self.getResponse({'QUERY_STRING': 'type=events&fmt=ndjson'}) # No scale
+		self.assertEqual(body, b'null')
+
+	def test_timing(self):
+		logFile = os.path.join(self.tempDir.name, 'slow.log')
+		queryStr = 'type=events&range=.&scale=1&limit=10'
+		with patch.multiple('chrona', REQ_TIMING=True, SLOW_REQ_MS=0, SLOW_REQ_LOG=logFile):
+			status, headers, body = self.getResponse({'QUERY_STRING': queryStr, 'HTTP_ACCEPT_ENCODING': 'gzip'})
+		phases = [item.split(';')[0] for item in headers['Server-Timing'].split(', ')]
+		self.assertEqual(phases, ['parse', 'db', 'convert', 'encode', 'compress', 'total'])
+		with open(logFile) as file:
+			fields = file.read().rstrip('\n').split('\t')
+		self.assertEqual(fields[2], queryStr)
+		self.assertEqual([item.split('=')[0] for item in fields[3].split(' ')], phases[:-1])
+		# Check for no timing when disabled
+		status, headers, body = self.getResponse({'QUERY_STRING': 'type=events&range=.&scale=10'})
+		self.assertNotIn('Server-Timing', headers)
+		# Check that a failure to write the log is reported once, and doesn't fail requests
+		logFile = os.path.join(self.tempDir.name, 'missing', 'slow.log')
+		with patch.multiple('chrona', REQ_TIMING=True, SLOW_REQ_MS=0, SLOW_REQ_LOG=logFile, slowReqLogFailed=False), \
+				patch('sys.stderr', new_callable=io.StringIO) as stderr:
+			for _ in range(2):
+				status, headers, body = self.getResponse({'QUERY_STRING': queryStr})
+				self.assertEqual(status, '200 OK')
+		self.assertEqual(stderr.getvalue().count('ERROR'), 1)
+
+	def test_metrics(self):
+		with patch('chrona.metrics', chrona.RequestMetrics()):
+			for queryStr in ['type=events&range=.&scale=1', 'type=events&range=.&scale=1', 'type=events', 'type=x']:
+				self.getResponse({'QUERY_STRING': queryStr})
+			status, headers, body = self.getResponse({'QUERY_STRING': 'type=metrics'})
+		self.assertEqual(headers['Content-type'], 'text/plain; version=0.0.4')
+		values: dict[str, float] = {}
+		for line in body.decode().splitlines():
+			if not line.startswith('#'):
+				name, value = line.rsplit(' ', 1)
+				values[name] = float(value)
+		self.assertEqual(values['chrona_requests_total{type="events"}'], 3)
+		self.assertEqual(values['chrona_requests_total{type="other"}'], 1)
+		self.assertEqual(values['chrona_errors_total{type="events"}'], 1) # Request without a scale
+		self.assertEqual(values['chrona_request_seconds_bucket{type="events",le="+Inf"}'], 3)
+		self.assertEqual(values['chrona_request_seconds_count{type="events"}'], 3)
+		self.assertEqual(values['chrona_db_seconds_count{type="events"}'], 2) # Excludes the cache hit
+		self.assertEqual(values['chrona_response_bytes_bucket{type="events",le="100"}'], 1)
+		self.assertEqual(values['chrona_response_bytes_bucket{type="events",le="1000"}'], 1)
+		self.assertEqual(values['chrona_response_bytes_bucket{type="events",le="10000"}'], 3)
+		self.assertEqual(values['chrona_cache_hits_total'], 1)
+		self.assertEqual(values['chrona_cache_hit_ratio'], 0.25)
@@ -0,0 +1,70 @@
+import unittest
+import tempfile
+import os
+
+from tests.common import createTestDbTable, readTestDbTable
+from hist_data.compact_db import compactDb
+
+class TestCompactDb(unittest.TestCase):
+	def test_compact(self):
+		with tempfile.TemporaryDirectory() as tempDir:
+			# Create temp history db
+			dbFile = os.path.join(tempDir, 'data.db')
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE events (id INT PRIMARY KEY, title TEXT UNIQUE, ' \
+					'start INT, start_upper INT, end INT, end_upper INT, fmt INT, ctg TEXT)',
+				'INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+				{
+					(2, 'event two', 2452594, None, 2455369, None, 3, 'person'),
+					(1, 'event one', 1900, None, None, None, 0, 'event'),
+					(-1, 'picked event', 1950, None, None, None, 0, 'event'),
+				}
+			)
+			createTestDbTable(
+				dbFile,
+				'CREATE INDEX events_id_start_idx ON events(id, start)',
+				'INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+				set()
+			)
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE event_disp (id INT, scale INT, unit INT, PRIMARY KEY (id, scale))',
+				'INSERT INTO event_disp VALUES (?, ?, ?)',
+				{
+					(1, 1, 1900),
+					(2, 1, 2002),
+					(-1, 1, 1950),
+				}
+			)
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE unused (id INT PRIMARY KEY)',
+				'INSERT INTO unused VALUES (?)',
+				{(1,)}
+			)
+
+			# Run
+			outFile = os.path.join(tempDir, 'data_serving.db')
+			compactDb(dbFile, outFile, 8192)
+
+			# Check
+			self.assertEqual(os.stat(outFile).st_mode & 0o222, 0) # Check read-only
+			self.assertEqual(
+				readTestDbTable(outFile, 'SELECT type, name FROM sqlite_master WHERE name NOT LIKE "sqlite_%"'),
+				{
+					('table', 'events'),
+					('index', 'events_title_nocase_idx'),
+					('table', 'event_disp'),
+					('index', 'event_disp_scale_unit_idx'),
+				}
+			)
+			self.assertEqual(
+				readTestDbTable(outFile, 'SELECT * FROM events'),
+				readTestDbTable(dbFile, 'SELECT * FROM events'),
+			)
+			self.assertEqual(
+				readTestDbTable(outFile, 'SELECT * FROM event_disp'),
+				readTestDbTable(dbFile, 'SELECT * FROM event_disp'),
+			)
+			self.assertEqual(readTestDbTable(outFile, 'PRAGMA page_size'), {(8192,)})
@@ -167,3 +167,29 @@ class TestGenData(unittest.TestCase):
 					(5, DAY_SCALE, 2415307),
 				}
 			)
+			self.assertEqual(
+				readTestDbTable(dbFile, 'SELECT ctg, scale, unit, cumul_count FROM dist_sums WHERE scale >= 1'),
+				{
+					('', 10, 190, 6),
+					('', 10, 200, 7),
+					('event', 10, 190, 6),
+					('human', 10, 200, 1),
+					('', 1, 1900, 5),
+					('', 1, 1901, 6),
+					('', 1, 2002, 7),
+					('event', 1, 1900, 5),
+					('event', 1, 1901, 6),
+					('human', 1, 2002, 1),
+				}
+			)
+			self.assertEqual(
+				readTestDbTable(dbFile, 'SELECT ctg, scale, unit, cumul_count FROM img_dist_sums WHERE scale >= 1'),
+				{
+					('', 10, 190, 5),
+					('event', 10, 190, 5),
+					('', 1, 1900, 4),
+					('', 1, 1901, 5),
+					('event', 1, 1900, 4),
+					('event', 1, 1901, 5),
+				}
+			)
@@ -3,9 +3,13 @@ from unittest.mock import patch
 import tempfile
 import os
 import shutil
+from concurrent.futures.process import BrokenProcessPool
 
-from tests.common import createTestDbTable, readTestDbTable
-from hist_data.gen_imgs import genImgs
+from PIL import Image, ImageDraw
+
+from tests.common import createTestFile, createTestDbTable, readTestDbTable
+from hist_data.gen_imgs import genImgs, convertImage, findCrop, genVariants, genAllVariants, genAtlases, \
+	ATLAS_DIR, ATLAS_TILE_UNITS, IMG_OUT_SZ, IMG_CROP_SZ, MAX_CONVERT_ATTEMPTS
 
 TEST_IMG = os.path.join(os.path.dirname(__file__), 'test_img.png')
 
@@ -61,7 +65,7 @@ class TestGenImgs(unittest.TestCase):
 
 			# Run
 			outDir = os.path.join(tempDir, 'imgs')
-			genImgs(imgDir, imgDb, outDir, dbFile)
+			genImgs(imgDir, imgDb, outDir, dbFile, 1) # Converts in the same process, using the mock
 
 			# Check
 			self.assertEqual(set(os.listdir(outDir)), {
@@ -83,3 +87,295 @@ class TestGenImgs(unittest.TestCase):
 					(200, 'https://en.wikipedia.org/wiki/File:two.jpeg', 'cc-by', 'author2', 'credits2'),
 				}
 			)
+			self.assertEqual(
+				readTestDbTable(dbFile, 'SELECT img_id, size, fmt FROM img_variants'),
+				{
+					(100, IMG_OUT_SZ, 'jpg'),
+					(200, IMG_OUT_SZ, 'jpg'),
+				}
+			)
+			self.assertEqual(
+				readTestDbTable(dbFile, 'SELECT img_id, status, attempts FROM img_manifest'),
+				{
+					(100, 'done', 1),
+					(200, 'done', 1),
+				}
+			)
+
+	@patch('hist_data.gen_imgs.convertImage', autospec=True)
+	def test_gen_with_broken_pool(self, convertImageMock):
+		with tempfile.TemporaryDirectory() as tempDir:
+			def convert(imgPath, outPath):
+				if imgPath.endswith('200.jpg'):
+					raise BrokenProcessPool('A worker process was killed')
+				shutil.copy(imgPath, outPath)
+				return True
+			convertImageMock.side_effect = convert
+
+			# Create temp images, image db, and history db
+			imgDir = os.path.join(tempDir, 'enwiki_imgs')
+			os.mkdir(imgDir)
+			shutil.copy(TEST_IMG, os.path.join(imgDir, '100.jpg'))
+			shutil.copy(TEST_IMG, os.path.join(imgDir, '200.jpg'))
+			imgDb = os.path.join(tempDir, 'img_data.db')
+			createTestDbTable(
+				imgDb,
+				'CREATE TABLE page_imgs (page_id INT PRIMARY KEY, title TEXT UNIQUE, img_name TEXT)',
+				'INSERT INTO page_imgs VALUES (?, ?, ?)',
+				{(1, 'first', 'one.jpg'), (2, 'second', 'two.jpg')}
+			)
+			createTestDbTable(
+				imgDb,
+				'CREATE TABLE imgs (id INT PRIMARY KEY, name TEXT UNIQUE, ' \
+					'license TEXT, artist TEXT, credit TEXT, restrictions TEXT, url TEXT)',
+				'INSERT INTO imgs VALUES (?, ?, ?, ?, ?, ?, ?)',
+				{
+					(100, 'one.jpg', 'cc0', 'author1', 'credits1', '', 'https://upload.wikimedia.org/one.jpg'),
+					(200, 'two.jpg', 'cc0', 'author2', 'credits2', '', 'https://upload.wikimedia.org/two.jpg'),
+				}
+			)
+			dbFile = os.path.join(tempDir, 'data.db')
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE events (id INT PRIMARY KEY, title TEXT UNIQUE, ' \
+					'start INT, start_upper INT, end INT, end_upper INT, fmt INT, ctg TEXT)',
+				'INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+				{(10, 'first', 100, 1000, None, None, 0, 'event'), (20, 'second', 10, 20, None, None, 0, 'event')}
+			)
+
+			# Run, and check that the raised exception is recorded as a failure, without stopping other conversions
+			genImgs(imgDir, imgDb, os.path.join(tempDir, 'imgs'), dbFile, 1)
+			self.assertEqual(
+				readTestDbTable(dbFile, 'SELECT img_id, status, attempts FROM img_manifest'),
+				{(100, 'done', 1), (200, 'failed', 1)}
+			)
+			self.assertEqual(readTestDbTable(dbFile, 'SELECT id, img_id FROM event_imgs'), {(10, 100)})
+
+	def test_gen_with_pool(self):
+		with tempfile.TemporaryDirectory() as tempDir:
+			# Create temp images
+			imgDir = os.path.join(tempDir, 'enwiki_imgs')
+			os.mkdir(imgDir)
+			Image.new('RGB', (600, 450), (0, 0, 255)).save(os.path.join(imgDir, '100.jpg'))
+			shutil.copy(TEST_IMG, os.path.join(imgDir, '200.png'))
+			createTestFile(os.path.join(imgDir, '300.jpg'), 'File not found: 300.jpg') # Causes a conversion failure
+
+			# Create temp image db
+			imgDb = os.path.join(tempDir, 'img_data.db')
+			createTestDbTable(
+				imgDb,
+				'CREATE TABLE page_imgs (page_id INT PRIMARY KEY, title TEXT UNIQUE, img_name TEXT)',
+				'INSERT INTO page_imgs VALUES (?, ?, ?)',
+				{(1, 'first', 'one.jpg'), (2, 'second', 'two.png'), (3, 'third', 'three.jpg'), (4, 'fourth', 'four.jpg')}
+			)
+			createTestDbTable(
+				imgDb,
+				'CREATE TABLE imgs (id INT PRIMARY KEY, name TEXT UNIQUE, ' \
+					'license TEXT, artist TEXT, credit TEXT, restrictions TEXT, url TEXT)',
+				'INSERT INTO imgs VALUES (?, ?, ?, ?, ?, ?, ?)',
+				{
+					(100, 'one.jpg', 'cc0', 'author1', 'credits1', '', 'https://upload.wikimedia.org/one.jpg'),
+					(200, 'two.png', 'cc0', 'author2', 'credits2', '', 'https://upload.wikimedia.org/two.png'),
+					(300, 'three.jpg', 'cc0', 'author3', 'credits3', '', 'https://upload.wikimedia.org/three.jpg'),
+					(400, 'four.jpg', 'cc0', 'author4', 'credits4', '', 'https://upload.wikimedia.org/four.jpg'),
+				}
+			)
+
+			# Create temp history db
+			dbFile = os.path.join(tempDir, 'data.db')
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE events (id INT PRIMARY KEY, title TEXT UNIQUE, ' \
+					'start INT, start_upper INT, end INT, end_upper INT, fmt INT, ctg TEXT)',
+				'INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+				{
+					(10, 'first', 100, 1000, None, None, 0, 'event'),
+					(20, 'second', 10, 20, None, None, 0, 'event'),
+					(30, 'third', 1, 20, 30, 40, 1, 'event'),
+					(40, 'fourth', 1, 20, 30, 40, 1, 'event'),
+				}
+			)
+
+			# Run
+			outDir = os.path.join(tempDir, 'imgs')
+			genImgs(imgDir, imgDb, outDir, dbFile, 2)
+
+			# Check that successful conversions were recorded
+			self.assertIn('100-400.webp', os.listdir(outDir))
+			self.assertIn('200-128.jpg', os.listdir(outDir))
+			for filename in ['100.jpg', '200.jpg']:
+				with Image.open(os.path.join(outDir, filename)) as img:
+					self.assertEqual(img.size, (IMG_OUT_SZ, IMG_OUT_SZ))
+			self.assertEqual(readTestDbTable(dbFile, 'SELECT id, img_id FROM event_imgs'), {(10, 100), (20, 200)})
+			self.assertEqual(readTestDbTable(dbFile, 'SELECT id FROM images'), {(100,), (200,)})
+			self.assertEqual(
+				readTestDbTable(dbFile, 'SELECT img_id, status, attempts FROM img_manifest'),
+				{
+					(100, 'done', 1),
+					(200, 'done', 1),
+					(300, 'failed', 1),
+					(400, 'skipped', 0),
+				}
+			)
+			self.assertEqual(
+				readTestDbTable(dbFile, 'SELECT img_id, bytes FROM img_manifest WHERE img_id = 100'),
+				{(100, sum(os.path.getsize(os.path.join(outDir, f)) for f in os.listdir(outDir) if f.startswith('100')))}
+			)
+
+			# Check that re-runs skip completed conversions, and retry failures a limited number of times
+			mtime = os.path.getmtime(os.path.join(outDir, '100.jpg'))
+			for _ in range(MAX_CONVERT_ATTEMPTS):
+				genImgs(imgDir, imgDb, outDir, dbFile, 2)
+			self.assertEqual(os.path.getmtime(os.path.join(outDir, '100.jpg')), mtime)
+			self.assertEqual(
+				readTestDbTable(dbFile, 'SELECT img_id, status, attempts FROM img_manifest WHERE status != "done"'),
+				{(300, 'failed', MAX_CONVERT_ATTEMPTS), (400, 'skipped', 0)}
+			)
+			self.assertEqual(readTestDbTable(dbFile, 'SELECT id, img_id FROM event_imgs'), {(10, 100), (20, 200)})
+
+	def test_convert(self):
+		with tempfile.TemporaryDirectory() as tempDir:
+			imgPath = os.path.join(tempDir, 'in.jpg')
+			Image.new('RGB', (1200, 800)).save(imgPath)
+			outPath = os.path.join(tempDir, '1.jpg')
+			self.assertTrue(convertImage(imgPath, outPath))
+			with Image.open(os.path.join(tempDir, f'1-{IMG_CROP_SZ}.jpg')) as img:
+				self.assertEqual(img.size, (IMG_CROP_SZ, IMG_CROP_SZ))
+			self.assertFalse(convertImage(imgPath, outPath)) # Output already exists
+
+	def test_find_crop(self):
+		# Check that crops contain a detailed and colourful region
+		for size, region in [((600, 200), (400, 0, 600, 200)), ((200, 600), (0, 100, 200, 300))]:
+			img = Image.new('RGB', size, (128, 128, 128))
+			draw = ImageDraw.Draw(img)
+			for i in range(0, 200, 10):
+				draw.rectangle((region[0] + i, region[1], region[0] + i + 4, region[3]), fill=(255, 40, 0))
+			box = findCrop(img)
+			self.assertEqual((box[2] - box[0], box[3] - box[1]), (200, 200))
+			overlap = 200 - abs(box[0] - region[0]) - abs(box[1] - region[1])
+			self.assertGreaterEqual(overlap / 200, 0.8, box)
+		self.assertEqual(findCrop(Image.new('RGB', (50, 50))), (0, 0, 50, 50))
+
+	def test_variants(self):
+		with tempfile.TemporaryDirectory() as tempDir:
+			# Create temp images
+			outDir = os.path.join(tempDir, 'imgs')
+			os.mkdir(outDir)
+			Image.new('RGB', (400, 400), (255, 0, 0)).save(os.path.join(outDir, '100.jpg'))
+			shutil.copy(TEST_IMG, os.path.join(outDir, '200.jpg')) # Smaller than some variants
+			Image.new('RGB', (10, 10)).save(os.path.join(outDir, '300.jpg')) # Not in the db
+
+			# Create temp history db
+			dbFile = os.path.join(tempDir, 'data.db')
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE images (id INT PRIMARY KEY, url TEXT, license TEXT, artist TEXT, credit TEXT)',
+				'INSERT INTO images VALUES (?, ?, ?, ?, ?)',
+				{
+					(100, 'url1', 'cc0', 'artist1', 'credit1'),
+					(200, 'url2', 'cc0', 'artist2', 'credit2'),
+				}
+			)
+
+			# Run
+			self.assertTrue(genVariants(os.path.join(outDir, '100.jpg')))
+			genAllVariants(outDir, dbFile)
+
+			# Check
+			self.assertEqual(set(os.listdir(outDir)), {
+				'100-64.webp', '100-64.jpg', '100-128.webp', '100-128.jpg', '100-200.webp', '100.jpg',
+					'100-400.webp', '100-400.jpg',
+				'200-64.webp', '200-64.jpg', '200-128.webp', '200-128.jpg', '200-200.webp', '200.jpg',
+				'300.jpg',
+			})
+			for filename in ['100.jpg', '100-64.webp', '200.jpg']:
+				with Image.open(os.path.join(outDir, filename)) as img:
+					size = IMG_OUT_SZ if '-' not in filename else 64
+					self.assertEqual(img.size, (size, size))
+			variants = readTestDbTable(dbFile, 'SELECT img_id, size, fmt, bytes FROM img_variants')
+			self.assertEqual(len(variants), 14)
+			for imgId, size, fmt, numBytes in variants:
+				filename = f'{imgId}.jpg' if (size, fmt) == (IMG_OUT_SZ, 'jpg') else f'{imgId}-{size}.{fmt}'
+				self.assertEqual(numBytes, os.path.getsize(os.path.join(outDir, filename)))
+
+	def test_atlases(self):
+		with tempfile.TemporaryDirectory() as tempDir:
+			# Create temp images, each with a different colour
+			outDir = os.path.join(tempDir, 'imgs')
+			os.mkdir(outDir)
+			colours = {100: (255, 0, 0), 200: (0, 255, 0), 300: (0, 0, 255)}
+			for imgId, colour in colours.items():
+				Image.new('RGB', (IMG_OUT_SZ, IMG_OUT_SZ), colour).save(os.path.join(outDir, f'{imgId}.jpg'))
+
+			# Create temp history db
+			dbFile = os.path.join(tempDir, 'data.db')
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE event_imgs (id INT PRIMARY KEY, img_id INT)',
+				'INSERT INTO event_imgs VALUES (?, ?)',
+				{(1, 100), (2, 200), (3, 200), (4, 300), (5, 400)}
+			)
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE pop (id INT PRIMARY KEY, pop INT)',
+				'INSERT INTO pop VALUES (?, ?)',
+				{(1, 10), (2, 30), (3, 20), (4, 5), (5, 50), (6, 60)}
+			)
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE event_disp (id INT, scale INT, unit INT, PRIMARY KEY (id, scale))',
+				'INSERT INTO event_disp VALUES (?, ?, ?)',
+				{
+					(1, 1, 0),
+					(2, 1, ATLAS_TILE_UNITS - 1),
+					(3, 1, ATLAS_TILE_UNITS - 1),
+					(6, 1, 1), # Has no image
+					(4, 1, ATLAS_TILE_UNITS), # In a different tile
+					(1, 10, 0),
+				}
+			)
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE img_disp (id INT, scale INT, unit INT, PRIMARY KEY (id, scale))',
+				'INSERT INTO img_disp VALUES (?, ?, ?)',
+				{
+					(1, 1, 0),
+					(5, 1, 0), # Has no image file
+				}
+			)
+
+			# Run
+			genAtlases(outDir, dbFile)
+
+			# Check
+			rows = readTestDbTable(dbFile, 'SELECT id, scale, atlas, x, y FROM event_atlas')
+			atlasNames = {(eventId, scale): atlasName for eventId, scale, atlasName, _, _ in rows}
+			firstAtlas = atlasNames[(1, 1)]
+			self.assertEqual(
+				{(eventId, scale, x, y) for eventId, scale, _, x, y in rows},
+				{
+					(1, 1, 0, 0),
+					(2, 1, IMG_OUT_SZ, 0),
+					(3, 1, IMG_OUT_SZ, 0),
+					(4, 1, 0, 0),
+					(1, 10, 0, 0),
+				}
+			)
+			self.assertEqual(atlasNames[(2, 1)], firstAtlas)
+			self.assertEqual(atlasNames[(3, 1)], firstAtlas)
+			self.assertEqual(len(set(atlasNames.values())), 3)
+			atlasDir = os.path.join(outDir, ATLAS_DIR)
+			self.assertEqual(set(os.listdir(atlasDir)), {f'{atlasName}.jpg' for atlasName in atlasNames.values()})
+			with Image.open(os.path.join(atlasDir, f'{firstAtlas}.jpg')) as atlas:
+				for (x, y), imgId in [((0, 0), 100), ((IMG_OUT_SZ, 0), 200)]:
+					pixel = atlas.getpixel((x + IMG_OUT_SZ // 2, y + IMG_OUT_SZ // 2))
+					self.assertTrue(all(abs(a - b) < 10 for a, b in zip(pixel, colours[imgId])))
+
+			# Regenerate with a changed image, and check that only the changed atlas gets a new name
+			Image.new('RGB', (IMG_OUT_SZ, IMG_OUT_SZ), (255, 255, 0)).save(os.path.join(outDir, '300.jpg'))
+			genAtlases(outDir, dbFile)
+			newAtlasNames = {(eventId, scale): atlasName for eventId, scale, atlasName, _, _
+				in readTestDbTable(dbFile, 'SELECT id, scale, atlas, x, y FROM event_atlas')}
+			self.assertEqual(newAtlasNames[(1, 1)], firstAtlas)
+			self.assertNotEqual(newAtlasNames[(4, 1)], atlasNames[(4, 1)])
+			self.assertEqual(set(os.listdir(atlasDir)), {f'{atlasName}.jpg' for atlasName in newAtlasNames.values()})
@@ -6,11 +6,12 @@ import shutil
 
 from tests.common import createTestFile, createTestDbTable, readTestDbTable
 from hist_data.gen_picked_data import genData
+from hist_data.gen_search_data import genData as genSearchData
 
 TEST_IMG = os.path.join(os.path.dirname(__file__), 'test_img.png')
 
 class TestGenImgs(unittest.TestCase):
-	@patch('hist_data.gen_imgs.convertImage', autospec=True)
+	@patch('hist_data.gen_picked_data.convertImage', autospec=True)
 	def test_gen(self, convertImageMock):
 		with tempfile.TemporaryDirectory() as tempDir:
 			convertImageMock.side_effect = lambda imgPath, outPath: shutil.copy(imgPath, outPath)
@@ -137,6 +138,9 @@ class TestGenImgs(unittest.TestCase):
 			os.mkdir(imgOutDir)
 			shutil.copy(TEST_IMG, os.path.join(imgOutDir, '10.jpg'))
 
+			# Create existing search index
+			genSearchData(dbFile)
+
 			# Run
 			genData(pickedDir, pickedEvtFile, dbFile, imgOutDir, [10, 1])
 
@@ -208,3 +212,11 @@ class TestGenImgs(unittest.TestCase):
 					(-1, 1, 2019),
 				}
 			)
+			self.assertEqual(
+				readTestDbTable(dbFile, 'SELECT rowid, title, id FROM events_fts'),
+				{
+					(1, 'COVID-19 Pandemic', -1),
+					(2, 'event one', 1),
+					(3, 'foo', 2),
+				}
+			)
@@ -0,0 +1,49 @@
+import unittest
+import tempfile
+import os
+
+from tests.common import createTestDbTable, readTestDbTable
+from hist_data.gen_search_data import genData
+
+class TestGenData(unittest.TestCase):
+	def test_gen(self):
+		with tempfile.TemporaryDirectory() as tempDir:
+			# Create temp history db
+			dbFile = os.path.join(tempDir, 'data.db')
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE events (id INT PRIMARY KEY, title TEXT UNIQUE, ' \
+					'start INT, start_upper INT, end INT, end_upper INT, fmt INT, ctg TEXT)',
+				'INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+				{
+					(1, 'Battle of Hastings', 1066, None, None, None, 0, 'event'),
+					(2, 'Ada Lovelace', 2378497, None, 2385058, None, 1, 'person'),
+					(3, 'Hastings', 1000, None, None, None, 0, 'place'),
+				}
+			)
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE pop (id INT PRIMARY KEY, pop INT)',
+				'INSERT INTO pop VALUES (?, ?)',
+				{
+					(1, 20),
+					(2, 50),
+				}
+			)
+
+			# Run
+			genData(dbFile)
+
+			# Check
+			self.assertEqual(
+				readTestDbTable(dbFile, 'SELECT rowid, title, id, ctg FROM events_fts'),
+				{
+					(2, 'Battle of Hastings', 1, 'event'), # Rowids are popularity ranks
+					(1, 'Ada Lovelace', 2, 'person'),
+					(3, 'Hastings', 3, 'place'),
+				}
+			)
+			self.assertEqual(
+				readTestDbTable(dbFile, 'SELECT id FROM events_fts WHERE title LIKE "%astin%"'),
+				{(1,), (3,)}
+			)
@@ -0,0 +1,83 @@
+import unittest
+import tempfile
+import os
+
+from tests.common import createTestDbTable, readTestDbTable
+from hist_data.gen_serving_data import genData
+
+class TestGenData(unittest.TestCase):
+	def test_gen(self):
+		with tempfile.TemporaryDirectory() as tempDir:
+			# Create temp history db
+			dbFile = os.path.join(tempDir, 'data.db')
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE events (id INT PRIMARY KEY, title TEXT UNIQUE, ' \
+					'start INT, start_upper INT, end INT, end_upper INT, fmt INT, ctg TEXT)',
+				'INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+				{
+					(1, 'event one', 1900, None, None, None, 0, 'event'),
+					(2, 'event two', 2452594, None, 2455369, None, 3, 'person'),
+					(3, 'event three', 1950, None, 2000, None, 0, 'event'),
+				}
+			)
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE pop (id INT PRIMARY KEY, pop INT)',
+				'INSERT INTO pop VALUES (?, ?)',
+				{
+					(1, 11),
+					(2, 21),
+					(3, 5),
+				}
+			)
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE event_imgs (id INT PRIMARY KEY, img_id INT)',
+				'INSERT INTO event_imgs VALUES (?, ?)',
+				{
+					(2, 20),
+				}
+			)
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE images (id INT PRIMARY KEY, url TEXT, license TEXT, artist TEXT, credit TEXT)',
+				'INSERT INTO images VALUES (?, ?, ?, ?, ?)',
+				{
+					(20, 'example.com/2', 'cc-by', 'artist two', 'credits two'),
+				}
+			)
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE event_disp (id INT, scale INT, unit INT, PRIMARY KEY (id, scale))',
+				'INSERT INTO event_disp VALUES (?, ?, ?)',
+				{
+					(1, 10, 190),
+					(1, 1, 1900),
+					(2, 1, 2002),
+					(3, 10, 195),
+				}
+			)
+			createTestDbTable(
+				dbFile,
+				'CREATE TABLE img_disp (id INT, scale INT, unit INT, PRIMARY KEY (id, scale))',
+				'INSERT INTO img_disp VALUES (?, ?, ?)',
+				{
+					(2, 1, 2002),
+				}
+			)
+
+			# Run
+			genData(dbFile)
+
+			# Check
+			self.assertEqual(
+				readTestDbTable(dbFile, 'SELECT * FROM disp_events'),
+				{
+					(0, 10, 190, 11, 1, 'event one', 1900, None, None, None, 0, 'event', None),
+					(0, 1, 1900, 11, 1, 'event one', 1900, None, None, None, 0, 'event', None),
+					(0, 1, 2002, 21, 2, 'event two', 2452594, None, 2455369, None, 3, 'person', 20),
+					(0, 10, 195, 5, 3, 'event three', 1950, None, 2000, None, 0, 'event', None),
+					(1, 1, 2002, 21, 2, 'event two', 2452594, None, 2455369, None, 3, 'person', 20),
+				}
+			)
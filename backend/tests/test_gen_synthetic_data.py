@@ -0,0 +1,49 @@
+import unittest
+import tempfile
+import os
+
+from tests.common import readTestDbTable
+from hist_data.gen_synthetic_data import genData, CTG_WEIGHTS
+from hist_data.cal import SCALES, MIN_CAL_YEAR, dbDateToHistDate
+
+class TestGenData(unittest.TestCase):
+	def test_gen(self):
+		with tempfile.TemporaryDirectory() as tempDir:
+			dbFile = os.path.join(tempDir, 'data.db')
+			genData(dbFile, 3000, 0)
+			# Check events
+			events = readTestDbTable(dbFile, 'SELECT * FROM events')
+			self.assertGreater(len(events), 1000)
+			self.assertEqual(len({title for _, title, *_ in events}), len(events))
+			for _, _, start, startUpper, end, endUpper, fmt, ctg in events:
+				self.assertIn(ctg, CTG_WEIGHTS)
+				if fmt == 0:
+					self.assertNotEqual(start, 0)
+				else:
+					self.assertGreaterEqual(dbDateToHistDate(start, fmt).year, MIN_CAL_YEAR)
+				if end is not None:
+					self.assertGreaterEqual(end, start)
+			# Check skew of dates and popularity
+			self.assertGreater(len([1 for event in events if event[6] != 0]), len(events) / 2)
+			pops = sorted(pop for _, pop in readTestDbTable(dbFile, 'SELECT id, pop FROM pop'))
+			self.assertEqual(len(pops), len(events))
+			self.assertGreater(pops[-1], pops[len(pops) // 2] * 100)
+			# Check display and image tables
+			self.assertEqual(
+				readTestDbTable(dbFile, 'SELECT DISTINCT scale FROM event_disp'),
+				{(scale,) for scale in SCALES})
+			self.assertEqual(readTestDbTable(dbFile, 'SELECT id FROM event_disp EXCEPT SELECT id FROM events'), set())
+			self.assertTrue(readTestDbTable(dbFile, 'SELECT id FROM img_disp'))
+			self.assertEqual(readTestDbTable(dbFile, 'SELECT id FROM img_disp EXCEPT SELECT id FROM event_imgs'), set())
+			self.assertEqual(
+				readTestDbTable(dbFile, 'SELECT img_id FROM event_imgs EXCEPT SELECT id FROM images'), set())
+			self.assertTrue(readTestDbTable(dbFile, 'SELECT * FROM descs'))
+
+	def test_seed(self):
+		with tempfile.TemporaryDirectory() as tempDir:
+			dbFile1 = os.path.join(tempDir, 'data1.db')
+			dbFile2 = os.path.join(tempDir, 'data2.db')
+			genData(dbFile1, 200, 1)
+			genData(dbFile2, 200, 1)
+			query = 'SELECT * FROM events'
+			self.assertEqual(readTestDbTable(dbFile1, query), readTestDbTable(dbFile2, query))
@@ -0,0 +1,213 @@
+"""
+Checks that the queries used to serve requests are answered via indexes.
+
+For each query shape in chrona.py, the queries it executes are recorded,
+and 'EXPLAIN QUERY PLAN' output is checked for full table scans and temporary b-trees.
+"""
+
+from typing import Any
+import unittest
+from unittest.mock import patch
+import tempfile
+import os
+import shutil
+import sqlite3
+
+from PIL import Image
+
+from tests.common import createTestDbTable
+from hist_data.gen_disp_data import genData as genDispData
+from hist_data.gen_search_data import genData as genSearchData
+from hist_data.gen_serving_data import genData as genServingData
+from hist_data.gen_imgs import genAtlases, IMG_OUT_SZ
+from hist_data.cal import HistDate, MONTH_SCALE, DAY_SCALE
+import chrona
+
+# Plan entries that are accepted for a query shape, with the reason why
+ALLOWED_POP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+	# Ordering by popularity can't use an index that also narrows by scale+unit or title.
+	# Since each query has a LIMIT, sqlite keeps only the top rows while sorting.
+ALLOWED_SUBSTRING_SCAN = 'SCAN events'
+	# Substring search for strings too short to have trigrams can only scan titles
+
+class RecordingCursor:
+	""" Wraps a db cursor, recording executed queries """
+	def __init__(self, dbCur: sqlite3.Cursor):
+		self.dbCur = dbCur
+		self.connection = dbCur.connection
+		self.queries: list[tuple[str, Any]] = []
+
+	def execute(self, query: str, params: Any = ()) -> sqlite3.Cursor:
+		self.queries.append((query, params))
+		return self.dbCur.execute(query, params)
+
+def initTestDb(dbFile: str) -> None:
+	""" Creates a small db using the same schema-creation steps as the build scripts """
+	createTestDbTable(
+		dbFile,
+		'CREATE TABLE events (id INT PRIMARY KEY, title TEXT UNIQUE, ' \
+			'start INT, start_upper INT, end INT, end_upper INT, fmt INT, ctg TEXT)',
+		'INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+		{
+			(1, 'event one', 1900, None, None, None, 0, 'event'),
+			(2, 'event two', 2452594, None, 2455369, None, 3, 'person'),
+			(3, 'event three', 2448175, 2451828, None, None, 1, 'discovery'),
+			(4, 'event four', 991206, None, 1721706, None, 2, 'event'),
+			(5, 'event five', 2000, None, 2001, None, 0, 'event'),
+			(6, 'event six', 1900, None, 2000, None, 0, 'event'),
+		}
+	)
+	createTestDbTable(
+		dbFile,
+		'CREATE TABLE pop (id INT PRIMARY KEY, pop INT)',
+		'INSERT INTO pop VALUES (?, ?)',
+		{(1, 11), (2, 21), (3, 0), (4, 1000), (5, 51), (6, 60)}
+	)
+	createTestDbTable(
+		dbFile,
+		'CREATE TABLE event_imgs (id INT PRIMARY KEY, img_id INT)',
+		'INSERT INTO event_imgs VALUES (?, ?)',
+		{(1, 10), (2, 20), (4, 20)}
+	)
+	createTestDbTable(
+		dbFile,
+		'CREATE TABLE images (id INT PRIMARY KEY, url TEXT, license TEXT, artist TEXT, credit TEXT)',
+		'INSERT INTO images VALUES (?, ?, ?, ?, ?)',
+		{(10, 'example.com/1', 'cc0', 'artist one', 'credits one'),
+			(20, 'example.com/2', 'cc-by', 'artist two', 'credits two')}
+	)
+	createTestDbTable(
+		dbFile,
+		'CREATE TABLE descs (id INT PRIMARY KEY, wiki_id INT, desc TEXT)',
+		'INSERT INTO descs VALUES (?, ?, ?)',
+		{(1, 100, 'desc one'), (2, 200, 'desc two')}
+	)
+	# Add indexes created by gen_events_data.py and gen_pop_data.py
+	dbCon = sqlite3.connect(dbFile)
+	dbCon.execute('CREATE INDEX events_id_start_idx ON events(id, start)')
+	dbCon.execute('CREATE INDEX events_title_nocase_idx ON events(title COLLATE NOCASE)')
+	dbCon.execute('CREATE INDEX pop_idx ON pop(pop)')
+	dbCon.commit()
+	dbCon.close()
+	# Add remaining tables
+	scales = [10, 1, MONTH_SCALE, DAY_SCALE]
+	genDispData(dbFile, scales, 2, False)
+	genDispData(dbFile, scales, 2, True)
+	genSearchData(dbFile)
+	imgDir = os.path.join(os.path.dirname(dbFile), 'img')
+	os.mkdir(imgDir)
+	for imgId in [10, 20]:
+		Image.new('RGB', (IMG_OUT_SZ, IMG_OUT_SZ)).save(os.path.join(imgDir, f'{imgId}.jpg'))
+	genAtlases(imgDir, dbFile)
+
+class TestQueryPlans(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.tempDir = tempfile.TemporaryDirectory()
+		cls.dbFile = os.path.join(cls.tempDir.name, 'data.db')
+		initTestDb(cls.dbFile)
+		cls.servingDbFile = os.path.join(cls.tempDir.name, 'serving.db')
+		shutil.copyfile(cls.dbFile, cls.servingDbFile)
+		genServingData(cls.servingDbFile)
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.tempDir.cleanup()
+
+	def setUp(self):
+		self.dbCon = sqlite3.connect(self.dbFile)
+		self.dbCur = RecordingCursor(self.dbCon.cursor())
+
+	def tearDown(self):
+		self.dbCon.close()
+
+	def useServingDb(self):
+		self.dbCon.close()
+		self.dbCon = sqlite3.connect(self.servingDbFile)
+		self.dbCur = RecordingCursor(self.dbCon.cursor())
+
+	def checkPlans(self, allowed: set[str] = set()):
+		""" Checks the plans of recorded queries, then clears them """
+		self.assertTrue(self.dbCur.queries)
+		for query, params in self.dbCur.queries:
+			if query.startswith('SELECT name FROM sqlite_master'):
+				continue
+			for row in self.dbCon.execute('EXPLAIN QUERY PLAN ' + query, params):
+				detail: str = row[3]
+				if detail in allowed:
+					continue
+				with self.subTest(query=query):
+					if ' VIRTUAL TABLE INDEX ' in detail:
+						# An FTS5 plan with an empty index string reads the whole table
+						self.assertFalse(detail.endswith(':'), detail)
+					else:
+						self.assertFalse(detail.startswith('SCAN '), detail)
+						self.assertNotIn('TEMP B-TREE', detail)
+		self.dbCur.queries.clear()
+
+	def test_events(self):
+		windows = [
+			(HistDate(True, 1900, 1, 1), HistDate(True, 1901, 1, 1)), # Single unit
+			(HistDate(True, 1900, 1, 1), HistDate(True, 2010, 1, 1)),
+			(HistDate(True, 1900, 1, 1), None),
+			(None, None),
+		]
+		for imgonly in [False, True]:
+			for ctgs in [None, ['event', 'person']]:
+				for start, end in windows:
+					chrona.lookupEvents(start, end, 1, 3, 100, ctgs, imgonly, self.dbCur)
+					self.checkPlans({ALLOWED_POP_SORT})
+
+	def test_events_with_serving_table(self):
+		self.useServingDb()
+		for imgonly in [False, True]:
+			for ctgs in [None, ['event', 'person']]:
+				chrona.lookupEvents( # Single unit
+					HistDate(True, 1900, 1, 1), HistDate(True, 1901, 1, 1), 1, 3, 100, ctgs, imgonly, self.dbCur)
+				self.assertTrue(any('FROM disp_events' in query for query, _ in self.dbCur.queries))
+				self.checkPlans()
+				chrona.lookupEvents(
+					HistDate(True, 1900, 1, 1), HistDate(True, 2010, 1, 1), 1, 3, 100, ctgs, imgonly, self.dbCur)
+				self.checkPlans({ALLOWED_POP_SORT})
+
+	def test_unit_counts(self):
+		for imgonly in [False, True]:
+			for start, end in [(HistDate(True, 1900, 1, 1), HistDate(True, 2010, 1, 1)), (None, None)]:
+				chrona.lookupUnitCounts(start, end, 1, imgonly, self.dbCur)
+				self.checkPlans()
+				with patch('chrona.MAX_REQ_UNIT_COUNTS', 2): # Test bucketing
+					chrona.lookupUnitCounts(start, end, 1, imgonly, self.dbCur)
+				numSumLookups = sum(1 for query, _ in self.dbCur.queries if 'cumul_count' in query)
+				self.assertLessEqual(numSumLookups, 3) # At most MAX_REQ_UNIT_COUNTS + 1
+				self.checkPlans()
+
+	def test_count(self):
+		for imgonly in [False, True]:
+			for ctgs in [None, ['event', 'person']]:
+				chrona.lookupCount(HistDate(True, 1900, 1, 1), None, 1, ctgs, imgonly, self.dbCur)
+				self.checkPlans()
+
+	def test_info(self):
+		for imgonly in [False, True]:
+			chrona.lookupEventInfo('event one', None, imgonly, self.dbCur)
+			self.checkPlans()
+
+	def test_sugg(self):
+		for imgonly in [False, True]:
+			for ctgs in [None, ['event']]:
+				chrona.lookupSuggs('event', 10, ctgs, imgonly, self.dbCur) # Prefix and trigram search
+				self.checkPlans({ALLOWED_POP_SORT})
+				chrona.lookupSuggs('ne', 10, ctgs, imgonly, self.dbCur) # Short substring search
+				self.checkPlans({ALLOWED_POP_SORT, ALLOWED_SUBSTRING_SCAN})
+
+	def test_sugg_trigram_order(self):
+		# Check that trigram search reads matches in order of popularity, instead of sorting them all
+		for imgonly in [False, True]:
+			for ctgs in [None, ['event']]:
+				chrona.lookupSuggs('vent', 10, ctgs, imgonly, self.dbCur)
+				ftsQueries = [(query, params) for query, params in self.dbCur.queries if 'events_fts' in query]
+				self.assertTrue(ftsQueries)
+				for query, params in ftsQueries:
+					details = [row[3] for row in self.dbCon.execute('EXPLAIN QUERY PLAN ' + query, params)]
+					self.assertFalse(any('TEMP B-TREE' in detail for detail in details), details)
+				self.dbCur.queries.clear()
@@ -212,10 +212,12 @@ export class HistEvent {
 	ctg: string;
 	imgId: number;
 	pop: number;
+	atlas: [string, number, number] | null; // Atlas name, and pixel position of the image within the atlas
 
 	constructor(
 			id: number, title: string, start: HistDate, startUpper: HistDate | null = null,
-			end: HistDate | null = null, endUpper: HistDate | null = null, ctg='', imgId=0, pop=0){
+			end: HistDate | null = null, endUpper: HistDate | null = null, ctg='', imgId=0, pop=0,
+			atlas: [string, number, number] | null = null){
 		this.id = id;
 		this.title = title;
 		this.start = start;
@@ -225,6 +227,7 @@ export class HistEvent {
 		this.ctg = ctg;
 		this.imgId = imgId;
 		this.pop = pop;
+		this.atlas = atlas;
 	}
 }
 
@@ -416,8 +419,21 @@ export async function queryServer(params: URLSearchParams, serverDataUrl=SERVER_
 	return responseObj;
 }
 
-export function getImagePath(imgId: number): string {
-	return SERVER_IMG_PATH + String(imgId) + '.jpg';
+export function getImagePath(imgId: number, sz: number | null = null): string {
+	// If 'sz' is given, the server picks an image variant for that displayed width (accounting for high-DPI screens)
+	let path = SERVER_IMG_PATH + String(imgId) + '.jpg';
+	if (sz != null){
+		path += '?size=' + String(Math.ceil(sz * window.devicePixelRatio));
+	}
+	return path;
+}
+
+// (Same as in backend/hist_data/gen_imgs.py)
+export const ATLAS_COLS = 8; // Number of images in each row of an atlas
+export const ATLAS_IMG_SZ = 200; // Pixel width and height of each image in an atlas
+
+export function getAtlasPath(atlasName: string): string {
+	return SERVER_IMG_PATH + 'atlas/' + atlasName + '.jpg';
 }
 
 // ========== For server responses ==========
@@ -439,11 +455,13 @@ export type HistEventJson = {
 	ctg: string,
 	imgId: number,
 	pop: number,
+	atlas?: [string, number, number] | null,
 }
 
 export type EventResponseJson = {
 	events: HistEventJson[],
-	unitCounts: {[x: number]: number} | null,
+	unitCounts: {[x: number]: number},
+	unitCountsWidth: number, // If more than 1, unitCounts holds sums over this many units
 }
 
 export type EventInfoJson = {
@@ -480,6 +498,7 @@ export function jsonToHistEvent(json: HistEventJson): HistEvent {
 		json.ctg,
 		json.imgId,
 		json.pop,
+		json.atlas ?? null,
 	);
 }
 